@@ -0,0 +1,383 @@
+"""Local stand-in for the CDF API, synthesizing datapoints and storing created resources in memory.
+
+Raw datapoints of every time series are at multiples of `spacing` milliseconds with value `timestamp / 1000`, so
+aggregates can be computed without generating the underlying points. Resources (assets, events, time series, ...)
+created through the server are kept, so creating a duplicate external id fails with 409 like the real API, which is
+what `upsert` relies on, and can be retrieved by id. Datapoints can be inserted by id into any time series, or by external id
+into time series created through the server, and are only counted in `inserted`.
+"""
+
+import collections
+import gzip
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from cognite.client.utils._time import granularity_to_ms
+
+
+class MockConfig:
+    """Behaviour of the mock server.
+
+    Args:
+        latency (float): Seconds added to every request.
+        jitter (float): Maximum random extra seconds added to every request.
+        throttle_rate (float): Fraction of requests answered with 429.
+        dps_limit (int): Maximum number of raw datapoints per item and request.
+        dps_limit_agg (int): Maximum number of aggregate datapoints per item and request.
+        spacing (int): Milliseconds between raw datapoints.
+        sparse_spacing (int): Milliseconds between raw datapoints of series whose id is divisible by `sparse_every`.
+        sparse_every (int): Which series are sparse, 0 for none.
+        seed (int): Seed for the latency jitter and throttling.
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        jitter=0.0,
+        throttle_rate=0.0,
+        dps_limit=100000,
+        dps_limit_agg=10000,
+        spacing=1000,
+        sparse_spacing=3600 * 1000,
+        sparse_every=0,
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.dps_limit = dps_limit
+        self.dps_limit_agg = dps_limit_agg
+        self.spacing = spacing
+        self.sparse_spacing = sparse_spacing
+        self.sparse_every = sparse_every
+        self.seed = seed
+
+
+class MockCDF:
+    """The state and request handling of the mock server, independent of HTTP."""
+
+    def __init__(self, config=None):
+        self.config = config or MockConfig()
+        self.resources = {}  # resource type -> external id or id -> item
+        self.inserted = {}  # id or external id -> number of datapoints inserted
+        self.next_id = 1
+        self.lock = threading.Lock()
+        self.random = random.Random(self.config.seed)
+
+    def handle(self, method, path, body):
+        """Returns (status, json response) for a request to `path` below /api/v1/projects/<project>."""
+        with self.lock:
+            delay = self.config.latency + self.config.jitter * self.random.random()
+            throttled = self.random.random() < self.config.throttle_rate
+        time.sleep(delay)
+        if throttled:
+            return 429, _error(429, "Too many requests")
+        parts = path.strip("/").split("/")
+        if method == "POST" and parts[-2:] == ["data", "list"]:
+            return self.datapoints(body)
+        if method == "POST" and parts[-2:] == ["data", "latest"]:
+            return self.latest(body["items"], body.get("ignoreUnknownIds", False))
+        if method == "POST" and parts == ["timeseries", "data"]:
+            return self.insert_datapoints(body["items"])
+        if method == "POST" and len(parts) == 1:
+            return self.create(parts[0], body["items"])
+        if method == "POST" and len(parts) == 2 and parts[1] == "update":
+            return self.update(parts[0], body["items"])
+        if method == "POST" and len(parts) == 2 and parts[1] == "list":
+            return self.list(parts[0], body)
+        if method == "POST" and len(parts) == 2 and parts[1] == "byids":
+            return self.byids(
+                parts[0], body["items"], body.get("ignoreUnknownIds", False), body.get("aggregatedProperties")
+            )
+        return 404, _error(404, "Unknown path {} {}".format(method, path))
+
+    def spacing(self, series_id):
+        sparse = self.config.sparse_every and series_id % self.config.sparse_every == 0
+        return self.config.sparse_spacing if sparse else self.config.spacing
+
+    def datapoints(self, body):
+        items = []
+        defaults = {k: v for k, v in body.items() if k != "items"}  # fields given for all items
+        for item in body["items"]:
+            query = {**defaults, **{k: v for k, v in item.items() if v is not None}}
+            if query.get("id") is not None:
+                series_id, external_id = query["id"], "ts_{}".format(query["id"])
+            else:
+                series_id, external_id = zlib.crc32(query["externalId"].encode()), query["externalId"]
+            aggregates = query.get("aggregates")
+            max_limit = self.config.dps_limit_agg if aggregates else self.config.dps_limit
+            limit = query.get("limit") or 100
+            if limit > max_limit:
+                return 400, _error(400, "limit must be at most {}".format(max_limit))
+            spacing = self.spacing(series_id)
+            start, end = query.get("start", 0), query.get("end", int(time.time() * 1000))
+            if aggregates:
+                dps = self.aggregates(spacing, start, end, aggregates, granularity_to_ms(query["granularity"]), limit)
+            else:
+                dps = self.raw(spacing, start, end, limit, query.get("includeOutsidePoints"))
+            items.append(
+                {"id": series_id, "externalId": external_id, "isString": False, "isStep": False, "datapoints": dps}
+            )
+        return 200, {"items": items}
+
+    def latest(self, items, ignore_unknown_ids):
+        """Latest raw datapoint of each series before `before`, by default now. Series with negative ids do not exist."""
+        unknown = [{"id": item["id"]} for item in items if item.get("id") is not None and item["id"] < 0]
+        if unknown and not ignore_unknown_ids:
+            return 400, _error(400, "Time series not found", missing=unknown)
+        now = int(time.time() * 1000)
+        result = []
+        for item in items:
+            if item.get("id") is not None:
+                if item["id"] < 0:
+                    continue
+                series_id, external_id = item["id"], "ts_{}".format(item["id"])
+            else:
+                series_id, external_id = zlib.crc32(item["externalId"].encode()), item["externalId"]
+            before = item.get("before", now)
+            latest = (before - 1) // self.spacing(series_id) * self.spacing(series_id)
+            dps = [{"timestamp": latest, "value": latest / 1000}] if before > 0 else []
+            result.append(
+                {"id": series_id, "externalId": external_id, "isString": False, "isStep": False, "datapoints": dps}
+            )
+        return 200, {"items": result}
+
+    def insert_datapoints(self, items):
+        if len(items) > 10000 or sum(len(item["datapoints"]) for item in items) > self.config.dps_limit:
+            return 400, _error(400, "Too many items or datapoints in request")
+        with self.lock:
+            stored = self.resources.setdefault("timeseries", {})
+            missing = [
+                {"externalId": it["externalId"]}
+                for it in items
+                if "externalId" in it and it["externalId"] not in stored
+            ]
+            if missing:
+                return 400, _error(400, "Time series not found", missing=missing)
+            for item in items:
+                key = item.get("externalId", item.get("id"))
+                self.inserted[key] = self.inserted.get(key, 0) + len(item["datapoints"])
+        return 200, {}
+
+    @staticmethod
+    def raw(spacing, start, end, limit, include_outside_points):
+        first = -(-max(start, 0) // spacing) * spacing
+        n = min(limit, max(math.ceil((end - first) / spacing), 0))
+        timestamps = (first + spacing * np.arange(n)).tolist()
+        if include_outside_points:
+            if first - spacing >= 0:
+                timestamps.insert(0, first - spacing)
+            timestamps.append(-(-end // spacing) * spacing)
+        return [{"timestamp": t, "value": t / 1000} for t in timestamps]
+
+    @staticmethod
+    def aggregates(spacing, start, end, aggregates, granularity, limit):
+        bucket = start + granularity * np.arange(min(limit, math.ceil((end - start) / granularity)))
+        lo = np.maximum(np.maximum(bucket, start), 0)
+        hi = np.minimum(bucket + granularity, end)
+        first = -(-lo // spacing) * spacing
+        last = -(-hi // spacing) * spacing - spacing
+        count = np.maximum((last - first) // spacing + 1, 0)
+        keep = count > 0
+        bucket, first, last, count = bucket[keep], first[keep], last[keep], count[keep]
+        values = {
+            "count": count,
+            "average": (first + last) / 2000,
+            "min": first / 1000,
+            "max": last / 1000,
+            "sum": count * (first + last) / 2000,
+            "interpolation": bucket / 1000,
+            "stepInterpolation": (bucket // spacing * spacing) / 1000,
+        }
+        columns = {agg: values.get(agg, values["average"]).tolist() for agg in aggregates}
+        return [
+            {"timestamp": t, **{agg: column[i] for agg, column in columns.items()}}
+            for i, t in enumerate(bucket.tolist())
+        ]
+
+    def create(self, resource_type, items):
+        with self.lock:
+            stored = self.resources.setdefault(resource_type, {})
+            duplicated = [{"externalId": it["externalId"]} for it in items if it.get("externalId") in stored]
+            if duplicated:
+                return 409, _error(409, "Duplicated external ids", duplicated=duplicated)
+            created = []
+            for item in items:
+                now = int(time.time() * 1000)
+                item = {**item, "id": self.next_id, "createdTime": now, "lastUpdatedTime": now}
+                if "parentExternalId" in item:  # like the API, only the resolved parent id is returned
+                    item["parentId"] = stored[item.pop("parentExternalId")]["id"]
+                self.next_id += 1
+                stored[item.get("externalId", item["id"])] = item
+                created.append(item)
+        return 201, {"items": created}
+
+    def list(self, resource_type, body):
+        """Lists by equality filters on top level fields and metadata, with cursors as offsets into the items of the
+        partition ("i/n" takes every n-th item, by id)."""
+        filter = body.get("filter") or {}
+        with self.lock:
+            items = sorted(self.resources.get(resource_type, {}).values(), key=lambda item: item["id"])
+        if body.get("partition"):
+            i, n = map(int, body["partition"].split("/"))
+            items = items[i - 1 :: n]
+        parent_ids = set(filter.get("parentIds") or [])
+        items = [
+            item
+            for item in items
+            if all(item.get("metadata", {}).get(k) == v for k, v in filter.get("metadata", {}).items())
+            and all(item.get(k) == v for k, v in filter.items() if k not in ["metadata", "parentIds"])
+            and (not parent_ids or item.get("parentId") in parent_ids)
+        ]
+        offset = int(body.get("cursor") or 0)
+        end = offset + min(body.get("limit") or 100, 1000)
+        next_cursor = str(end) if end < len(items) else None
+        items = self.with_aggregates(resource_type, items[offset:end], body.get("aggregatedProperties"))
+        return 200, {"items": items, "nextCursor": next_cursor}
+
+    def with_aggregates(self, resource_type, items, aggregated_properties):
+        if not aggregated_properties or "childCount" not in aggregated_properties:
+            return items
+        with self.lock:
+            child_count = collections.Counter(item.get("parentId") for item in self.resources[resource_type].values())
+        return [{**item, "aggregates": {"childCount": child_count[item["id"]]}} for item in items]
+
+    def byids(self, resource_type, identifiers, ignore_unknown_ids, aggregated_properties=None):
+        with self.lock:
+            stored = self.resources.setdefault(resource_type, {})
+            by_id = {item["id"]: item for item in stored.values()}
+            found = [stored.get(ident.get("externalId")) or by_id.get(ident.get("id")) for ident in identifiers]
+        if not ignore_unknown_ids and None in found:
+            missing = [ident for ident, item in zip(identifiers, found) if item is None]
+            return 400, _error(400, "Not found", missing=missing)
+        found = [dict(item) for item in found if item is not None]
+        return 200, {"items": self.with_aggregates(resource_type, found, aggregated_properties)}
+
+    def update(self, resource_type, items):
+        with self.lock:
+            stored = self.resources.setdefault(resource_type, {})
+            by_id = {item["id"]: item for item in stored.values()}
+            updated = []
+            for patch in items:
+                item = stored.get(patch.get("externalId")) or by_id.get(patch.get("id"))
+                if item is None:
+                    return 400, _error(400, "Not found", missing=[{k: v for k, v in patch.items() if k != "update"}])
+                item.update({field: change["set"] for field, change in patch["update"].items() if "set" in change})
+                item["lastUpdatedTime"] = int(time.time() * 1000)
+                updated.append(item)
+        return 200, {"items": updated}
+
+
+def _error(code, message, **extra):
+    return {"error": {"code": code, "message": message, **extra}}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        self._handle("POST", json.loads(body) if body else {})
+
+    def do_GET(self):
+        self._handle("GET", {})
+
+    def _handle(self, method, body):
+        try:
+            self._respond(*self.server.cdf.handle(method, self._path(), body))
+        except Exception as e:
+            self._respond(500, _error(500, "{}: {}".format(type(e).__name__, e)))
+
+    def _path(self):
+        path = self.path.split("?")[0]
+        prefix = path.split("/projects/", 1)
+        return "/" + prefix[1].split("/", 1)[1] if len(prefix) == 2 else path
+
+    def _respond(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("X-Request-Id", str(id(payload)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(config=None, port=0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    server.cdf = MockCDF(config)
+    return server
+
+
+def _serve(config, port_queue):
+    server = make_server(config)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class MockServer:
+    """Runs the mock CDF server, by default in a separate process so it does not share memory or the GIL with the
+    client being measured. Use as a context manager, and point a client at `base_url`.
+
+    Args:
+        config (MockConfig): Behaviour of the server.
+        separate_process (bool): Run in a separate process instead of a thread of this one.
+    """
+
+    def __init__(self, config=None, separate_process=True):
+        self.config = config or MockConfig()
+        self.separate_process = separate_process
+        self.port = None
+        self._process = None
+        self._server = None
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}".format(self.port)
+
+    @property
+    def cdf(self):
+        """The MockCDF state of a server running in this process."""
+        if self._server is None:
+            raise RuntimeError("the state of a server in a separate process is not accessible")
+        return self._server.cdf
+
+    def start(self):
+        if self.separate_process:
+            port_queue = multiprocessing.Queue()
+            self._process = multiprocessing.Process(target=_serve, args=(self.config, port_queue), daemon=True)
+            self._process.start()
+            self.port = port_queue.get(timeout=30)
+        else:
+            self._server = make_server(self.config)
+            self.port = self._server.server_address[1]
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,214 @@
+"""Benchmarks of the async extensions against the local mock CDF server.
+
+Usage: python -m benchmarks.run [--engine asyncio] [--latency 0.05] [--throttle-rate 0.01] [--json] ...
+
+Each scenario reports the wall time, throughput in datapoints or items per second, percentiles of the running time of
+jobs doing requests, the number of requests, and the peak memory traced while running it (measured in a second run, as
+tracing slows things down).
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.mock_server import MockConfig, MockServer
+from cognite.async_client import CogniteClient, DatapointsDecoder
+from cognite.client.data_classes import Asset, TimeSeries
+
+DAY = 24 * 3600 * 1000
+
+
+def make_client(base_url, args):
+    client = CogniteClient(
+        base_url=base_url,
+        project="benchmark",
+        api_key="benchmark",
+        client_name="cognite-async-benchmark",
+        engine=args.engine,
+        max_workers_async=args.workers,
+        adaptive_concurrency=args.adaptive,
+        datapoints_decoder=DatapointsDecoder(args.decode_processes) if args.decode_processes else None,
+    )
+    client.datapoints._DPS_LIMIT = args.dps_limit
+    client.datapoints._DPS_LIMIT_AGG = args.dps_limit_agg
+    return client
+
+
+def retrieve_raw(client, args):
+    ids = list(range(1, args.series + 1))
+    result = client.datapoints.retrieve_async(id=ids, start=0, end=args.days * DAY).result
+    return sum(len(dps) for dps in result)
+
+
+def retrieve_aggregates(client, args):
+    ids = list(range(1, args.series + 1))
+    result = client.datapoints.retrieve_async(
+        id=ids, start=0, end=args.days * DAY, aggregates=["average", "count"], granularity="1m"
+    ).result
+    return sum(len(dps) for dps in result)
+
+
+def retrieve_dataframe(client, args):
+    ids = list(range(1, args.series + 1))
+    df = client.datapoints.retrieve_dataframe_async(
+        id=ids, start=0, end=args.days * DAY, aggregates=["average"], granularity="1m"
+    ).result
+    return int(df.notna().values.sum())
+
+
+def count(client, args):
+    jobs = [
+        client.datapoints.count(TimeSeries(id=i, is_string=False), start=0, end=args.days * DAY)
+        for i in range(1, args.series + 1)
+    ]
+    return sum(job.result for job in jobs)
+
+
+def create(client, args):
+    assets = [Asset(external_id="create-{}-{}".format(time.time(), i), name=str(i)) for i in range(args.items)]
+    return len(client.assets.create_async(assets).result)
+
+
+def upsert(client, args):
+    prefix = "upsert-{}-".format(time.time())
+    client.assets.create_async([Asset(external_id=prefix + str(i), name="old") for i in range(0, args.items, 2)]).result
+    result = client.assets.upsert([Asset(external_id=prefix + str(i), name="new") for i in range(args.items)])
+    return len(result["created"]) + len(result["updated"])
+
+
+def upsert_lookup(client, args):
+    prefix = "upsert-lookup-{}-".format(time.time())
+    client.assets.create_async([Asset(external_id=prefix + str(i), name="old") for i in range(0, args.items, 2)]).result
+    result = client.assets.upsert(
+        [Asset(external_id=prefix + str(i), name="new") for i in range(args.items)], lookup=True
+    )
+    return len(result["created"]) + len(result["updated"])
+
+
+def insert(client, args):
+    timestamps = pd.date_range(0, periods=int(args.days * 1440), freq="1min")
+    df = pd.DataFrame({i: np.arange(len(timestamps), dtype=float) for i in range(1, args.series + 1)}, index=timestamps)
+    client.datapoints.insert_dataframe_async(df).result
+    return df.size
+
+
+def list_assets(client, args):
+    return len(client.assets.list_async().result)
+
+
+SCENARIOS = {
+    "retrieve_raw": (retrieve_raw, "datapoints"),
+    "retrieve_aggregates": (retrieve_aggregates, "datapoints"),
+    "retrieve_dataframe": (retrieve_dataframe, "datapoints"),
+    "count": (count, "datapoints"),
+    "insert": (insert, "datapoints"),
+    "create": (create, "items"),
+    "upsert": (upsert, "items"),
+    "upsert_lookup": (upsert_lookup, "items"),
+    "list": (list_assets, "items"),
+}
+
+
+def run_scenario(name, client, args, measure_memory=True):
+    """Runs one scenario, and returns a dict of its measurements."""
+    scenario, unit = SCENARIOS[name]
+    runs = []
+    hook = lambda job, run: runs.append(run) if run["requests"] else None
+    client.job_queue.add_hook(hook)
+    try:
+        t0 = time.perf_counter()
+        n = scenario(client, args)
+        seconds = time.perf_counter() - t0
+    finally:
+        client.job_queue.metrics.hooks.remove(hook)
+    latencies = np.array([run["time_running"] for run in runs]) * 1000
+    result = {
+        "scenario": name,
+        unit: n,
+        "seconds": seconds,
+        "{}_per_second".format(unit): n / seconds,
+        "requests": sum(run["requests"] for run in runs),
+        "bytes_received": sum(run["bytes_received"] for run in runs),
+    }
+    for p in [50, 90, 99]:
+        result["p{}_ms".format(p)] = float(np.percentile(latencies, p)) if len(latencies) else None
+    if measure_memory:
+        tracemalloc.start()
+        try:
+            scenario(client, args)
+            result["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def format_table(results):
+    columns = ["scenario", "seconds", "throughput", "requests", "p50_ms", "p90_ms", "p99_ms", "peak_memory_mb"]
+    rows = []
+    for r in results:
+        throughput = r.get("datapoints_per_second", r.get("items_per_second"))
+        values = {**r, "throughput": throughput}
+        rows.append(
+            [
+                "{:.3f}".format(values[c]) if isinstance(values.get(c), float) else str(values.get(c, "-"))
+                for c in columns
+            ]
+        )
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines += ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--engine", default="threads", choices=["threads", "asyncio"])
+    parser.add_argument("--workers", type=int, default=None, help="max_workers_async of the client")
+    parser.add_argument("--adaptive", action="store_true", help="use adaptive_concurrency")
+    parser.add_argument("--decode-processes", type=int, default=0, help="decode datapoints in this many processes")
+    parser.add_argument("--series", type=int, default=20, help="number of time series to retrieve")
+    parser.add_argument("--days", type=float, default=7, help="length of the retrieved range")
+    parser.add_argument("--items", type=int, default=5000, help="number of assets to create or upsert")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to each request")
+    parser.add_argument("--jitter", type=float, default=0.01, help="maximum random seconds added to each request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--spacing", type=int, default=10000, help="milliseconds between raw datapoints")
+    parser.add_argument("--sparse-every", type=int, default=0, help="every n-th series has hourly datapoints")
+    parser.add_argument("--dps-limit", type=int, default=100000, help="raw datapoints per request")
+    parser.add_argument("--dps-limit-agg", type=int, default=10000, help="aggregate datapoints per request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run measuring peak memory")
+    parser.add_argument("--json", action="store_true", help="print results as json")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = MockConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        throttle_rate=args.throttle_rate,
+        dps_limit=args.dps_limit,
+        dps_limit_agg=args.dps_limit_agg,
+        spacing=args.spacing,
+        sparse_every=args.sparse_every,
+        seed=args.seed,
+    )
+    with MockServer(config) as server:
+        client = make_client(server.base_url, args)
+        results = [run_scenario(name, client, args, measure_memory=not args.no_memory) for name in args.scenarios]
+    if args.json:
+        json.dump({"args": vars(args), "results": results}, sys.stdout, indent=2)
+        print()
+    else:
+        print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,13 @@
 from cognite.async_client._cognite_client import CogniteClient
+from cognite.async_client.cache import (
+    DatapointsCache,
+    DatapointsCheckpoint,
+    DatapointsCountCache,
+    LatestDatapointsCache,
+)
+from cognite.async_client.coalesce import DatapointsCoalescer
 from cognite.async_client.data_classes import *
+from cognite.async_client.decode import DatapointsDecoder
 from cognite.async_client.exceptions import *
+from cognite.async_client.memory import MemoryBudget
+from cognite.async_client.retry import RetryPolicy
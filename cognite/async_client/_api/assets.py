@@ -1,3 +1,6 @@
+from typing import *
+
+from cognite.async_client.concurrency import AssetSubtreeJob
 from cognite.async_client.utils import extends_class
 from cognite.client._api.assets import AssetsAPI
 
@@ -6,4 +9,23 @@ from cognite.client._api.assets import AssetsAPI
 class AssetsAPIExtensions:
     """Extensions to AssetsAPI"""
 
-    pass
+    def retrieve_subtree_async(
+        self,
+        id: Union[int, List[int]] = None,
+        external_id: Union[str, List[str]] = None,
+        depth: int = None,
+    ) -> "Future":
+        """Asynchronous retrieval of the asset hierarchies below one or more assets.
+
+        Levels are retrieved one after another, with the children of each level listed in parallel batches of parent ids.
+
+        Args:
+            id (Union[int, List[int]]): Id or list of ids of the root assets.
+            external_id (Union[str, List[str]]): External id or list of external ids of the root assets.
+            depth (int): Number of levels below the roots to retrieve, None for all.
+
+        Returns:
+            A Job object whose `result` property waits for and returns an AssetTree, a compact array-backed index of the hierarchy with fast `children`, `ancestors` and `descendants` lookups and `to_pandas`.
+        """
+        identifiers = self._process_ids(id, external_id, wrap_ids=True)
+        return self._cognite_client.submit_job(AssetSubtreeJob(identifiers, self, depth=depth))
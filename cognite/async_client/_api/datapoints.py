@@ -8,10 +8,22 @@ from typing import *
 import numpy as np
 import pandas as pd
 
-from cognite.async_client.concurrency import CountDatapointsJob, DatapointsListJob
+from cognite.async_client.cache import DatapointsCheckpoint
+from cognite.async_client.concurrency import (
+    CountDatapointsListJob,
+    DatapointsJob,
+    DatapointsListJob,
+    DatapointsStream,
+    InsertDatapointsJob,
+    LatestDatapointsJob,
+)
+from cognite.async_client.synthetic import Expression, SyntheticDatapointsStream
 from cognite.async_client.utils import extends_class, to_list
-from cognite.client._api.datapoints import DatapointsAPI, DatapointsFetcher
-from cognite.client.data_classes import TimeSeries
+from cognite.client._api.datapoints import DatapointsAPI, DatapointsFetcher, DatapointsPoster
+from cognite.client.data_classes import Datapoints, TimeSeries
+from cognite.client.utils import timestamp_to_ms
+from cognite.client.utils._auxiliary import assert_exactly_one_of_id_or_external_id
+from cognite.client.utils._time import granularity_to_ms
 
 
 @extends_class(extends=DatapointsAPI)
@@ -27,9 +39,15 @@ class DataPointsAPIExtensions:
         aggregates: Union[str, List[str]] = None,
         granularity: str = None,
         include_outside_points: bool = None,
+        plan_splits: bool = False,
     ) -> "Future":
         """Asynchronous datapoints retrieval.
 
+        When the client has a `datapoints_cache`, only the parts of the range it does not cover are retrieved. Queries with include_outside_points do not use the cache.
+
+        Args:
+            plan_splits (bool): For raw datapoints, first retrieve count aggregates and split each time series into ranges of about one page of datapoints, which are then retrieved in parallel. Costs an extra request per time series, but avoids serial pagination through dense regions.
+
         Returns:
             A Job object whose `result` property waits for and returns a DatapointsList with the requested datapoints.
         """
@@ -41,7 +59,116 @@ class DataPointsAPIExtensions:
             "granularity": granularity,
             "includeOutsidePoints": include_outside_points,
         }
-        return self._cognite_client.submit_job(DatapointsListJob([{**base, **item} for item in items], self))
+        return self._cognite_client.submit_job(
+            DatapointsListJob(
+                [{**base, **item} for item in items],
+                self,
+                plan_splits=plan_splits,
+                cache=self._cognite_client.datapoints_cache,
+            )
+        )
+
+    def retrieve_stream(
+        self,
+        start: Union[int, str, datetime] = 0,
+        end: Union[int, str, datetime] = "now",
+        id: Union[int, List[int], Dict[int, Any]] = None,
+        external_id: Union[str, List[str], Dict[str, Any]] = None,
+        aggregates: Union[str, List[str]] = None,
+        granularity: str = None,
+        max_buffered_chunks: int = 100,
+        plan_splits: bool = False,
+        checkpoint: Union[str, DatapointsCheckpoint] = None,
+    ) -> DatapointsStream:
+        """Streaming datapoints retrieval, for results which do not need to fit in memory at once.
+
+        Args:
+            max_buffered_chunks (int): Number of retrieved chunks to buffer before fetching pauses until they are consumed.
+            plan_splits (bool): Split raw datapoint retrieval based on count aggregates, see `retrieve_async`.
+            checkpoint (Union[str, DatapointsCheckpoint]): Records how far each time series was consumed, in a JSON file at the given path. Streaming again with the same checkpoint resumes each time series where the consumer stopped.
+
+        Returns:
+            An iterable DatapointsStream which yields DatapointsBuffer chunks (see `to_datapoints` and `to_pandas`) as pages arrive. The chunks for each time series are in time order. Its `job` attribute is the underlying Job.
+        """
+        items, _ = DatapointsFetcher._process_ts_identifiers(id, external_id)
+        base = {"start": start, "end": end, "aggregates": aggregates, "granularity": granularity}
+        if isinstance(checkpoint, str):
+            checkpoint = DatapointsCheckpoint(checkpoint)
+        stream = DatapointsStream(max_buffered_chunks, checkpoint)
+        self._cognite_client.submit_job(
+            DatapointsListJob([{**base, **item} for item in items], self, stream=stream, plan_splits=plan_splits)
+        )
+        return stream
+
+    def retrieve_synthetic_stream(
+        self,
+        expression: str,
+        variables: Dict[str, Union[int, str]],
+        start: Union[int, str, datetime],
+        end: Union[int, str, datetime],
+        granularity: str,
+        aggregate: str = "average",
+        max_buffered_chunks: int = 100,
+    ) -> SyntheticDatapointsStream:
+        """Streaming retrieval of a series computed from other time series, e.g. their sum or ratio.
+
+        The `aggregate` of each input is retrieved at `granularity` as in `retrieve_stream`, and the expression is evaluated on the inputs chunk by chunk, as soon as all of them are retrieved up to a later time, so they are never held in memory at once.
+
+        Args:
+            expression (str): Python syntax with numbers, the variables, + - * / ** % and the functions abs, sqrt, exp, log, log10, sin, cos, tan, floor, ceil, round, min and max, e.g. "(a + b) / 2".
+            variables (Dict[str, Union[int, str]]): The time series of each variable in the expression, by id (int) or external id (str).
+            aggregate (str): The aggregate of the inputs which the expression is evaluated on.
+            max_buffered_chunks (int): Number of retrieved chunks of the inputs to buffer before fetching pauses.
+
+        Returns:
+            An iterable SyntheticDatapointsStream which yields DatapointsBuffer chunks of the computed series in time order, with the expression as external id. Its `to_pandas` method collects them into a DataFrame.
+        """
+        expression = Expression(expression)
+        missing = [name for name in expression.names if name not in variables]
+        if missing or not expression.names:
+            raise ValueError("No time series given for the variables {} of {}".format(missing, expression))
+        items = []
+        for name in expression.names:
+            identifier = variables[name]
+            items.append({"id": identifier} if isinstance(identifier, int) else {"externalId": identifier})
+        granularity_ms = granularity_to_ms(granularity)  # the grid needs a fixed length, so no months
+        grid_start = DatapointsJob._align_with_granularity_unit(timestamp_to_ms(start), granularity)
+        grid_end = DatapointsJob._align_with_granularity_unit(timestamp_to_ms(end), granularity)
+        base = {"start": grid_start, "end": grid_end, "aggregates": [aggregate], "granularity": granularity}
+        inputs = DatapointsStream(max_buffered_chunks)
+        self._cognite_client.submit_job(DatapointsListJob([{**base, **item} for item in items], self, stream=inputs))
+        return SyntheticDatapointsStream(expression, inputs, grid_start, grid_end, granularity_ms)
+
+    def retrieve_latest_async(
+        self,
+        id: Union[int, List[int]] = None,
+        external_id: Union[str, List[str]] = None,
+        before: Union[int, str, datetime, List[Union[int, str, datetime]]] = None,
+        ignore_unknown_ids: bool = False,
+    ) -> "Future":
+        """Asynchronous version of `retrieve_latest`, for the latest datapoints of many time series.
+
+        The series are retrieved in batches of `_RETRIEVE_LATEST_LIMIT` per request, which run in parallel on the job queue. When the client has a `latest_datapoints_cache`, values retrieved less than its ttl ago, or being retrieved for another query at the same time, are shared rather than retrieved again.
+
+        Args:
+            before (Union[int, str, datetime, List]): Get the latest datapoint before this time, or a list with a time (or None) for each time series, in the order of the ids followed by the external ids.
+            ignore_unknown_ids (bool): Leave out time series which do not exist, rather than failing.
+
+        Returns:
+            A Job object whose `result` property waits for and returns a DatapointsList with the latest datapoint of each time series, in the order they were given.
+        """
+        items = self._process_ids(id, external_id, wrap_ids=True)
+        befores = before if isinstance(before, list) else [before] * len(items)
+        if len(befores) != len(items):
+            raise ValueError("Got {} before times for {} time series".format(len(befores), len(items)))
+        for item, item_before in zip(items, befores):
+            if item_before is not None:
+                item["before"] = timestamp_to_ms(item_before)
+        return self._cognite_client.submit_job(
+            LatestDatapointsJob(
+                items, self, ignore_unknown_ids=ignore_unknown_ids, cache=self._cognite_client.latest_datapoints_cache
+            )
+        )
 
     def retrieve_dataframe_async(
         self,
@@ -57,18 +184,97 @@ class DataPointsAPIExtensions:
         Returns:
             A Job object whose `result` property waits for and returns a pandas DataFrame with the requested datapoints.
         """
-        job = self.retrieve_async(start, end, id, external_id, aggregates, granularity)
-        job.add_callback(lambda dpl: dpl.to_pandas())
-        return job
+        items, _ = DatapointsFetcher._process_ts_identifiers(id, external_id)
+        base = {"start": start, "end": end, "aggregates": aggregates, "granularity": granularity}
+        return self._cognite_client.submit_job(
+            DatapointsListJob(
+                [{**base, **item} for item in items],
+                self,
+                as_dataframe=True,
+                cache=self._cognite_client.datapoints_cache,
+            )
+        )
 
     def count(
-        self, time_series: TimeSeries, start: Union[int, str, datetime] = 0, end: Union[int, str, datetime] = "now"
+        self,
+        time_series: Union[TimeSeries, List[TimeSeries]],
+        start: Union[int, str, datetime] = 0,
+        end: Union[int, str, datetime] = "now",
     ) -> "Future":
         """Asynchronous data points counting.
 
+        Numeric time series are counted from count aggregates, with the coarsest granularity that fits the interior of the range and finer ones only at its edges, for many time series per request. When the client has a `datapoints_count_cache`, counts of historical data are stored, and counting again only counts the data around the stored range, typically the recent tail.
+
         Returns:
-            A Job object whose `result` property waits for and returns an integer with the number of data points in the time series.
+            A Job object whose `result` property waits for and returns an integer with the number of data points in the time series, or a list of integers for a list of time series.
         """
         return self._cognite_client.submit_job(
-            CountDatapointsJob(time_series=time_series, start=start, end=end, api_client=self)
+            CountDatapointsListJob(
+                to_list(time_series),
+                start=start,
+                end=end,
+                api_client=self,
+                single=not isinstance(time_series, list),
+                cache=self._cognite_client.datapoints_count_cache,
+            )
         )
+
+    def insert_async(
+        self,
+        datapoints: Union[List[Dict[str, Any]], List[Tuple[Any, Any]], Datapoints],
+        id: int = None,
+        external_id: str = None,
+    ) -> "Future":
+        """Asynchronous version of `insert`, inserting datapoints into one time series.
+
+        Returns:
+            A Job object whose `result` property waits for the insertion to finish, and raises a CogniteJobError of DatapointsInsertError for the requests which failed.
+        """
+        assert_exactly_one_of_id_or_external_id(id, external_id)
+        dps_object = {"id": id} if id is not None else {"externalId": external_id}
+        return self.insert_multiple_async([{**dps_object, "datapoints": datapoints}])
+
+    def insert_multiple_async(self, datapoints: List[Dict[str, Any]]) -> "Future":
+        """Asynchronous version of `insert_multiple`, inserting datapoints into many time series.
+
+        Series are split into requests of at most `_DPS_LIMIT` datapoints, and small series are packed together into shared requests, which all run in parallel on the job queue.
+
+        Args:
+            datapoints (List[Dict]): Dicts with the id or externalId of a time series, and its "datapoints" as a list of (timestamp, value) tuples, a list of {"timestamp": .., "value": ..} dicts or a Datapoints object.
+
+        Returns:
+            A Job object whose `result` property waits for the insertion to finish, and raises a CogniteJobError of DatapointsInsertError for the requests which failed. The `failed` attribute of each DatapointsInsertError lists the series and time ranges which were not inserted.
+        """
+        items = []
+        for dps_object in datapoints:
+            if isinstance(dps_object.get("datapoints"), Datapoints):
+                dps = dps_object["datapoints"]
+                dps_object = {**dps_object, "datapoints": list(zip(dps.timestamp, dps.value))}
+            (valid,) = DatapointsPoster._validate_dps_objects([dps_object])
+            identifier = {k: valid[k] for k in ["id", "externalId"] if k in valid}
+            timestamps = np.array([t for t, _ in valid["datapoints"]], dtype=np.int64)
+            items.append((identifier, timestamps, [v for _, v in valid["datapoints"]]))
+        return self._cognite_client.submit_job(InsertDatapointsJob(items, self))
+
+    def insert_dataframe_async(self, dataframe: pd.DataFrame, external_id_headers: bool = False) -> "Future":
+        """Asynchronous version of `insert_dataframe`, inserting each column into the time series named by its header.
+
+        The columns are posted straight from their arrays, without building lists of datapoints first. See `insert_multiple_async` for the batching and errors.
+
+        Args:
+            dataframe (pandas.DataFrame): Data with a datetime index, and time series ids (or external ids) as column headers.
+            external_id_headers (bool): Set to True if the column headers are external ids rather than internal ids.
+
+        Returns:
+            A Job object whose `result` property waits for the insertion to finish.
+        """
+        assert not dataframe.isnull().values.any(), "Dataframe contains NaNs. Remove them in order to insert the data."
+        assert np.isfinite(
+            dataframe.select_dtypes(include=[np.number])
+        ).values.all(), "Dataframe contains Infinity. Remove them in order to insert the data."
+        timestamps = dataframe.index.values.astype("datetime64[ms]").astype("int64")
+        items = [
+            ({"externalId": col} if external_id_headers else {"id": int(col)}, timestamps, dataframe[col].values)
+            for col in dataframe.columns
+        ]
+        return self._cognite_client.submit_job(InsertDatapointsJob(items, self))
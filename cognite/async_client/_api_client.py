@@ -1,9 +1,32 @@
-from cognite.async_client.concurrency import CreateJob
+import asyncio
+import functools
+import gzip
+import json as _json
+import os
+import time
+
+from cognite.async_client.concurrency import CreateJob, ListJob, RetrieveMultipleJob
 from cognite.async_client.utils import extends_class, to_list
+from cognite.client import utils
 from cognite.client._api_client import APIClient
 from cognite.client.exceptions import *
 
 
+class AsyncResponse:
+    """The parts of a requests.Response that jobs use, for responses received through aiohttp."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    def json(self):
+        return _json.loads(self.content)
+
+
+_sdk_do_request = APIClient._do_request
+
+
 @extends_class(extends=APIClient)
 class ApiClientExtensions:
     """Extensions to the cognite.client.ApiClient base class"""
@@ -19,27 +42,178 @@ class ApiClientExtensions:
         """
         return self._cognite_client.submit_job(CreateJob(resources, api_client=self))
 
-    def upsert(self, resources):
+    def upsert(self, resources, lookup=False, skip_unchanged=False, known_external_ids=None):
         """Creates objects and updates if they already exist.
 
         Args:
             resources (Union[CogniteResource,List[CogniteResource]]): List of resources to be created.
+            lookup (bool): Retrieve which resources exist first, and create and update them in parallel, instead of trying to create all of them and updating those which failed as duplicates. Faster when most resources already exist.
+            skip_unchanged (bool): Do not update resources whose fields all equal the stored ones. Implies lookup.
+            known_external_ids (Dict[str,str]): External ids known to exist, which are not looked up. Filled in with content hashes of the upserted resources, so passing the same dict to later calls saves lookups, and with skip_unchanged, any request for unchanged resources. Implies lookup.
 
         Returns:
-            Dict[str,CogniteResourceList]: dictionary of {"created": list of created resources, "updated": list of updated resources}
+            Dict[str,CogniteResourceList]: dictionary of {"created": list of created resources, "updated": list of updated resources}, and with lookup, "unchanged": list of the given resources which were not updated.
 
         """
-        return self.upsert_async(resources).result
+        return self.upsert_async(
+            resources, lookup=lookup, skip_unchanged=skip_unchanged, known_external_ids=known_external_ids
+        ).result
 
-    def upsert_async(self, resources):
+    def upsert_async(self, resources, lookup=False, skip_unchanged=False, known_external_ids=None):
         """Creates objects and updates if they already exist.
 
         Args:
             resources (Union[CogniteResource,List[CogniteResource]]): List of resources to be created.
+            lookup (bool): Retrieve which resources exist first, see `upsert`.
+            skip_unchanged (bool): Do not update resources whose fields all equal the stored ones.
+            known_external_ids (Dict[str,str]): External ids known to exist, see `upsert`.
 
         Returns:
-            Dict[str,CogniteResourceList]: dictionary of {"created": list of created resources, "updated": list of updated resources}
+            Future[Dict[str,CogniteResourceList]]: future for the dictionary of {"created": list of created resources, "updated": list of updated resources}, and with lookup, "unchanged".
 
         """
         insertable_resources = [r.insertable_copy() for r in to_list(resources)]
-        return self._cognite_client.submit_job(CreateJob(insertable_resources, api_client=self, upsert=True))
+        return self._cognite_client.submit_job(
+            CreateJob(
+                insertable_resources,
+                api_client=self,
+                upsert=True,
+                lookup=lookup,
+                skip_unchanged=skip_unchanged,
+                known_external_ids=known_external_ids,
+            )
+        )
+
+    def list_async(self, filter=None, limit=None, partitions=None, **other_params):
+        """List resources (assets/events/time series/etc) asynchronously.
+
+        Without a limit, the resources are listed in `partitions` parallel partitions, each paginating through its own cursor on the job queue.
+
+        Args:
+            filter (Union[Dict,CogniteFilter]): Filter, as a dict in the camel case form of the API or a filter object like AssetFilter.
+            limit (int): Maximum number of resources to return, None for all.
+            partitions (int): Number of partitions to list in parallel when there is no limit, by default up to 10 depending on the number of workers.
+            `**other_params`: other parameters of the list request, e.g. aggregatedProperties.
+
+        Returns:
+            Future[CogniteResourceList]: future for the listed resources.
+        """
+        if hasattr(filter, "dump"):
+            filter = filter.dump(camel_case=True)
+        if partitions is None:
+            partitions = 1 if limit is not None else min(10, self._cognite_client.job_queue.num_workers)
+        return self._cognite_client.submit_job(
+            ListJob(filter, api_client=self, limit=limit, partitions=partitions, other_params=other_params)
+        )
+
+    def retrieve_multiple_async(self, ids=None, external_ids=None, ignore_unknown_ids=False):
+        """Retrieve resources (assets/events/time series/etc) by id asynchronously, in parallel requests of `_RETRIEVE_LIMIT` identifiers.
+
+        Args:
+            ids (List[int]): Ids of the resources.
+            external_ids (List[str]): External ids of the resources.
+            ignore_unknown_ids (bool): Leave out identifiers which are not found instead of failing.
+
+        Returns:
+            Future[CogniteResourceList]: future for the retrieved resources, in the order of the ids and then the external ids.
+        """
+        identifiers = self._process_ids(ids, external_ids, wrap_ids=True)
+        return self._cognite_client.submit_job(
+            RetrieveMultipleJob(identifiers, api_client=self, ignore_unknown_ids=ignore_unknown_ids)
+        )
+
+    def _limiter(self):
+        return getattr(getattr(self._cognite_client, "job_queue", None), "limiter", None)
+
+    def _do_request(self, method, url_path, **kwargs):
+        """The SDK's `_do_request`, reporting latency and throttling to the adaptive limiter of the job queue, and
+        marking errors which the SDK retried already as `retried`, so jobs do not retry them again."""
+        limiter = self._limiter()
+        t0 = time.monotonic()
+        try:
+            res = _sdk_do_request(self, method, url_path, **kwargs)
+        except CogniteAPIError as e:
+            e.retried = e.code in self._retried_statuses(method, url_path)
+            if limiter is not None:
+                limiter.record(time.monotonic() - t0, throttled=_is_throttled(e.code))
+            raise
+        if limiter is None:
+            return res
+        retries = getattr(getattr(res.raw, "retries", None), "history", None) or []  # retried by urllib3
+        limiter.record(time.monotonic() - t0, throttled=any(_is_throttled(r.status) for r in retries))
+        return res
+
+    async def _post_async(self, url_path, json=None, params=None, headers=None):
+        """Non-blocking version of `_post` for jobs running on the asyncio engine.
+
+        Uses the aiohttp session of the client's AsyncJobQueue, with the same headers, compression and retries on
+        throttling as the SDK. Falls back to running `_post` in a worker thread when aiohttp is not available.
+        """
+        session = getattr(self._cognite_client.job_queue, "http_session", None)
+        if session is None:
+            post = functools.partial(self._post, url_path, json=json, params=params, headers=headers)
+            return await asyncio.get_event_loop().run_in_executor(None, post)
+
+        _, full_url = self._resolve_url("POST", url_path)
+        request_headers = self._configure_headers(self._config.headers.copy())
+        request_headers.update(headers or {})
+        data = _json.dumps(json, default=utils._auxiliary.json_dump_default) if json else None
+        if data and not os.getenv("COGNITE_DISABLE_GZIP", False):
+            data = gzip.compress(data.encode())
+            request_headers["Content-Encoding"] = "gzip"
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        retry_statuses = self._retried_statuses("POST", url_path)
+
+        limiter = self._limiter()
+        for attempt in range(self._config.max_retries + 1):
+            t0 = time.monotonic()
+            async with session.post(full_url, data=data, params=params, headers=dict(request_headers)) as res:
+                response = AsyncResponse(res.status, res.headers, await res.read())
+            if limiter is not None:
+                limiter.record(time.monotonic() - t0, throttled=_is_throttled(response.status_code))
+            if response.status_code not in retry_statuses or attempt == self._config.max_retries:
+                break
+            await asyncio.sleep(min(0.5 * 2 ** attempt, self._config.max_retry_backoff))
+
+        if not self._status_is_valid(response.status_code):
+            try:
+                _raise_async_API_error(response)
+            except CogniteAPIError as e:
+                e.retried = e.code in retry_statuses
+                raise
+        return response
+
+    def _retried_statuses(self, method, url_path):
+        """Status codes on which requests to the path are retried by the request layer, like the SDK's sessions."""
+        if not self._config.max_retries:
+            return []
+        is_retryable, _ = self._resolve_url(method, url_path)
+        return self._config.status_forcelist if is_retryable else [429]
+
+
+def _is_throttled(status):
+    return status is not None and (status == 429 or status >= 500)
+
+
+def _raise_async_API_error(response):
+    missing = duplicated = None
+    extra = {}
+    try:
+        error = response.json()["error"]
+        if isinstance(error, dict):
+            msg = error["message"]
+            missing = error.get("missing")
+            duplicated = error.get("duplicated")
+            extra = {k: v for k, v in error.items() if k not in ["message", "missing", "duplicated", "code"]}
+        else:
+            msg = error
+    except Exception:
+        msg = response.content
+    raise CogniteAPIError(
+        msg,
+        response.status_code,
+        response.headers.get("X-Request-Id"),
+        missing=missing,
+        duplicated=duplicated,
+        extra=extra,
+    )
@@ -1,9 +1,11 @@
 import os
+from contextlib import contextmanager
 
 import cognite.async_client._api  # run extensions
 import cognite.async_client._api_client  # run extensions
 import cognite.async_client.data_classes._base  # run extensions
-from cognite.async_client.concurrency import JobQueue
+from cognite.async_client.concurrency import AdaptiveLimiter, AsyncJobQueue, JobQueue
+from cognite.async_client.scheduler import PRIORITY_CLASSES, submit_defaults, submit_timeout
 from cognite.client.experimental import CogniteClient as Client
 
 
@@ -13,11 +15,34 @@ class CogniteClient(Client):
     Args:
         * api_key (str): Your api key. If not given, looks for it in environment variables COGNITE_API_KEY and [PROJECT]_API_KEY
         * server (str): Sets base_url to https://[server].cognitedata.com, e.g. server=greenfield.
-        * max_workers_async (int): Maximum number of worker threads for the asynchronous job queue. Defaults to max_workers (10).
+        * max_workers_async (int): Maximum number of worker threads for the asynchronous job queue. Defaults to max_workers (10), or 100 concurrent requests for the asyncio engine.
+        * engine (str): "threads" (default) runs jobs on a pool of worker threads, "asyncio" runs them as coroutines on an event loop, using a non-blocking aiohttp session if aiohttp is installed.
+        * adaptive_concurrency (bool): Adapt the number of jobs running at once to the API's latency and throttling, starting from max_workers_async and growing up to 4 times that. The limiter is available as `job_queue.limiter`, whose `stats` show the current limit and latency.
+        * datapoints_cache (DatapointsCache): Cache of retrieved datapoints used by `retrieve_async` and `retrieve_dataframe_async`, off by default.
+        * datapoints_decoder (DatapointsDecoder): Decodes datapoints responses in a pool of processes rather than in the workers, off by default.
+        * datapoints_coalescer (DatapointsCoalescer): Shares retrieval between datapoints queries for the same time series and overlapping ranges which are in flight at the same time, off by default.
+        * datapoints_count_cache (DatapointsCountCache): Counts of historical datapoints reused by `datapoints.count`, off by default.
+        * latest_datapoints_cache (LatestDatapointsCache): Short-lived cache of latest datapoints shared by concurrent `retrieve_latest_async` calls, off by default.
+        * memory_budget (MemoryBudget): Limits the datapoints held by jobs before their results are merged, pausing new work and optionally spilling results to disk while over budget. Unlimited by default.
+        * retry_policy (RetryPolicy): How jobs which are safe to run again (retrieving, listing, inserting datapoints, updating) retry after failing, by default 3 attempts with exponential backoff for throttling, server and connection errors. Creating resources is never retried.
         * `**kwargs`: other arguments are passed to the SDK.
     """
 
-    def __init__(self, server=None, max_workers_async=None, **kwargs):
+    def __init__(
+        self,
+        server=None,
+        max_workers_async=None,
+        engine="threads",
+        adaptive_concurrency=False,
+        datapoints_cache=None,
+        datapoints_decoder=None,
+        datapoints_coalescer=None,
+        datapoints_count_cache=None,
+        latest_datapoints_cache=None,
+        memory_budget=None,
+        retry_policy=None,
+        **kwargs,
+    ):
         if "base_url" not in kwargs and server is not None:
             kwargs["base_url"] = "https://" + server + ".cognitedata.com"
 
@@ -34,10 +59,70 @@ class CogniteClient(Client):
         if "max_workers" not in kwargs:
             kwargs["max_workers"] = 25
         super().__init__(**kwargs)
-        self.job_queue = JobQueue(max_workers_async or self.config.max_workers)
+        self.datapoints_cache = datapoints_cache
+        self.datapoints_decoder = datapoints_decoder
+        self.datapoints_coalescer = datapoints_coalescer
+        self.datapoints_count_cache = datapoints_count_cache
+        self.latest_datapoints_cache = latest_datapoints_cache
+        if engine not in ["threads", "asyncio"]:
+            raise ValueError("engine should be 'threads' or 'asyncio', not {}".format(engine))
+        num_workers = max_workers_async or (100 if engine == "asyncio" else self.config.max_workers)
+        limiter = None
+        if adaptive_concurrency:
+            limiter = AdaptiveLimiter(max_limit=4 * num_workers, initial_limit=num_workers)
+            num_workers = limiter.max_limit
+        if engine == "asyncio":
+            self.job_queue = AsyncJobQueue(
+                num_workers,
+                timeout=self.config.timeout,
+                limiter=limiter,
+                retry_policy=retry_policy,
+                memory_budget=memory_budget,
+            )
+        else:
+            self.job_queue = JobQueue(
+                num_workers, limiter=limiter, retry_policy=retry_policy, memory_budget=memory_budget
+            )
 
-    def submit_jobs(self, jobs):
-        return self.job_queue.submit(jobs)
+    def submit_jobs(self, jobs, priority_class=None, weight=None, timeout=None):
+        return self.job_queue.submit(jobs, priority_class=priority_class, weight=weight, timeout=timeout)
 
-    def submit_job(self, job):
-        return self.submit_jobs([job])[0]
+    def submit_job(self, job, priority_class=None, weight=None, timeout=None):
+        return self.submit_jobs([job], priority_class=priority_class, weight=weight, timeout=timeout)[0]
+
+    @contextmanager
+    def priority_class(self, name, weight=1):
+        """Runs jobs submitted within the block, e.g. by `retrieve_async`, in priority class `name`.
+
+        Jobs in the "interactive" class run before those in "normal" (the default), which run before "batch". Within a
+        class, each top-level job gets a share of the workers proportional to its `weight`.
+
+        Example:
+            >>> with client.priority_class("interactive"):
+            ...     dps = client.datapoints.retrieve_async(id=1, start="1d-ago", end="now").result
+        """
+        if name not in PRIORITY_CLASSES:
+            raise ValueError("priority_class should be one of {}, not {}".format(list(PRIORITY_CLASSES), name))
+        token = submit_defaults.set((name, weight))
+        try:
+            yield
+        finally:
+            submit_defaults.reset(token)
+
+    @contextmanager
+    def timeout(self, seconds):
+        """Cancels jobs submitted within the block, e.g. by `retrieve_async`, if they are not done `seconds` after being
+        submitted. Their queued sub-jobs are dropped, and their result becomes a CogniteJobError with a JobTimeoutError.
+        Jobs can also be cancelled at any time with `job.cancel()`.
+
+        Example:
+            >>> with client.timeout(10):
+            ...     job = client.datapoints.retrieve_async(id=1, start="1d-ago", end="now")
+        """
+        if seconds <= 0:
+            raise ValueError("timeout should be positive")
+        token = submit_timeout.set(seconds)
+        try:
+            yield
+        finally:
+            submit_timeout.reset(token)
@@ -0,0 +1,405 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import timedelta
+
+import numpy as np
+
+from cognite.async_client.data_classes.datapoints import DatapointsBuffer
+from cognite.client.utils._time import granularity_to_ms
+
+
+class DatapointsCache:
+    """Local on-disk cache of retrieved datapoints, used by `retrieve_async` when passed to the CogniteClient.
+
+    Datapoints are stored per (time series, aggregates, granularity, phase of the aggregate intervals) as segments of
+    NumPy arrays, which are read back memory-mapped. An index of the time ranges covered by the segments is kept in
+    `index.json`, and only the gaps between covered ranges are retrieved from the API. Ranges less than `refetch_latest`
+    before now are never cached, since live data may still change. When the cache grows beyond `max_bytes`, least
+    recently used segments are evicted. The cache is not safe for use by several processes at once.
+
+    Args:
+        path (str): Directory to store the cache in, created if it does not exist.
+        max_bytes (int): Size of the stored arrays above which segments are evicted.
+        refetch_latest (Union[timedelta, int]): Age (or number of milliseconds) below which data is always retrieved.
+    """
+
+    MERGE_BYTES = 2 ** 23  # adjacent segments are merged while smaller than this, to avoid many small files
+
+    def __init__(self, path, max_bytes=2 ** 30, refetch_latest=timedelta(hours=1)):
+        self.path = path
+        self.max_bytes = max_bytes
+        if isinstance(refetch_latest, timedelta):
+            refetch_latest = int(refetch_latest.total_seconds() * 1000)
+        self.refetch_latest = refetch_latest
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        try:
+            with open(self._index_path) as f:
+                self._index = json.load(f)  # key -> segments sorted by start, not overlapping
+        except FileNotFoundError:
+            self._index = {}
+
+    def __repr__(self):
+        return f"<DatapointsCache path={self.path} series={len(self._index)} nbytes={self.nbytes}>"
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.path, "index.json")
+
+    @property
+    def nbytes(self):
+        return sum(seg["nbytes"] for segments in self._index.values() for seg in segments)
+
+    @staticmethod
+    def key(query):
+        """Cache key of a datapoints query, from its identifier, aggregates and granularity. Aggregate intervals depend
+        on where the range starts, so the key of aggregates also has the phase of the start within the granularity."""
+        identifier = ["id", query["id"]] if query.get("id") is not None else ["externalId", query["externalId"]]
+        key = identifier + [query.get("aggregates"), query.get("granularity")]
+        if query.get("aggregates"):
+            try:
+                key.append(query["start"] % granularity_to_ms(query["granularity"]))
+            except ValueError:  # e.g. months, which have no fixed length
+                key.append(query["start"])
+        return json.dumps(key)
+
+    def cutoff(self):
+        """Timestamp from which data is too recent to cache."""
+        return int(time.time() * 1000) - self.refetch_latest
+
+    def lookup(self, key, start, end, fields):
+        """Splits start:end into covered and uncovered parts.
+
+        Returns:
+            List[Tuple[int,int,Optional[DatapointsBuffer]]]: (start, end, cached datapoints or None for a gap) for
+            consecutive parts of the range.
+        """
+        parts = []
+        with self._lock:
+            for seg in self._index.get(key, []):
+                if seg["end"] <= start or seg["start"] >= end:
+                    continue
+                seg["used"] = time.time()
+                parts.append((max(seg["start"], start), min(seg["end"], end), seg))
+        result = []
+        for part_start, part_end, seg in parts:
+            if part_start > start:
+                result.append((start, part_start, None))
+            try:
+                result.append((part_start, part_end, self._load(seg, fields).time_slice(part_start, part_end)))
+            except OSError:  # files were removed, treat as a gap
+                result.append((part_start, part_end, None))
+            start = part_end
+        if start < end:
+            result.append((start, end, None))
+        return result
+
+    def store(self, key, start, end, buffer):
+        """Stores the datapoints of a fully retrieved range start:end, merging with overlapping segments."""
+        with self._lock:
+            segments = self._index.get(key, [])
+            keep, merge = [], []
+            for seg in segments:
+                touching = seg["end"] >= start and seg["start"] <= end
+                if touching and (seg["start"] < end and seg["end"] > start or seg["nbytes"] < self.MERGE_BYTES):
+                    merge.append(seg)
+                else:
+                    keep.append(seg)
+            stored = [self._load(seg, buffer.fields) for seg in merge]
+            before = [old.time_slice(seg["start"], start) for seg, old in zip(merge, stored) if seg["start"] < start]
+            after = [old.time_slice(end, seg["end"]) for seg, old in zip(merge, stored) if seg["end"] > end]
+            merged = DatapointsBuffer(buffer.fields)
+            for part in before + [buffer.time_slice(start, end)] + after:
+                merged.extend(part)
+            new_seg = self._save(
+                merged, min([start] + [seg["start"] for seg in merge]), max([end] + [seg["end"] for seg in merge])
+            )
+            self._index[key] = sorted(keep + [new_seg], key=lambda seg: seg["start"])
+            for seg in merge:
+                self._remove_files(seg)
+            self._evict()
+            self._write_index()
+
+    def clear(self):
+        """Removes all cached datapoints."""
+        with self._lock:
+            for segments in self._index.values():
+                for seg in segments:
+                    self._remove_files(seg)
+            self._index = {}
+            self._write_index()
+
+    def _evict(self):
+        segments = sorted(
+            ((seg["used"], key, seg) for key, segments in self._index.items() for seg in segments),
+            key=lambda s: s[0],
+        )
+        nbytes = sum(seg["nbytes"] for _, _, seg in segments)
+        for _, key, seg in segments:
+            if nbytes <= self.max_bytes:
+                break
+            self._index[key].remove(seg)
+            if not self._index[key]:
+                del self._index[key]
+            self._remove_files(seg)
+            nbytes -= seg["nbytes"]
+
+    def _write_index(self):
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self._index_path)
+
+    def _file(self, seg, column):
+        return os.path.join(self.path, "{}.{}.npy".format(seg["file"], column))
+
+    def _save(self, buffer, start, end):
+        seg = {
+            "start": start,
+            "end": end,
+            "file": uuid.uuid4().hex,
+            "nbytes": buffer.timestamp.nbytes + sum(buffer.column(f).nbytes for f in buffer.fields),
+            "used": time.time(),
+            "fields": buffer.fields,
+            "metadata": {
+                "id": buffer.id,
+                "external_id": buffer.external_id,
+                "is_string": buffer.is_string,
+                "is_step": buffer.is_step,
+                "unit": buffer.unit,
+            },
+        }
+        np.save(self._file(seg, "timestamp"), buffer.timestamp)
+        for f in buffer.fields:
+            np.save(self._file(seg, f), buffer.column(f), allow_pickle=bool(buffer.is_string))
+        return seg
+
+    def _load(self, seg, fields):
+        """Buffer on the memory-mapped arrays of a segment. Object arrays of string time series are read into memory."""
+        buffer = DatapointsBuffer(fields)
+        for name, value in seg["metadata"].items():
+            setattr(buffer, name, value)
+        buffer._timestamp = np.load(self._file(seg, "timestamp"), mmap_mode="r")
+        if buffer.is_string:
+            buffer._columns = {f: np.load(self._file(seg, f), allow_pickle=True) for f in fields}
+        else:
+            buffer._columns = {f: np.load(self._file(seg, f), mmap_mode="r") for f in fields}
+        buffer._size = len(buffer._timestamp)
+        return buffer
+
+    def _remove_files(self, seg):
+        for column in ["timestamp"] + seg["fields"]:
+            try:
+                os.remove(self._file(seg, column))
+            except FileNotFoundError:
+                pass
+
+
+class DatapointsCheckpoint:
+    """Progress of a `retrieve_stream` export, kept in a JSON file so a crashed export can resume where it stopped.
+
+    Chunks of each time series are consumed in time order, so the progress of a series is the time up to which its
+    chunks have been consumed. A chunk counts as consumed when the consumer asks for the next one, so the chunk being
+    processed when the export stopped is yielded again. Streaming with the same checkpoint again only retrieves the
+    rest of each series.
+
+    Args:
+        path (str): JSON file to keep the progress in, created if it does not exist.
+        save_interval (float): Minimum number of seconds between writes of the file while streaming.
+    """
+
+    def __init__(self, path, save_interval=1.0):
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        try:
+            with open(path) as f:
+                self._progress = json.load(f)  # DatapointsCache.key of the query -> timestamp consumed up to
+        except FileNotFoundError:
+            self._progress = {}
+
+    def __repr__(self):
+        return f"<DatapointsCheckpoint path={self.path} series={len(self._progress)}>"
+
+    def get(self, key):
+        """Timestamp up to which the series of a query key was consumed, or None."""
+        return self._progress.get(key)
+
+    def advance(self, key, end):
+        with self._lock:
+            self._progress[key] = max(end, self._progress.get(key, end))
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def clear(self):
+        """Forgets all progress, so the next export starts from the beginning."""
+        with self._lock:
+            self._progress = {}
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._progress, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+
+
+class DatapointsCountCache:
+    """Counts of datapoints in historical ranges of time series, used by `datapoints.count` when passed to the
+    CogniteClient.
+
+    Data older than `refetch_latest` is assumed not to change, so the count of each time series over the longest
+    historical range counted so far is kept, and counting a range containing it only counts the parts before and after
+    it, typically the recent tail. With a `path`, the counts are kept in a JSON file and reused across runs.
+
+    Args:
+        path (str): JSON file to keep the counts in, or None to keep them in memory only.
+        refetch_latest (Union[timedelta, int]): Age (or number of milliseconds) below which data is always counted.
+    """
+
+    def __init__(self, path=None, refetch_latest=timedelta(hours=1)):
+        self.path = path
+        if isinstance(refetch_latest, timedelta):
+            refetch_latest = int(refetch_latest.total_seconds() * 1000)
+        self.refetch_latest = refetch_latest
+        self._lock = threading.Lock()
+        self._counts = {}  # key -> [start, end, count]
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self._counts = json.load(f)
+            except FileNotFoundError:
+                pass
+
+    def __repr__(self):
+        return f"<DatapointsCountCache path={self.path} series={len(self._counts)}>"
+
+    @staticmethod
+    def key(time_series):
+        """Cache key of a TimeSeries, from its id, or external id if it has no id."""
+        if time_series.id is not None:
+            return json.dumps(["id", time_series.id])
+        return json.dumps(["externalId", time_series.external_id])
+
+    def cutoff(self):
+        """Timestamp from which data is too recent to cache, rounded down to whole hours so ranges end on aggregate
+        boundaries."""
+        cutoff = int(time.time() * 1000) - self.refetch_latest
+        return cutoff - cutoff % 3600000
+
+    def lookup(self, key):
+        """The (start, end, count) stored for a time series, or None."""
+        with self._lock:
+            counted = self._counts.get(key)
+        return tuple(counted) if counted is not None else None
+
+    def store(self, counts):
+        """Stores {key: (start, end, count)}, for each time series unless a longer range is stored already."""
+        with self._lock:
+            for key, (start, end, count) in counts.items():
+                stored = self._counts.get(key)
+                if stored is None or end - start >= stored[1] - stored[0]:
+                    self._counts[key] = [start, end, count]
+            if self.path is not None:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self._counts, f)
+                os.replace(tmp_path, self.path)
+
+    def clear(self):
+        with self._lock:
+            self._counts = {}
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class LatestDatapointsCache:
+    """Short-lived in-memory cache of latest datapoints, used by `retrieve_latest_async` when passed to the CogniteClient.
+
+    Dashboards polling the latest values of many time series ask for the same values over and over. A latest datapoint
+    retrieved less than `ttl` ago is returned from the cache, and while a request for it is in flight, other queries for
+    it wait for that request rather than making their own, so concurrent pollers share requests. Entries are per time
+    series and `before` timestamp. Failed requests are not cached, and queries waiting for them retrieve the value with
+    a request of their own.
+
+    Args:
+        ttl (Union[timedelta, float]): Seconds for which a retrieved value is returned from the cache.
+    """
+
+    def __init__(self, ttl=1.0):
+        if isinstance(ttl, timedelta):
+            ttl = ttl.total_seconds()
+        self.ttl = ttl
+        self.hits = 0  # values returned from the cache
+        self.shared = 0  # values taken from a request in flight for another query
+        self._entries = {}  # key -> (time.monotonic() when retrieved, None while in flight; Future of the value)
+        self._lock = threading.Lock()
+        self._pruned = time.monotonic()
+
+    def __repr__(self):
+        return f"<LatestDatapointsCache ttl={self.ttl} {self.stats}>"
+
+    @property
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "shared": self.shared}
+
+    @staticmethod
+    def key(item):
+        """Cache key of an item of a latest datapoints query, from its identifier and `before`."""
+        identifier = ["id", item["id"]] if item.get("id") is not None else ["externalId", item["externalId"]]
+        return json.dumps(identifier + [item.get("before")])
+
+    def claim(self, keys):
+        """Futures of the latest datapoints (or None for unknown ids) of each key, from the cache, from a request in
+        flight, or new ones for the caller to retrieve and complete with `store` or `abandon`.
+
+        Returns:
+            Tuple[Dict[str,Future],List[str]]: The future of each key, and the keys the caller retrieves.
+        """
+        now = time.monotonic()
+        futures, claimed = {}, []
+        with self._lock:
+            for key in keys:
+                retrieved, future = self._entries.get(key, (None, None))
+                if future is not None and retrieved is None:
+                    self.shared += 1
+                elif future is not None and now - retrieved < self.ttl:
+                    self.hits += 1
+                else:
+                    future = Future()
+                    self._entries[key] = (None, future)
+                    claimed.append(key)
+                futures[key] = future
+        return futures, claimed
+
+    def store(self, key, future, value):
+        """Completes the future of a claimed key, which is then returned from the cache for `ttl` seconds."""
+        now = time.monotonic()
+        with self._lock:
+            owned = self._entries.get(key) == (None, future)  # not abandoned already
+            if owned:
+                self._entries[key] = (now, future)
+            if now - self._pruned > self.ttl:
+                self._entries = {k: e for k, e in self._entries.items() if e[0] is None or now - e[0] < self.ttl}
+                self._pruned = now
+        if owned:
+            future.set_result(value)
+
+    def abandon(self, key, future, exception):
+        """Fails the future of a claimed key which was not retrieved, dropping it from the cache."""
+        with self._lock:
+            owned = self._entries.get(key) == (None, future)
+            if owned:
+                del self._entries[key]
+        if owned:
+            future.set_exception(exception)
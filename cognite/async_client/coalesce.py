@@ -0,0 +1,104 @@
+import threading
+
+from cognite.async_client.cache import DatapointsCache
+from cognite.async_client.scheduler import PRIORITY_CLASSES
+
+
+class DatapointsCoalescer:
+    """Shares the retrieval of datapoints between queries for the same time series which are in flight at the same
+    time, used when passed to the CogniteClient.
+
+    Each DatapointsJob registers the range it retrieves while it runs. A later job for a range overlapping those of
+    jobs in flight (its leaders) only retrieves the gaps between them, and gets the overlapping parts as copies sliced
+    from the results of the leaders when they finish, so concurrent callers asking for the same data share requests.
+    Aggregates are only shared between queries for exactly the same range, since their intervals depend on where the
+    range starts. Jobs only wait for leaders in the same or a more urgent priority class, and if a leader fails or its
+    top-level job is cancelled, the parts waiting for it are retrieved separately instead.
+    """
+
+    def __init__(self):
+        self.shared = 0  # parts of ranges which were sliced from the result of a job in flight
+        self.fallbacks = 0  # parts which were retrieved separately after their leader failed
+        self._in_flight = {}  # key -> [(start, end, leader)]
+        self._leaders = {}  # leader -> (key, followers waiting for its result)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<DatapointsCoalescer {self.stats}>"
+
+    @property
+    def stats(self):
+        return {"in_flight": len(self._leaders), "shared": self.shared, "fallbacks": self.fallbacks}
+
+    @staticmethod
+    def key(query):
+        key = DatapointsCache.key(query)
+        if query.get("aggregates"):
+            key += ":{}:{}".format(query["start"], query["end"])
+        return key
+
+    def claim(self, job, make_part, make_shared):
+        """Splits the range of a DatapointsJob into the parts retrieved by leaders in flight, and the gaps between them.
+
+        Args:
+            job (DatapointsJob): Job whose range is claimed. It becomes the leader for its range if nothing overlaps.
+            make_part (Callable[[int,int],DatapointsJob]): Job retrieving a gap start:end, which becomes its leader.
+            make_shared (Callable[[DatapointsJob,int,int],Job]): Job getting the part start:end from a leader.
+
+        Returns:
+            List[Job]: The jobs for consecutive parts of the range, `[job]` if nothing overlaps.
+        """
+        key = self.key(job.query)
+        start, end = job.query["start"], job.query["end"]
+        rank = self._rank(job)
+        new_leaders = []
+        with self._lock:
+            overlapping = [
+                (s, e, leader)
+                for s, e, leader in self._in_flight.get(key, [])
+                if s < end and e > start and self._rank(leader) <= rank
+            ]
+            parts = []
+            for s, e, leader in sorted(overlapping, key=lambda part: (part[0], -part[1])):
+                if e <= start:
+                    continue  # within a part already shared
+                if s > start:
+                    parts.append((start, s, None))
+                parts.append((max(s, start), min(e, end), leader))
+                start = min(e, end)
+            if start < end:
+                parts.append((start, end, None))
+            jobs = []
+            for s, e, leader in parts:
+                if leader is None:
+                    part = job if len(parts) == 1 else make_part(s, e)
+                    part.flow = job.flow
+                    self._in_flight.setdefault(key, []).append((s, e, part))
+                    self._leaders[part] = (key, [])
+                    new_leaders.append(part)
+                    jobs.append(part)
+                else:
+                    shared = make_shared(leader, s, e)
+                    self._leaders[leader][1].append(shared)
+                    self.shared += 1
+                    jobs.append(shared)
+        for leader in new_leaders:  # abandoned if its top-level job finishes without it, e.g. when cancelled
+            leader.flow._result.add_done_callback(lambda _, leader=leader: self.finish(leader, None))
+        return jobs
+
+    def finish(self, leader, result):
+        """Passes the result of a leader to the jobs waiting for it, None if it was abandoned."""
+        with self._lock:
+            key, followers = self._leaders.pop(leader, (None, None))
+            if key is None:
+                return
+            self._in_flight[key] = [part for part in self._in_flight[key] if part[2] is not leader]
+            if not self._in_flight[key]:
+                del self._in_flight[key]
+        for follower in followers:
+            follower._leader_done(result)
+
+    @staticmethod
+    def _rank(job):
+        flow = job.flow if job.flow is not None else job
+        return PRIORITY_CLASSES.get(flow.priority_class, PRIORITY_CLASSES["normal"])
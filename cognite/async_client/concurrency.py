@@ -1,16 +1,147 @@
+import asyncio
 import queue
 import sys
 import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 
-from cognite.async_client.jobs import CountDatapointsJob, CreateJob, DatapointsJob, DatapointsListJob, Job
+from cognite.async_client.jobs import (
+    AssetSubtreeJob,
+    CountDatapointsJob,
+    CountDatapointsListJob,
+    CreateJob,
+    DatapointsJob,
+    DatapointsListJob,
+    DatapointsStream,
+    InsertDatapointsJob,
+    Job,
+    LatestDatapointsJob,
+    ListJob,
+    RetrieveMultipleJob,
+)
+from cognite.async_client.metrics import QueueStats
+from cognite.async_client.scheduler import (
+    PRIORITY_CLASSES,
+    AsyncFairQueue,
+    DeadlineWatcher,
+    FairQueue,
+    RetryTimer,
+    submit_defaults,
+    submit_timeout,
+)
 from cognite.async_client.utils import to_list
 
 
+class AdaptiveLimiter:
+    """AIMD limit on the number of jobs running at once, adapted to how the API responds to requests.
+
+    Each request reports its latency. While the smoothed latency stays within `latency_tolerance` times the lowest
+    smoothed latency seen, the limit grows by about one per `limit` requests (additive increase). Throttling (429) and
+    server errors multiply the limit by `backoff` (multiplicative decrease), at most once per as many requests as the
+    limit was before the previous decrease, so a burst of errors from requests already in flight counts as one signal.
+
+    Args:
+        max_limit (int): Upper bound for the limit, normally the number of workers of the queue.
+        min_limit (int): Lower bound for the limit.
+        initial_limit (int): Limit to start from. Defaults to max_limit.
+        latency_tolerance (float): Factor by which latency may rise above its minimum while the limit still grows.
+        backoff (float): Factor to multiply the limit with on throttling.
+    """
+
+    LATENCY_WEIGHT = 0.1  # weight of a new request in the smoothed latency
+
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, latency_tolerance=2.0, backoff=0.5):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(initial_limit or max_limit)
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.in_flight = 0
+        self.latency = None
+        self.min_latency = None
+        self.requests = 0
+        self.throttled = 0
+        self._since_decrease = 0
+        self._decrease_window = 0
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return "<AdaptiveLimiter {}>".format(self.stats)
+
+    @property
+    def stats(self):
+        """Current limit, jobs running, smoothed and minimum latency in seconds, and number of requests reported."""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "latency": self.latency,
+            "min_latency": self.min_latency,
+            "requests": self.requests,
+            "throttled": self.throttled,
+        }
+
+    def try_acquire(self):
+        with self._condition:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def record(self, latency, throttled=False):
+        """Reports a finished request, which took `latency` seconds and was throttled or failed with a server error."""
+        with self._condition:
+            self.requests += 1
+            self._since_decrease += 1
+            if throttled:
+                self.throttled += 1
+                if self._since_decrease >= self._decrease_window:
+                    self._decrease_window = self.limit  # requests started before the decrease
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._since_decrease = 0
+                return
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.LATENCY_WEIGHT * (latency - self.latency)
+            self.min_latency = min(self.min_latency or self.latency, self.latency)
+            if self.latency <= self.latency_tolerance * self.min_latency:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+
+
 class JobQueue:
-    def __init__(self, num_workers):
-        self.job_queue = queue.PriorityQueue()
+    """Runs jobs on a pool of worker threads.
+
+    Queued jobs run in FairSchedule order: by priority class, then taking turns between the top-level jobs submitted.
+    Jobs which were cancelled, or are part of a cancelled job, are dropped when a worker gets them.
+
+    Args:
+        num_workers (int): Number of worker threads.
+        limiter (AdaptiveLimiter): Limits the number of workers running jobs at once.
+        retry_policy (RetryPolicy): Replaces the default retry policy of jobs which retry failures.
+        memory_budget (MemoryBudget): Limits the datapoints held by jobs before their results are merged.
+    """
+
+    def __init__(self, num_workers, limiter=None, retry_policy=None, memory_budget=None):
+        self.job_queue = FairQueue()
         self.num_workers = num_workers
+        self.limiter = limiter
+        self.retry_policy = retry_policy
+        self.memory_budget = memory_budget
+        self.metrics = QueueStats(num_workers)
+        self.deadlines = DeadlineWatcher()
+        self.retries = RetryTimer(self._put)
         self._idle = [True] * num_workers
         self.any_idle = True
         self._threadpool = [
@@ -21,50 +152,154 @@ class JobQueue:
 
     @property
     def done(self):
-        return self.job_queue.empty() and all(self._idle)
+        waiting = len(self.retries) + (self.memory_budget.waiting if self.memory_budget is not None else 0)
+        return self.job_queue.empty() and all(self._idle) and not waiting
 
     @property
     def healthy(self):
         return not any([isinstance(t, Exception) for t in self._threadpool])
 
-    def submit(self, jobs, priority=None):
+    def stats(self):
+        """Snapshot of the totals over all jobs run, worker utilization and state of the queue.
+
+        Counts of runs, continuations (jobs continuing with another page), splits, errors, retries, cancelled (jobs
+        dropped since they were cancelled), requests, bytes_received and datapoints, seconds of time_queued and
+        time_running summed over jobs, busy_time with any job running, uptime, utilization of the workers and
+        datapoints_per_second while busy. Also has the limiter and memory_budget stats if there are any."""
+        stats = self.metrics.dump()
+        stats.update({"workers": self.num_workers, "idle_workers": sum(self._idle), "queued": self.job_queue.qsize()})
+        if self.limiter is not None:
+            stats["limiter"] = self.limiter.stats
+        if self.memory_budget is not None:
+            stats["memory_budget"] = self.memory_budget.stats
+        return stats
+
+    def add_hook(self, hook):
+        """Adds a callback `hook(job, run)` called after every job run, e.g. to export metrics. See QueueStats."""
+        self.metrics.hooks.append(hook)
+
+    def submit(self, jobs, priority=None, priority_class=None, weight=None, timeout=None):
+        """Queues jobs. Top-level jobs get a priority class ("interactive", "normal" or "batch") and a weight for their
+        share of the workers within that class, by default those of `CogniteClient.priority_class`. With a `timeout`
+        (by default that of `CogniteClient.timeout`), they are cancelled with a JobTimeoutError if not done that many
+        seconds after being submitted."""
+        default_class, default_weight = submit_defaults.get()
+        priority_class = priority_class or default_class
+        weight = weight or default_weight
+        timeout = timeout if timeout is not None else submit_timeout.get()
+        if priority_class not in PRIORITY_CLASSES:
+            raise ValueError(
+                "priority_class should be one of {}, not {}".format(list(PRIORITY_CLASSES), priority_class)
+            )
+        if weight <= 0:
+            raise ValueError("weight should be positive")
         for job in to_list(jobs):
-            for subjob in job._initial_split():
+            if job.flow is None:  # submitted by the user, rather than a split or continuation
+                job.flow = job
+                job.priority_class = priority_class
+                job.weight = weight
+                if timeout is not None:
+                    job.deadline = time.monotonic() + timeout
+                if job.deadline is not None:
+                    self.deadlines.add(job)
+            subjobs = job._initial_split()
+            if subjobs != [job]:
+                self.metrics.job_split(job)
+            for subjob in subjobs:
                 subjob.priority = priority or subjob.priority or 1e9
-                self.job_queue.put(subjob)
+                subjob.flow = subjob.flow or job.flow
+                if self.retry_policy is not None and subjob.retry_policy is type(subjob).retry_policy is not None:
+                    subjob.retry_policy = self.retry_policy  # jobs retrying by default, without a policy of their own
+                self._put(subjob)
         return jobs
 
+    def _run(self, job):
+        started = self.metrics.job_started(job)
+        continued_job = job._run_and_store()
+        self.metrics.job_finished(job, started, continued_job)
+        return continued_job
+
+    async def _run_async(self, job):
+        started = self.metrics.job_started(job)
+        continued_job = await job._run_and_store_async()
+        self.metrics.job_finished(job, started, continued_job)
+        return continued_job
+
+    def _put(self, job):
+        self.metrics.job_queued(job)
+        self.job_queue.put(job)
+
+    def _acquire(self, tid):
+        """Waits, as an idle worker, until the limiter allows another job to run."""
+        if self.limiter is not None and not self.limiter.try_acquire():
+            self._idle[tid] = True
+            self.limiter.acquire()
+
+    def _release(self):
+        if self.limiter is not None:
+            self.limiter.release()
+
+    def _deferred(self, job):
+        """Whether the memory budget set the job aside, to be queued again once data is freed."""
+        return self.memory_budget is not None and self.memory_budget.defer(job, self._put)
+
+    def _split_if_idle(self, job):
+        """Splits a job over idle workers. Returns the job to run, or None if it was split and resubmitted."""
+        over_budget = self.memory_budget is not None and self.memory_budget.exceeded
+        if self.any_idle and job.splittable() and self.job_queue.empty() and not over_budget:
+            nparts = sum(self._idle) + 1
+            if self.limiter is not None:
+                nparts = min(nparts, int(self.limiter.limit))
+            subjobs = job._split(nparts=nparts)
+            if len(subjobs) != 1:
+                self.metrics.job_split(job)
+                self.submit(subjobs, job.priority)
+                return None
+            else:
+                job = subjobs[0]  # prevent infinisplit when splitting gives 1 part
+        return job
+
     def _run_jobs(self, tid):
         try:
             while True:
+                self._acquire(tid)
                 try:
-                    self._idle[tid] = False
-                    job = self.job_queue.get(block=False)
-                except queue.Empty:
-                    self._idle[tid] = True
-                    self.any_idle = True
-                    job = self.job_queue.get(block=True)
-                    self._idle[tid] = False
-                    self.any_idle = any(self._idle)
-                if self.any_idle and job.splittable() and self.job_queue.empty():
-                    subjobs = job._split(nparts=sum(self._idle) + 1)
-                    if len(subjobs) != 1:
-                        self.submit(subjobs, job.priority)
+                    try:
+                        self._idle[tid] = False
+                        job = self.job_queue.get(block=False)
+                    except queue.Empty:
+                        self._idle[tid] = True
+                        self.any_idle = True
+                        job = self.job_queue.get(block=True)
+                        self._idle[tid] = False
+                        self.any_idle = any(self._idle)
+                    if job.cancelled:
+                        self.metrics.job_cancelled(job)
+                        continue
+                    if self._deferred(job):
                         continue
-                    else:
-                        job = subjobs[0]  # prevent infinisplit when splitting gives 1 part
-                continued_job = job._run_and_store()
-                if continued_job:
-                    self.submit(continued_job)
+                    job = self._split_if_idle(job)
+                    if job is None:
+                        continue
+                    continued_job = self._run(job)
+                    if job.not_before is not None:
+                        self.retries.add(job)  # put back once its backoff has passed
+                    elif continued_job:
+                        self.submit(continued_job)
+                finally:
+                    self._release()
         except Exception as e:
-            print(
-                "Exception in Job Queue. Please report this on slack or github. Exception: ",
-                e,
-                "\nTraceback:",
-                file=sys.stderr,
-            )
-            traceback.print_tb(sys.exc_info()[2], file=sys.stderr)
-            self._threadpool[tid] = e.with_traceback(sys.exc_info()[2])
+            self._report_worker_exception(tid, e)
+
+    def _report_worker_exception(self, tid, e):
+        print(
+            "Exception in Job Queue. Please report this on slack or github. Exception: ",
+            e,
+            "\nTraceback:",
+            file=sys.stderr,
+        )
+        traceback.print_tb(sys.exc_info()[2], file=sys.stderr)
+        self._threadpool[tid] = e.with_traceback(sys.exc_info()[2])
 
     def __str__(self):
         exc = [t for t in self._threadpool if isinstance(t, Exception)]
@@ -76,4 +311,125 @@ class JobQueue:
                 sum([t.is_alive() for t in self._threadpool]),
                 sum(self._idle),
             )
+        if self.limiter is not None:
+            s += ", limit {}".format(int(self.limiter.limit))
+        return s
+
+
+class AsyncJobQueue(JobQueue):
+    """Job queue which runs jobs as coroutines on an asyncio event loop in a single background thread.
+
+    Each worker is a task awaiting `Job.run_async`, so jobs which do their requests through `_post_async` keep
+    `num_workers` requests in flight without a thread per request. When aiohttp is installed the queue owns the
+    non-blocking HTTP session used for those requests. Jobs without a `run_async` of their own, merges and callbacks
+    run on the queue's `executor` of `num_workers` threads, which is the default executor of its loop, so they do not
+    block the loop.
+
+    Args:
+        num_workers (int): Maximum number of jobs running concurrently.
+        timeout (float): Timeout in seconds for requests on the HTTP session.
+        limiter (AdaptiveLimiter): Limits the number of workers running jobs at once.
+        retry_policy (RetryPolicy): Replaces the default retry policy of jobs which retry failures.
+        memory_budget (MemoryBudget): Limits the datapoints held by jobs before their results are merged.
+    """
+
+    LIMITER_POLL_INTERVAL = 0.01  # seconds between checks for room while the limiter is full
+
+    def __init__(self, num_workers, timeout=None, limiter=None, retry_policy=None, memory_budget=None):
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.limiter = limiter
+        self.retry_policy = retry_policy
+        self.memory_budget = memory_budget
+        self.metrics = QueueStats(num_workers)
+        self.deadlines = DeadlineWatcher()
+        self.retries = RetryTimer(self._put)
+        self._idle = [True] * num_workers
+        self.any_idle = True
+        self._http_session = None
+        self.executor = ThreadPoolExecutor(num_workers, thread_name_prefix="cognite-async-job")
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self.executor)
+        self.job_queue = None
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=[started], daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self._loop)
+        self.job_queue = AsyncFairQueue()
+        self._threadpool = [self._loop.create_task(self._run_jobs_async(tid)) for tid in range(self.num_workers)]
+        self._loop.call_soon(started.set)
+        self._loop.run_forever()
+
+    @property
+    def http_session(self):
+        """aiohttp session shared by all workers, or None if aiohttp is not installed. Only valid inside the loop."""
+        if self._http_session is None:
+            try:
+                import aiohttp
+            except ImportError:
+                return None
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.num_workers),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._http_session
+
+    def _put(self, job):
+        self.metrics.job_queued(job)
+        self._loop.call_soon_threadsafe(self.job_queue.put_nowait, job)
+
+    async def _acquire_async(self, tid):
+        """Like `_acquire`, polling since the limiter is also updated from request threads."""
+        if self.limiter is not None and not self.limiter.try_acquire():
+            self._idle[tid] = True
+            while not self.limiter.try_acquire():
+                await asyncio.sleep(self.LIMITER_POLL_INTERVAL)
+
+    async def _run_jobs_async(self, tid):
+        try:
+            while True:
+                await self._acquire_async(tid)
+                try:
+                    try:
+                        self._idle[tid] = False
+                        job = self.job_queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        self._idle[tid] = True
+                        self.any_idle = True
+                        job = await self.job_queue.get()
+                        self._idle[tid] = False
+                        self.any_idle = any(self._idle)
+                    if job.cancelled:
+                        self.metrics.job_cancelled(job)
+                        continue
+                    if self._deferred(job):
+                        continue
+                    job = self._split_if_idle(job)
+                    if job is None:
+                        continue
+                    continued_job = await self._run_async(job)
+                    if job.not_before is not None:
+                        self.retries.add(job)
+                    elif continued_job:
+                        self.submit(continued_job)
+                finally:
+                    self._release()
+        except Exception as e:
+            self._report_worker_exception(tid, e)
+
+    def __str__(self):
+        exc = [t for t in self._threadpool if isinstance(t, Exception)]
+        if exc:
+            s = "MAJOR ERROR IN JOB WORKER. {} workers died with exceptions: {}".format(len(exc), exc)
+        else:
+            s = "asyncio queue {}, {} workers alive, {} workers idle".format(
+                "empty" if self.job_queue.empty() else "not empty",
+                sum([not t.done() for t in self._threadpool]),
+                sum(self._idle),
+            )
+        if self.limiter is not None:
+            s += ", limit {}".format(int(self.limiter.limit))
         return s
@@ -1 +1,3 @@
 import cognite.async_client.data_classes._base
+from cognite.async_client.data_classes.assets import AssetTree
+from cognite.async_client.data_classes.datapoints import DatapointsBuffer, DatapointsGrid
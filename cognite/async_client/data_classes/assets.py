@@ -0,0 +1,155 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+
+class AssetTree:
+    """Compact index of one or more asset hierarchies, stored in NumPy arrays rather than Asset objects.
+
+    Nodes are stored in level order, with the children of each node in consecutive positions, and the children of
+    consecutive nodes in consecutive ranges. So the children of the node at position `i` are at positions
+    `offsets[i]:offsets[i+1]`, and the descendants at each level below it form one range, found without visiting the
+    nodes in between. Positions of ids are looked up by binary search in a sorted copy of the ids.
+
+    Args:
+        ids (numpy.ndarray): Asset ids in level order.
+        parent (numpy.ndarray): Position of the parent of each node, -1 for roots.
+        offsets (numpy.ndarray): Position of the first child of each node, with one extra element at the end.
+        depth (numpy.ndarray): Depth of each node below its root.
+        columns (Dict[str,numpy.ndarray]): Other fields of the nodes, e.g. external_id and name.
+    """
+
+    COLUMNS = ["external_id", "name", "description"]
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        parent: np.ndarray,
+        offsets: np.ndarray,
+        depth: np.ndarray,
+        columns: Dict[str, np.ndarray] = None,
+    ):
+        self.ids = ids
+        self.parent = parent
+        self.offsets = offsets
+        self.depth = depth
+        self.columns = columns or {}
+        self._order = np.argsort(ids, kind="stable")
+        self._sorted_ids = ids[self._order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"<AssetTree nodes={len(self)} roots={len(self.roots)} depth={self.max_depth}>"
+
+    def __contains__(self, id):
+        i = np.searchsorted(self._sorted_ids, id)
+        return i < len(self._sorted_ids) and self._sorted_ids[i] == id
+
+    @property
+    def roots(self) -> np.ndarray:
+        return self.ids[self.parent < 0]
+
+    @property
+    def max_depth(self) -> int:
+        return int(self.depth[-1]) if len(self) else 0
+
+    @property
+    def parent_ids(self) -> np.ndarray:
+        """Id of the parent of each node in level order, -1 for roots."""
+        return np.where(self.parent >= 0, self.ids[np.maximum(self.parent, 0)], -1)
+
+    def position(self, ids: Union[int, Sequence[int]]) -> Union[int, np.ndarray]:
+        """Positions of asset ids in the level order arrays. Raises KeyError for ids not in the tree."""
+        ids = np.asarray(ids, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self._sorted_ids, ids), max(len(self) - 1, 0))
+        found = self._sorted_ids[i] == ids if len(self) else np.zeros(ids.shape, dtype=bool)
+        if not np.all(found):
+            raise KeyError(np.atleast_1d(ids)[~np.atleast_1d(found)].tolist())
+        positions = self._order[i]
+        return int(positions) if positions.ndim == 0 else positions
+
+    def parent_id(self, id: int) -> Optional[int]:
+        p = self.parent[self.position(id)]
+        return int(self.ids[p]) if p >= 0 else None
+
+    def children(self, id: int) -> np.ndarray:
+        i = self.position(id)
+        return self.ids[self.offsets[i] : self.offsets[i + 1]]
+
+    def ancestors(self, id: int) -> np.ndarray:
+        """Ids of the parent, grandparent and so on up to the root."""
+        result = []
+        p = self.parent[self.position(id)]
+        while p >= 0:
+            result.append(self.ids[p])
+            p = self.parent[p]
+        return np.array(result, dtype=np.int64)
+
+    def descendants(self, id: int, max_depth: int = None) -> np.ndarray:
+        """Ids of the nodes below `id` in level order, down to `max_depth` levels below it."""
+        return self.ids[self._descendant_positions(self.position(id), max_depth)]
+
+    def subtree_size(self, id: int) -> int:
+        return len(self._descendant_positions(self.position(id), None)) + 1
+
+    def _descendant_positions(self, i, max_depth):
+        ranges = []
+        lo, hi, level = i, i + 1, 0
+        while lo < hi and (max_depth is None or level < max_depth):
+            lo, hi, level = self.offsets[lo], self.offsets[hi], level + 1
+            ranges.append(np.arange(lo, hi))
+        return np.concatenate(ranges) if ranges else np.empty(0, dtype=np.int64)
+
+    def to_pandas(self) -> pd.DataFrame:
+        """DataFrame indexed by id, with parent_id (missing for roots), depth and the other columns, in level order."""
+        parent_id = pd.arrays.IntegerArray(self.parent_ids, self.parent < 0)
+        return pd.DataFrame(
+            {"parent_id": parent_id, "depth": self.depth, **self.columns}, index=pd.Index(self.ids, name="id")
+        )
+
+    @classmethod
+    def from_levels(cls, levels: List[Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]]) -> "AssetTree":
+        """Builds the tree from the (ids, parent ids, columns) of each level, with the roots first. The nodes of a
+        level may be in any order, and nodes whose parent is not in the level above are left out."""
+        ids, parent, depth, counts = [], [], [], []
+        columns = {}
+        n = 0
+        prev_ids, prev_order = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        for level, (level_ids, level_parent_ids, level_columns) in enumerate(levels):
+            if level > 0 and not len(prev_ids):
+                break
+            level_ids = np.asarray(level_ids, dtype=np.int64)
+            if level == 0:
+                parent_pos = np.full(len(level_ids), -1, dtype=np.int64)
+                keep = np.arange(len(level_ids))
+            else:
+                level_parent_ids = np.asarray(level_parent_ids, dtype=np.int64)
+                i = np.minimum(np.searchsorted(prev_ids, level_parent_ids), max(len(prev_ids) - 1, 0))
+                found = prev_ids[i] == level_parent_ids
+                parent_pos = prev_order[i] + n - len(prev_ids)  # absolute positions in the previous level
+                keep = np.flatnonzero(found)
+                keep = keep[np.argsort(parent_pos[keep], kind="stable")]  # group children by parent
+            level_ids, parent_pos = level_ids[keep], parent_pos[keep]
+            ids.append(level_ids)
+            parent.append(parent_pos)
+            depth.append(np.full(len(level_ids), level, dtype=np.int64))
+            for name, values in level_columns.items():
+                columns.setdefault(name, []).append(np.asarray(values, dtype=object)[keep])
+            if level > 0:
+                counts.append(np.bincount(parent_pos - (n - len(prev_ids)), minlength=len(prev_ids)))
+            prev_order = np.argsort(level_ids, kind="stable")
+            prev_ids = level_ids[prev_order]
+            n += len(level_ids)
+        counts.append(np.zeros(len(prev_ids), dtype=np.int64))  # the last level has no children
+        num_roots = len(ids[0]) if ids else 0
+        offsets = num_roots + np.concatenate([[0], np.cumsum(np.concatenate(counts))]).astype(np.int64)
+        return cls(
+            np.concatenate(ids) if ids else np.empty(0, dtype=np.int64),
+            np.concatenate(parent) if parent else np.empty(0, dtype=np.int64),
+            offsets,
+            np.concatenate(depth) if depth else np.empty(0, dtype=np.int64),
+            {name: np.concatenate(values) for name, values in columns.items()},
+        )
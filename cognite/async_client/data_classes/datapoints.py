@@ -0,0 +1,224 @@
+from typing import *
+
+import numpy as np
+import pandas as pd
+
+from cognite.client.data_classes import Datapoints
+from cognite.client.utils._auxiliary import to_snake_case
+
+
+class DatapointsBuffer:
+    """Columnar accumulator for datapoints retrieved in pages.
+
+    Timestamps are kept in an int64 NumPy array and each value or aggregate field in its own array (float64, int64 for
+    counts and object for string time series). Arrays grow geometrically, so appending a page is amortized linear in the
+    page size, and the Datapoints object or DataFrame is only built once all pages are in.
+
+    Args:
+        fields (List[str]): The fields to store, either ["value"] or the (camelCase) aggregates of the query.
+        capacity (int): Number of datapoints to preallocate room for.
+    """
+
+    def __init__(self, fields: List[str] = None, capacity: int = 0):
+        self.fields = list(fields or ["value"])
+        self.id = None
+        self.external_id = None
+        self.is_string = None
+        self.is_step = None
+        self.unit = None
+        self._size = 0
+        self._timestamp = np.empty(capacity, dtype=np.int64)
+        self._columns = None  # dtypes depend on is_string, so these are created with the first page
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return f"<DatapointsBuffer id={self.id} external_id={self.external_id} fields={self.fields} size={len(self)}>"
+
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self._timestamp[: self._size]
+
+    def column(self, field: str) -> np.ndarray:
+        """The values of one field, as a view of the underlying array."""
+        if self._columns is None:
+            return np.empty(0, dtype=self._dtype(field))
+        return self._columns[field][: self._size]
+
+    @property
+    def nbytes(self) -> int:
+        return self._timestamp.nbytes + sum(c.nbytes for c in (self._columns or {}).values())
+
+    @property
+    def resident_nbytes(self) -> int:
+        """Bytes of the arrays held in memory, leaving out memory-mapped ones."""
+        arrays = [self._timestamp] + list((self._columns or {}).values())
+        return sum(a.nbytes for a in arrays if not isinstance(a, np.memmap))
+
+    def _dtype(self, field):
+        if self.is_string:
+            return object
+        return np.int64 if field == "count" else np.float64
+
+    def _set_metadata(self, other):
+        self.id = other.id
+        self.external_id = other.external_id
+        self.is_string = other.is_string
+        self.is_step = other.is_step
+        self.unit = other.unit
+
+    def reserve(self, n: int):
+        """Makes room for at least n more datapoints."""
+        capacity = len(self._timestamp)
+        if self._size + n > capacity:
+            capacity = max(self._size + n, 2 * capacity)
+            self._timestamp = self._grow(self._timestamp, capacity)
+            if self._columns is not None:
+                self._columns = {f: self._grow(c, capacity) for f, c in self._columns.items()}
+        if self._columns is None:
+            self._columns = {f: np.empty(capacity, dtype=self._dtype(f)) for f in self.fields}
+
+    def _grow(self, array, capacity):
+        if len(array) >= capacity:
+            return array
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[: self._size] = array[: self._size]
+        return grown
+
+    def extend(self, other: "DatapointsBuffer", start: int = 0, end: int = None):
+        """Appends datapoints start:end of another buffer, copying its metadata if this buffer has none yet."""
+        if self.id is None and self.external_id is None:
+            self._set_metadata(other)
+        end = len(other) if end is None else end
+        n = max(end - start, 0)
+        self.reserve(n)
+        self._timestamp[self._size : self._size + n] = other.timestamp[start:end]
+        for f in self.fields:
+            self._columns[f][self._size : self._size + n] = other.column(f)[start:end]
+        self._size += n
+
+    def time_slice(self, start: int, end: int) -> "DatapointsBuffer":
+        """Datapoints with start <= timestamp < end, as views of this buffer's arrays."""
+        i, j = np.searchsorted(self.timestamp, [start, end])
+        sliced = DatapointsBuffer(self.fields)
+        sliced._set_metadata(self)
+        sliced._timestamp = self.timestamp[i:j]
+        sliced._columns = {f: self.column(f)[i:j] for f in self.fields}
+        sliced._size = j - i
+        return sliced
+
+    @classmethod
+    def load(cls, dps_object: Dict[str, Any], fields: List[str] = None) -> "DatapointsBuffer":
+        """Decodes one item of a /timeseries/data/list response into a buffer."""
+        buffer = cls(fields)
+        buffer.id = dps_object.get("id")
+        buffer.external_id = dps_object.get("externalId")
+        buffer.is_string = dps_object["isString"]
+        buffer.is_step = dps_object.get("isStep")
+        buffer.unit = dps_object.get("unit")
+        dps = dps_object["datapoints"]
+        n = len(dps)
+        buffer._timestamp = np.fromiter((dp["timestamp"] for dp in dps), dtype=np.int64, count=n)
+        buffer._columns = {}
+        for f in buffer.fields:
+            dtype = buffer._dtype(f)
+            if dtype is object:
+                buffer._columns[f] = np.array([dp.get(f) for dp in dps] + [None], dtype=object)[:-1]
+            else:
+                missing = 0 if f == "count" else np.nan
+                buffer._columns[f] = np.fromiter((dp.get(f, missing) for dp in dps), dtype=dtype, count=n)
+        buffer._size = n
+        return buffer
+
+    def to_datapoints(self) -> Datapoints:
+        """Builds the SDK Datapoints object, with None for missing aggregate values like Datapoints._load."""
+        columns = {}
+        for f in self.fields:
+            values = self.column(f)
+            if values.dtype == np.float64 and np.isnan(values).any():
+                columns[to_snake_case(f)] = [None if np.isnan(v) else v for v in values.tolist()]
+            else:
+                columns[to_snake_case(f)] = values.tolist()
+        return Datapoints(
+            id=self.id,
+            external_id=self.external_id,
+            is_string=self.is_string,
+            is_step=self.is_step,
+            unit=self.unit,
+            timestamp=self.timestamp.tolist(),
+            **columns,
+        )
+
+    def column_name(self, field: str, column_names: str = "externalId") -> str:
+        """Column name as used by Datapoints.to_pandas."""
+        if column_names == "externalId":
+            identifier = self.external_id if self.external_id is not None else self.id
+        elif column_names == "id":
+            identifier = self.id
+        else:
+            raise ValueError("column_names must be 'externalId' or 'id'")
+        return str(identifier) if field == "value" else "{}|{}".format(identifier, field)
+
+    def to_pandas(self, column_names: str = "externalId") -> pd.DataFrame:
+        """Builds a DataFrame directly on the buffer's arrays, without going through Datapoints."""
+        return pd.DataFrame(
+            {self.column_name(f, column_names): self.column(f) for f in self.fields},
+            index=pd.DatetimeIndex(self.timestamp.view("datetime64[ms]")),
+            copy=False,
+        )
+
+
+class DatapointsGrid:
+    """One 2D float64 block for the aggregates of many time series on the same granularity grid.
+
+    Each series' columns are written into the block as soon as its datapoints are retrieved, and the DataFrame is built
+    on the block without concatenating or aligning per-series frames. Rows of the grid where no series has any
+    datapoints are left out, like the union of the per-series indexes.
+
+    Args:
+        start (int): Timestamp of the first row.
+        end (int): Timestamp after the last row.
+        granularity (int): Milliseconds between rows.
+        fields (List[List[str]]): The aggregates of each series, which are its columns in the block.
+    """
+
+    def __init__(self, start: int, end: int, granularity: int, fields: List[List[str]]):
+        self.start = start
+        self.granularity = granularity
+        num_rows = max(-(-(end - start) // granularity), 0)
+        self.offsets = np.concatenate([[0], np.cumsum([len(f) for f in fields])]).astype(np.int64)
+        self.block = np.full((num_rows, self.offsets[-1]), np.nan)
+        self.has_data = np.zeros(num_rows, dtype=bool)
+        self.names = [None] * self.offsets[-1]
+
+    def write(self, buffer: DatapointsBuffer, index: int, column_names: str = "externalId") -> bool:
+        """Writes the columns of the series at `index`. Returns False, writing nothing, if its timestamps are not on
+        the grid. Series write to separate columns, so several can write at once."""
+        rows, misaligned = np.divmod(buffer.timestamp - self.start, self.granularity)
+        if misaligned.any() or (len(rows) and (rows[0] < 0 or rows[-1] >= len(self.block))):
+            return False
+        first = self.offsets[index]
+        for k, f in enumerate(buffer.fields):
+            self.block[rows, first + k] = buffer.column(f)
+            self.names[first + k] = buffer.column_name(f, column_names)
+        self.has_data[rows] = True
+        return True
+
+    def to_pandas(self, columns: List[int] = None) -> pd.DataFrame:
+        """DataFrame on the block, with the columns of the series at positions `columns` (default all)."""
+        block = self.block if self.has_data.all() else self.block[self.has_data]
+        timestamps = self.start + self.granularity * np.flatnonzero(self.has_data)
+        if columns is not None:
+            cols = np.concatenate([np.arange(self.offsets[i], self.offsets[i + 1]) for i in columns] + [[]])
+            cols = cols.astype(np.int64)
+            if len(cols) < block.shape[1]:
+                block = block[:, cols]
+        else:
+            cols = np.arange(block.shape[1])
+        return pd.DataFrame(
+            block,
+            index=pd.DatetimeIndex(timestamps.astype(np.int64).view("datetime64[ms]")),
+            columns=[self.names[c] for c in cols],
+            copy=False,
+        )
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+from cognite.async_client.data_classes.datapoints import DatapointsBuffer
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8, arrays are returned through the pipe instead
+    shared_memory = None
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+class DatapointsDecoder:
+    """Decodes datapoints responses into DatapointsBuffers in a pool of processes, used when passed to the CogniteClient.
+
+    Decoding JSON and building the arrays of a page holds the GIL, so with many workers retrieving datapoints, the
+    decoding runs on about one core. With a decoder, workers only do the requests, and pass the raw response bytes to a
+    process which decodes them (with orjson if it is installed) and returns the arrays through shared memory, so
+    decoding runs on `processes` cores. Small responses are decoded by the worker itself, since sending them to a
+    process takes longer than decoding them.
+
+    Args:
+        processes (int): Number of decoding processes, by default the number of cores.
+        min_bytes (int): Size of the response below which it is decoded in the worker.
+    """
+
+    def __init__(self, processes=None, min_bytes=2 ** 16):
+        self.processes = processes or os.cpu_count()
+        self.min_bytes = min_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<DatapointsDecoder processes={self.processes} min_bytes={self.min_bytes}>"
+
+    @property
+    def executor(self):
+        """The process pool, started on first use. Processes are spawned rather than forked, since the client runs
+        threads which a forked process would inherit in an arbitrary state."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def decode(self, content, fields):
+        """Buffers for the items of a /timeseries/data/list response, with the fields of each item."""
+        if len(content) < self.min_bytes:
+            return _decode(content, fields)
+        return _attach(self.executor.submit(_decode_shared, content, fields).result())
+
+    async def decode_async(self, content, fields):
+        if len(content) < self.min_bytes:
+            return _decode(content, fields)
+        attached = Future()  # attached as soon as decoded, so the block is freed even if the caller is cancelled
+        decoded = self.executor.submit(_decode_shared, content, fields)
+        decoded.add_done_callback(functools.partial(_attach_when_done, attached))
+        return await asyncio.wrap_future(attached)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def _decode(content, fields):
+    return [DatapointsBuffer.load(item, item_fields) for item, item_fields in zip(_loads(content)["items"], fields)]
+
+
+def _decode_shared(content, fields):
+    """Decodes in a pool process. Numeric arrays are copied into one shared memory block, which the caller unlinks."""
+    buffers = _decode(content, fields)
+    arrays = [buffer._timestamp for buffer in buffers]
+    arrays += [column for buffer in buffers for column in buffer._columns.values() if column.dtype != object]
+    size = sum(array.nbytes for array in arrays)
+    if shared_memory is None or not size:
+        return None, buffers
+    shm = _create_shared_memory(size)
+    offset = 0
+    for buffer in buffers:
+        buffer._timestamp, offset = _share(shm, buffer._timestamp, offset)
+        for field, column in buffer._columns.items():
+            if column.dtype != object:
+                buffer._columns[field], offset = _share(shm, column, offset)
+    shm.close()
+    return shm.name, buffers
+
+
+def _create_shared_memory(size):
+    try:
+        return shared_memory.SharedMemory(create=True, size=size, track=False)
+    except TypeError:  # python < 3.13 tracks the block in this process, which would remove it when the pool exits
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _share(shm, array, offset):
+    """Copies an array into shared memory, returning the (dtype, offset, length) to pickle in its place."""
+    np.ndarray(array.shape, array.dtype, shm.buf, offset)[:] = array
+    return (array.dtype.str, offset, len(array)), offset + array.nbytes
+
+
+class _SharedBlock(np.ndarray):
+    """The bytes of an attached shared memory block. Arrays on the block keep it as their base, so the block is closed
+    once no array on it is left."""
+
+
+def _attach(decoded):
+    """Buffers whose numeric arrays are views on the shared memory block of `decoded`, without copying them. Buffers
+    of one response share a block, which is freed when the arrays of all of them are gone."""
+    name, buffers = decoded
+    if name is None:
+        return buffers
+    shm = shared_memory.SharedMemory(name=name)
+    shm.unlink()  # the name is removed right away, and the memory stays mapped until the block is closed
+    block = np.ndarray(shm.size, np.uint8, shm.buf).view(_SharedBlock)
+    weakref.finalize(block, shm.close)
+    for buffer in buffers:
+        buffer._timestamp = _view(block, buffer._timestamp)
+        for field, column in buffer._columns.items():
+            if isinstance(column, tuple):
+                buffer._columns[field] = _view(block, column)
+    return buffers
+
+
+def _attach_when_done(attached, decoded):
+    try:
+        attached.set_result(_attach(decoded.result()))
+    except Exception as e:
+        attached.set_exception(e)
+
+
+def _view(block, spec):
+    dtype, offset, length = spec
+    dtype = np.dtype(dtype)
+    return block[offset : offset + length * dtype.itemsize].view(dtype).view(np.ndarray)
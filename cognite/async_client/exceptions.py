@@ -8,3 +8,33 @@ class CogniteJobError(Exception, UserList):
 
     def __str__(self):
         return f"{len(self)} Exceptions occurred:\n" + "".join([str(ex) for ex in self])
+
+
+class JobCancelledError(Exception):
+    """The job was cancelled before it finished, see `Job.cancel`."""
+
+
+class JobTimeoutError(JobCancelledError):
+    """The job did not finish before its deadline."""
+
+
+class DatapointsInsertError(Exception):
+    """A failed request inserting datapoints.
+
+    Attributes:
+        exception (Exception): The error of the request.
+        failed (List[Dict]): The parts of time series in the request, as dicts with the id or externalId, and the
+            first and last timestamp and number of datapoints not inserted.
+    """
+
+    def __init__(self, exception, failed):
+        super().__init__(exception, failed)
+        self.exception = exception
+        self.failed = failed
+
+    def __str__(self):
+        ranges = ", ".join(
+            "{}[{}:{}] ({} datapoints)".format(f.get("externalId", f.get("id")), f["start"], f["end"], f["count"])
+            for f in self.failed
+        )
+        return "{} inserting datapoints into {}\n".format(self.exception, ranges)
@@ -1,3 +1,14 @@
-from cognite.async_client.jobs.base import Job
-from cognite.async_client.jobs.create import CreateJob
-from cognite.async_client.jobs.datapoints import CountDatapointsJob, DatapointsJob, DatapointsListJob
+from cognite.async_client.jobs.base import Job, MergeJob
+from cognite.async_client.jobs.create import CreateJob, UpdateJob, UpsertJob
+from cognite.async_client.jobs.datapoints import (
+    CountDatapointsJob,
+    CountDatapointsListJob,
+    DatapointsBatchJob,
+    DatapointsJob,
+    DatapointsListJob,
+    DatapointsStream,
+    LatestDatapointsJob,
+)
+from cognite.async_client.jobs.insert import InsertDatapointsBatchJob, InsertDatapointsJob
+from cognite.async_client.jobs.retrieve import ListJob, RetrieveMultipleJob
+from cognite.async_client.jobs.assets import AssetSubtreeJob
@@ -0,0 +1,82 @@
+import numpy as np
+
+from cognite.async_client.data_classes.assets import AssetTree
+from cognite.async_client.jobs import Job
+from cognite.async_client.jobs.retrieve import ListJob
+from cognite.async_client.retry import RetryPolicy
+from cognite.client.utils._auxiliary import split_into_chunks, to_camel_case
+
+
+class AssetSubtreeJob(Job):
+    """Retrieves the hierarchies below one or more assets, one level at a time, into an AssetTree.
+
+    The roots are retrieved first, and then the children of each level by listing with a `parentIds` filter, in
+    parallel jobs of `PARENT_IDS_LIMIT` parents each. Children are only requested for assets which have any, according
+    to their `childCount` aggregate. Items are kept as the dicts of the responses and packed into arrays level by
+    level, so no Asset objects are created.
+
+    Args:
+        identifiers (List[Dict]): The roots, as {"id": ..} or {"externalId": ..}.
+        depth (int): Number of levels below the roots to retrieve, None for all.
+    """
+
+    PARENT_IDS_LIMIT = 100
+    retry_policy = RetryPolicy()
+
+    def __init__(self, identifiers, api_client, depth=None):
+        super().__init__(api_client=api_client)
+        self.identifiers = identifiers
+        self.depth = depth
+        self.levels = []  # (ids, parent ids, columns) of each retrieved level
+        self.parents = None  # ids of the assets whose children are retrieved next
+
+    def __repr__(self):
+        return f"<AssetSubtreeJob roots={len(self.identifiers)} levels={len(self.levels)}>"
+
+    def initial_split(self):
+        if not self.parents:
+            return [self]  # retrieve the roots
+        return [
+            ListJob(
+                {"parentIds": chunk}, self.api_client, other_params={"aggregatedProperties": ["childCount"]}, load=False
+            )
+            for chunk in split_into_chunks(self.parents, self.PARENT_IDS_LIMIT)
+        ]
+
+    @property
+    def payload(self):
+        return {"items": self.identifiers, "aggregatedProperties": ["childCount"]}
+
+    def run(self):
+        return self._add_roots(self._post(self.api_client._RESOURCE_PATH + "/byids", json=self.payload))
+
+    async def run_async(self):
+        return self._add_roots(await self._post_async(self.api_client._RESOURCE_PATH + "/byids", json=self.payload))
+
+    def _add_roots(self, response):
+        self._add_level(response.json()["items"])
+        return self if self.parents else AssetTree.from_levels(self.levels)  # continue with the children
+
+    def _add_level(self, items):
+        self.levels.append(
+            (
+                np.array([item["id"] for item in items], dtype=np.int64),
+                np.array([item.get("parentId", -1) for item in items], dtype=np.int64),
+                {col: [item.get(to_camel_case(col)) for item in items] for col in AssetTree.COLUMNS},
+            )
+        )
+        if self.depth is not None and len(self.levels) > self.depth:
+            self.parents = []
+        else:  # without aggregates, any asset may have children
+            self.parents = [item["id"] for item in items if item.get("aggregates", {}).get("childCount", 1) > 0]
+
+    def merge(self):
+        self._add_level([item for items in self.children for item in items])
+        return self if self.parents else AssetTree.from_levels(self.levels)
+
+    def _set_result(self, result):
+        if result is self:  # a level is done, submit the jobs for the next one
+            self.children = None
+            self.api_client._cognite_client.job_queue.submit(self)
+        else:
+            super()._set_result(result)
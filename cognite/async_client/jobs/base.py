@@ -1,21 +1,36 @@
+import asyncio
+import functools
+import itertools
 import threading
+import time
 from concurrent.futures import Future
 
-from cognite.async_client.exceptions import CogniteJobError
+from cognite.async_client.exceptions import CogniteJobError, JobCancelledError, JobTimeoutError
+from cognite.async_client.metrics import JobStats
 
 
 class Job:
     PRIORITY_COUNTER = 1
+    retry_policy = None  # RetryPolicy for failed runs, set on jobs which are safe to run again
+    incremental_merge = False  # whether results of sub-jobs are folded in order as they finish, see `fold`
+    merge_fanout = None  # more sub-jobs than this are merged in a tree of MergeJobs, for jobs with incremental_merge
 
     def __init__(self, api_client=None):
         self._result = Future()
         self.api_client = api_client
         self.parent = None
         self.children = None
+        self.flow = None  # top-level job this job is part of, set when submitted
+        self.priority_class = None
+        self.weight = None
+        self.deadline = None  # time.monotonic() after which the job and its sub-jobs are cancelled
+        self.attempt = 1  # of the current run, counting failed runs which are retried
+        self.not_before = None  # time.monotonic() before which a failed job is not run again, set when retrying
         self.priority = self.PRIORITY_COUNTER
         Job.PRIORITY_COUNTER += 1
         self.callbacks = []
         self.callback_lock = threading.Lock()
+        self.stats = JobStats()
 
     def __lt__(self, other):
         return self.priority < other.priority
@@ -53,14 +68,86 @@ class Job:
             raise res  # collect_exc_info_and_raise(res)
         return res
 
+    def __await__(self):
+        """awaiting a job from a running event loop waits for and returns the result, like the `result` property"""
+        return self._await_result().__await__()
+
+    async def _await_result(self):
+        try:  # shielded, so cancelling the awaiting task cancels the job rather than just its future
+            res = await asyncio.shield(asyncio.wrap_future(self._result))
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+        if isinstance(res, CogniteJobError):
+            raise res
+        return res
+
     def _set_result(self, result):
-        if self.parent:
+        with self.callback_lock:
+            if self._result.done():
+                return  # cancelled while running
+            if not self.parent:
+                if self.memory_budget is not None:
+                    self.memory_budget.release(self)
+                self._result.set_result(self.process_callbacks(result))
+                return
             self._result.set_result("child_job_finished")  # should not duplicate data here, all goes to parent
-            self.parent._merge_child(result, self.child_index)
-        else:
-            with self.callback_lock:
-                result = self.process_callbacks(result)
-                self._result.set_result(result)
+        self.parent._merge_child(result, self.child_index)
+
+    def cancel(self, exception=None):
+        """Cancels the job with all of its sub-jobs and continuations. Queued sub-jobs are dropped instead of run, and
+        running ones stop at their next request. The result becomes a CogniteJobError with a JobCancelledError, or the
+        given exception. Returns False if the job was done already."""
+        if self._result.done():
+            return False
+        self._set_result(CogniteJobError([exception or JobCancelledError("{} was cancelled".format(self))]))
+        return True
+
+    @property
+    def cancelled(self):
+        """Whether the result of the job is no longer needed, since it or a job it is part of was cancelled, or passed
+        its deadline. Checked by workers before running a job and before retrying it."""
+        job = self
+        while job is not None:  # up through the parents to the top-level job
+            job._cancel_if_expired()
+            if job._result.done():
+                return True
+            job = job.parent if job.parent is not None else (job.flow if job.flow is not job else None)
+        return False
+
+    def _cancel_if_expired(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(JobTimeoutError("{} did not finish before its deadline".format(self)))
+
+    def _check_cancelled(self):
+        if self.cancelled:
+            raise JobCancelledError("{} was cancelled".format(self))
+
+    @property
+    def memory_budget(self):
+        """MemoryBudget of the job queue of the client, if it has one."""
+        job_queue = getattr(getattr(self.api_client, "_cognite_client", None), "job_queue", None)
+        return getattr(job_queue, "memory_budget", None)
+
+    def _hold(self, nbytes):
+        """Counts bytes of data kept by the job (negative when freed) towards the memory budget of its top-level job."""
+        if nbytes and self.memory_budget is not None and not (self.flow is None or self.flow._result.done()):
+            self.memory_budget.add(self.flow, nbytes)
+
+    def _post(self, url_path, json=None):
+        """Posts through the api client, counting the request in the job's stats."""
+        self._check_cancelled()
+        self.stats.requests += 1
+        response = self.api_client._post(url_path, json=json)
+        self.stats.record_response(response)
+        return response
+
+    async def _post_async(self, url_path, json=None):
+        self._check_cancelled()
+        self.stats.requests += 1
+        response = await self.api_client._post_async(url_path, json=json)
+        self.stats.record_response(response)
+        return response
 
     def splittable(self):
         return False
@@ -72,26 +159,55 @@ class Job:
     def run(self):
         raise NotImplementedError("The `run` method of a Job needs to be implemented.")
 
+    async def run_async(self):
+        """coroutine version of `run` used by the asyncio engine. Defaults to running `run` on the executor of the
+        AsyncJobQueue, jobs doing their requests through `api_client._post_async` should override this."""
+        return await asyncio.get_event_loop().run_in_executor(None, self.run)
+
     def initial_split(self):
         """splits job into initial batches."""
         return [self]
 
     def merge(self):
         """merges results and updates future when all child jobs are done"""
-        result = self.children[0]
-        for child in self.children[1:]:
-            result.extend(child)  # should work for resource lists etc
-        return result
+        return functools.reduce(self.fold, self.children, None)
+
+    def fold(self, merged, result):
+        """Merges the result of a sub-job into the merged results of the sub-jobs before it, which is None for the
+        first one. With `incremental_merge`, this is called as soon as the sub-jobs before are done, and with
+        `merge_fanout` also on the merged results of groups of sub-jobs, so it should be associative."""
+        if merged is None:
+            return result
+        merged.extend(result)  # should work for resource lists etc
+        return merged
 
     def _handle_split(self, subjobs):
         if subjobs and not (len(subjobs) == 1 and subjobs[0] == self):  # if split
-            self.children = subjobs
-            self.merge_lock = threading.Lock()
-            for child_ix, subjob in enumerate(self.children):
-                subjob.child_index = child_ix
-                subjob.parent = self
+            for subjob in subjobs:
+                if "retry_policy" in vars(self) and subjob.retry_policy is type(subjob).retry_policy is not None:
+                    subjob.retry_policy = self.retry_policy
+            children = subjobs
+            while self.incremental_merge and self.merge_fanout and len(children) > self.merge_fanout:
+                groups = []
+                for i in range(0, len(children), self.merge_fanout):
+                    groups.append(MergeJob(self))
+                    groups[-1]._set_children(children[i : i + self.merge_fanout])
+                children = groups
+            self._set_children(children)
         return subjobs
 
+    def _set_children(self, children):
+        self.children = children
+        self.merge_lock = threading.Lock()
+        self._finished = itertools.count(1)  # next() on a count is atomic, so only the last sub-job sees len(children)
+        self._folded = 0  # number of sub-jobs whose results are in self._merged
+        self._merged = None
+        self._merge_errors = []
+        for child_ix, child in enumerate(children):
+            child.child_index = child_ix
+            child.parent = self
+            child.flow = self.flow
+
     def _split(self, nparts):
         return self._handle_split(self.split(nparts))
 
@@ -99,17 +215,111 @@ class Job:
         return self._handle_split(self.initial_split())
 
     def _merge_child(self, result, child_index):
-        with self.merge_lock:
-            self.children[child_index] = result
-            if all([not isinstance(j, Job) for j in self.children]):  # done with all sub-jobs
+        if self.cancelled:
+            return  # so the result is not needed
+        if self.memory_budget is not None:
+            result = self.memory_budget.spill(self.flow, result)
+        self.children[child_index] = result
+        if self.incremental_merge:
+            self._fold_ready(blocking=False)
+        if next(self._finished) == len(self.children):  # done with all sub-jobs
+            if self.incremental_merge:
+                self._fold_ready(blocking=True)  # whatever another thread is still folding
+                exc = self._merge_errors
+            else:
                 exc = [e for e in self.children if isinstance(e, CogniteJobError)]
-                self._set_result(sum(exc, CogniteJobError()) if exc else self.merge())
+            if exc:
+                self._set_result(sum(exc, CogniteJobError()))
+            else:
+                self._set_result(self._merged if self.incremental_merge else self.merge())
+
+    def _fold_ready(self, blocking):
+        """Folds the results of finished sub-jobs which directly follow the folded ones, and frees them. One thread
+        folds at a time, while others just leave their result. The folding thread looks again after releasing the
+        lock, so a result left while it was releasing is not missed."""
+        while self._next_ready() and self.merge_lock.acquire(blocking=blocking):
+            try:
+                while self._next_ready():
+                    result, self.children[self._folded] = self.children[self._folded], None
+                    if isinstance(result, CogniteJobError):
+                        self._merge_errors.append(result)
+                    elif not self._merge_errors:  # after an error, the result is not needed
+                        try:
+                            self._merged = self.fold(self._merged, result)
+                        except Exception as e:
+                            self._merge_errors.append(CogniteJobError([e]))
+                    self._folded += 1
+            finally:
+                self.merge_lock.release()
+
+    def _next_ready(self):
+        return self._folded < len(self.children) and not isinstance(self.children[self._folded], Job)
+
+    @staticmethod
+    def _is_continuation(result):
+        """run can return a Job, or a non-empty list of Jobs, to be submitted instead of storing a result"""
+        if isinstance(result, list):
+            return bool(result) and all(isinstance(j, Job) for j in result)
+        return isinstance(result, Job)
+
+    def _retry_delay(self, exception, attempt):
+        """Seconds to wait before running again after a failed attempt, or None if the job fails."""
+        delay = self.retry_policy.delay(exception, attempt) if self.retry_policy is not None else None
+        if delay is not None:
+            self.stats.retries += 1
+        return delay
+
+    def _store_or_retry(self, exception):
+        """Sets `not_before` if the job should run again after failing with `exception`, and otherwise stores it as
+        the result. The queue puts retried jobs back once their backoff has passed."""
+        delay = self._retry_delay(exception, self.attempt) if not self.cancelled else None
+        if delay is not None:
+            self.attempt += 1
+            self.not_before = time.monotonic() + delay
+            return
+        if not isinstance(exception, JobCancelledError):
+            self.stats.errors += 1
+        self._set_result(CogniteJobError([exception]))
 
     def _run_and_store(self):
+        self.not_before = None
         try:
             result = self.run()
-            if isinstance(result, Job):
-                return result  # continue Job instead of storing
         except Exception as e:
-            result = CogniteJobError([e])
+            return self._store_or_retry(e)
+        self.attempt = 1
+        if self._is_continuation(result):
+            return result  # continue Job(s) instead of storing
         self._set_result(result)
+
+    async def _run_and_store_async(self):
+        self.not_before = None
+        loop = asyncio.get_event_loop()
+        try:
+            result = await self.run_async()
+        except Exception as e:
+            return await loop.run_in_executor(None, self._store_or_retry, e)
+        self.attempt = 1
+        if self._is_continuation(result):
+            return result  # continue Job(s) instead of storing
+        await loop.run_in_executor(None, self._set_result, result)  # merges and callbacks run off the loop
+
+
+class MergeJob(Job):
+    """Node of the merge tree of a job split into more than its `merge_fanout` sub-jobs. It is never queued, and is
+    done when its group of sub-jobs is, with their results folded by `owner` into one, which the parent node then
+    folds like the result of a single sub-job. Groups merge in parallel, and no node folds more than `merge_fanout`
+    results."""
+
+    incremental_merge = True
+
+    def __init__(self, owner):
+        super().__init__(api_client=owner.api_client)
+        self.owner = owner
+        self.flow = owner.flow
+
+    def __repr__(self):
+        return f"<MergeJob owner={self.owner} children={len(self.children)}>"
+
+    def fold(self, merged, result):
+        return result if merged is None else self.owner.fold(merged, result)
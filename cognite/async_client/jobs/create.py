@@ -1,27 +1,69 @@
+import hashlib
+import json
+
 from cognite.async_client.jobs import Job
+from cognite.async_client.retry import RetryPolicy
 from cognite.async_client.utils import to_list
 from cognite.client.exceptions import CogniteAPIError
 from cognite.client.utils._auxiliary import split_into_chunks
 
+# Fields which are accepted on create but never returned, so they can not be compared with the stored resource
+WRITE_ONLY_FIELDS = {"parentExternalId", "legacyName"}
+
+
+def content_hash(item):
+    """Hash of the dumped (camel case) fields of a resource, used to detect unchanged resources."""
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode()).hexdigest()
+
 
 class CreateJob(Job):
-    def __init__(self, resources, api_client, upsert=False):
+    """Creates resources, or upserts them by external id.
+
+    By default, upserting tries to create each chunk and updates the resources reported as duplicated. With `lookup`,
+    the existing resources of each chunk are retrieved first (see UpsertJob), which saves the failing create when most
+    resources already exist.
+    """
+
+    incremental_merge = True  # the results of chunks are appended in order as they finish
+    merge_fanout = 64
+
+    def __init__(
+        self, resources, api_client, upsert=False, lookup=False, skip_unchanged=False, known_external_ids=None
+    ):
         super().__init__(api_client=api_client)
         self.resources = to_list(resources)
         self.upsert = upsert
+        self.lookup = lookup or skip_unchanged or known_external_ids is not None
+        self.skip_unchanged = skip_unchanged
+        self.known_external_ids = known_external_ids
+        self._dumps = {}
         if upsert and any([res.external_id is None for res in self.resources]):
             raise ValueError("can only upsert for objects with external_id")
 
     def initial_split(self):
+        if self.parent is not None:  # a chunk continuing an UpsertJob
+            return [self]
+        if self.upsert and self.lookup:
+            chunk_size = min(
+                self.api_client._CREATE_LIMIT, self.api_client._UPDATE_LIMIT, self.api_client._RETRIEVE_LIMIT
+            )
+            return [
+                UpsertJob(chunk, self.api_client, self.skip_unchanged, self.known_external_ids)
+                for chunk in split_into_chunks(self.resources, chunk_size)
+            ]
         return [
             CreateJob(resources=chunk, api_client=self.api_client, upsert=self.upsert)
             for chunk in split_into_chunks(self.resources, self.api_client._CREATE_LIMIT)
         ]
 
+    def dump(self, res):
+        """Dumps a resource once, so retrying part of a chunk does not serialize it again."""
+        if id(res) not in self._dumps:
+            self._dumps[id(res)] = res.dump(camel_case=True)
+        return self._dumps[id(res)]
+
     def create(self, resources):
-        response = self.api_client._post(
-            self.api_client._RESOURCE_PATH, {"items": [res.dump(camel_case=True) for res in resources]}
-        )
+        response = self._post(self.api_client._RESOURCE_PATH, {"items": [self.dump(res) for res in resources]})
         return self.api_client._LIST_CLASS._load(response.json()["items"])
 
     def update(self, resources):
@@ -31,7 +73,7 @@ class CreateJob(Job):
             )
             for res in resources
         ]
-        response = self.api_client._post(self.api_client._RESOURCE_PATH + "/update", {"items": patches})
+        response = self._post(self.api_client._RESOURCE_PATH + "/update", {"items": patches})
         return self.api_client._LIST_CLASS._load(response.json()["items"])
 
     def run(self):
@@ -50,11 +92,109 @@ class CreateJob(Job):
         else:
             return self.create(self.resources)
 
+    def fold(self, merged, result):
+        if not self.upsert or merged is None:
+            return super().fold(merged, result)
+        for key, resources in result.items():
+            merged[key].extend(resources)
+        return merged
+
+
+class UpdateJob(CreateJob):
+    """Updates resources known to exist, creating any that turn out to be missing."""
+
+    retry_policy = RetryPolicy()  # setting the same fields again is harmless, unlike creating resources again
+
+    def __init__(self, resources, api_client):
+        super().__init__(resources, api_client, upsert=True)
+
+    def run(self):
+        try:
+            updated = self.update(self.resources)
+            created = self.api_client._LIST_CLASS([])
+        except CogniteAPIError as ex:
+            if not ex.missing:
+                raise ex
+            missing = {res.get("externalId") for res in ex.missing}
+            created = self.create([res for res in self.resources if res.external_id in missing])
+            rest = [res for res in self.resources if res.external_id not in missing]
+            updated = self.update(rest) if rest else self.api_client._LIST_CLASS([])
+        return {"created": created, "updated": updated}
+
+
+class UpsertJob(CreateJob):
+    """Upserts one chunk of resources by first looking up which of them exist.
+
+    Resources in `known_external_ids` are taken to exist, the others are retrieved by external id in one request. The
+    chunk then continues as a create and an update job which run in parallel. With `skip_unchanged`, resources whose
+    fields all equal the stored ones (or whose hash equals the one in `known_external_ids`) are not updated.
+
+    Args:
+        known_external_ids (Dict[str,str]): External ids known to exist, with the content hash of the resource as last
+            upserted. Updated with the results of the chunk, so passing the same dict to later upserts avoids lookups.
+    """
+
+    retry_policy = RetryPolicy()
+    incremental_merge = False  # merged once both the create and update job are done, see merge
+
+    def __init__(self, resources, api_client, skip_unchanged=False, known_external_ids=None):
+        super().__init__(resources, api_client, upsert=True)
+        self.skip_unchanged = skip_unchanged
+        self.known_external_ids = known_external_ids
+        self.hashes = {res.external_id: content_hash(self.dump(res)) for res in self.resources}
+        self.unchanged = self.api_client._LIST_CLASS([])
+
+    def retrieve_existing(self, external_ids):
+        """Dict of external id to the stored item, for those of `external_ids` which exist."""
+        if not external_ids:
+            return {}
+        response = self._post(
+            self.api_client._RESOURCE_PATH + "/byids",
+            {"items": [{"externalId": xid} for xid in external_ids], "ignoreUnknownIds": True},
+        )
+        return {item["externalId"]: item for item in response.json()["items"]}
+
+    def is_unchanged(self, res, stored):
+        item = {k: v for k, v in self.dump(res).items() if k not in WRITE_ONLY_FIELDS}
+        return content_hash({k: stored.get(k) for k in item}) == content_hash(item)
+
+    def run(self):
+        known = self.known_external_ids if self.known_external_ids is not None else {}
+        existing = self.retrieve_existing([res.external_id for res in self.resources if res.external_id not in known])
+        to_create, to_update, unchanged = [], [], []
+        for res in self.resources:
+            xid = res.external_id
+            if xid in existing:
+                skip = self.skip_unchanged and self.is_unchanged(res, existing[xid])
+            elif xid in known:
+                skip = self.skip_unchanged and known[xid] == self.hashes[xid]
+            else:
+                to_create.append(res)
+                continue
+            (unchanged if skip else to_update).append(res)
+        self.unchanged = self.api_client._LIST_CLASS(unchanged)
+
+        jobs = []
+        if to_create:  # create-first upsert, in case the resources are created concurrently
+            jobs.append(CreateJob(to_create, self.api_client, upsert=True))
+        if to_update:
+            jobs.append(UpdateJob(to_update, self.api_client))
+        if not jobs:
+            return self.merge()
+        for job in jobs:
+            job._dumps = self._dumps
+        return self._handle_split(jobs)  # continue as create and update jobs, merged back into this one
+
     def merge(self):
-        if not self.upsert:
-            return super().merge()
-        result = self.children[0]
-        for child in self.children[1:]:
-            result["created"].extend(child["created"])
-            result["updated"].extend(child["updated"])
+        result = {
+            "created": self.api_client._LIST_CLASS([]),
+            "updated": self.api_client._LIST_CLASS([]),
+            "unchanged": self.unchanged,
+        }
+        for child in self.children or []:
+            for key, resources in child.items():
+                result[key].extend(resources)
+        if self.known_external_ids is not None:
+            for res in self.resources:
+                self.known_external_ids[res.external_id] = self.hashes[res.external_id]
         return result
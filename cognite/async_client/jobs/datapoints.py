@@ -1,32 +1,326 @@
+import asyncio
+import collections
 import copy
 import math
+import threading
+import warnings
+import weakref
 
+import numpy as np
+import pandas as pd
+
+from cognite.async_client.cache import DatapointsCache, LatestDatapointsCache
+from cognite.async_client.data_classes.datapoints import DatapointsBuffer, DatapointsGrid
+from cognite.async_client.exceptions import CogniteJobError, JobCancelledError
 from cognite.async_client.jobs import Job
-from cognite.async_client.utils import to_list
+from cognite.async_client.retry import RetryPolicy
+from cognite.async_client.utils import timedelta_to_granularity, to_list
 from cognite.client.data_classes import Datapoints, DatapointsList
+from cognite.client.exceptions import CogniteAPIError
 from cognite.client.utils import timestamp_to_ms
+from cognite.client.utils._auxiliary import split_into_chunks
 from cognite.client.utils._time import granularity_to_ms, granularity_unit_to_ms
 
 
+def _decode(api_client, response, fields):
+    """Buffers for the items of a datapoints response, decoded by the client's DatapointsDecoder if it has one."""
+    decoder = getattr(getattr(api_client, "_cognite_client", None), "datapoints_decoder", None)
+    if decoder is None:
+        return [DatapointsBuffer.load(item, item_fields) for item, item_fields in zip(response.json()["items"], fields)]
+    return decoder.decode(response.content, fields)
+
+
+async def _decode_async(api_client, response, fields):
+    decoder = getattr(getattr(api_client, "_cognite_client", None), "datapoints_decoder", None)
+    if decoder is None:
+        return _decode(api_client, response, fields)
+    return await decoder.decode_async(response.content, fields)
+
+
+class DatapointsStream:
+    """Iterator over chunks of datapoints which yields DatapointsBuffer pages as they are retrieved.
+
+    Chunks of each time series are yielded in time order, also when the series is split over several workers: pages
+    arriving ahead of an unfinished earlier range are held back until that range is complete. At most about
+    `max_buffered_chunks` chunks, ready or held back, are kept; workers delivering pages beyond that wait for the
+    consumer, which pauses fetching. Pages still arrive while the consumer waits for a held back range, so that range
+    can complete. Breaking out of the iteration closes the stream, releases any waiting workers and cancels the job, and
+    so does dropping a stream without iterating through it, once it is garbage collected.
+
+    Args:
+        max_buffered_chunks (int): Number of buffered chunks after which workers wait for the consumer.
+        checkpoint (DatapointsCheckpoint): Records the progress of the consumer, and where series resume.
+    """
+
+    def __init__(self, max_buffered_chunks=100, checkpoint=None):
+        self.buffer = StreamBuffer(max_buffered_chunks, checkpoint)  # the part referenced by the jobs
+        weakref.finalize(self, self.buffer.close)
+
+    @property
+    def job(self):
+        return self.buffer.job
+
+    @property
+    def checkpoint(self):
+        return self.buffer.checkpoint
+
+    def close(self):
+        self.buffer.close()
+
+    def _consumed(self, series_index, end):
+        if self.checkpoint is not None and series_index in self.buffer._keys:
+            self.checkpoint.advance(self.buffer._keys[series_index], end)
+
+    def __iter__(self):
+        return (chunk for _, _, chunk in self.progress() if len(chunk))
+
+    def progress(self):
+        """Iterates over (series index, end, chunk) for the chunks as they are ready, including empty ones. The chunks
+        of a series up to each one hold all of its datapoints before `end`."""
+        buffer = self.buffer
+        consumed = None  # the chunk last yielded, which the consumer is done with when it asks for the next one
+        try:
+            while True:
+                chunk = None
+                with buffer._condition:
+                    buffer._condition.wait_for(lambda: buffer._ready or buffer._finished)
+                    if buffer._ready:
+                        series_index, end, chunk = buffer._ready.popleft()
+                        buffer._condition.notify_all()
+                if consumed is not None:
+                    self._consumed(*consumed)
+                if chunk is None:
+                    if buffer._error is not None:
+                        raise buffer._error
+                    return
+                consumed = series_index, end
+                yield series_index, end, chunk
+        finally:
+            self.close()
+            if self.checkpoint is not None:
+                self.checkpoint.save()
+
+
+class StreamBuffer:
+    """Chunks of a DatapointsStream, put by the workers and taken by the consumer. Jobs only reference the buffer, so
+    the stream can be garbage collected while they run."""
+
+    def __init__(self, max_buffered_chunks=100, checkpoint=None):
+        self.max_buffered_chunks = max_buffered_chunks
+        self.checkpoint = checkpoint
+        self.job = None
+        self._keys = {}  # series index -> checkpoint key
+        self._cursor = {}  # series index -> start of the next range to yield
+        self._pending = collections.defaultdict(dict)  # series index -> {range start: (range end, chunk)}
+        self._num_pending = 0
+        self._ready = collections.deque()
+        self._condition = threading.Condition()
+        self._finished = False
+        self._closed = False
+        self._error = None
+
+    def _register(self, series_index, start, key=None):
+        self._cursor[series_index] = start
+        if key is not None:
+            self._keys[series_index] = key
+
+    def _put(self, series_index, start, end, chunk):
+        with self._condition:
+            if self._closed:
+                return
+            pending = self._pending[series_index]
+            pending[start] = (end, chunk)
+            self._num_pending += 1
+            while self._cursor[series_index] in pending:
+                end, chunk = pending.pop(self._cursor[series_index])
+                self._num_pending -= 1
+                self._cursor[series_index] = end
+                self._ready.append((series_index, end, chunk))
+            self._condition.notify_all()
+
+    @property
+    def full(self):
+        """Whether workers should wait: while nothing is ready, the consumer waits for a range which is still being
+        retrieved, and workers go on so it completes."""
+        if self._closed or not self._ready:
+            return False
+        return len(self._ready) + self._num_pending >= self.max_buffered_chunks
+
+    def wait_for_room(self):
+        """Blocks a worker while the consumer is behind."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self.full)
+
+    def _finish(self, result):
+        with self._condition:
+            self._finished = True
+            self._error = result if isinstance(result, Exception) else None
+            self._condition.notify_all()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._ready.clear()
+            self._pending.clear()
+            self._num_pending = 0
+            self._condition.notify_all()
+        if self.job is not None:
+            self.job.cancel()  # no-op once the job is done
+
+
+_PENDING = object()  # result of a leader which did not finish yet
+
+
 class DatapointsListJob(Job):
-    def __init__(self, ts_items: list, api_client):
+    BATCH_SIZE = 100  # maximum number of time series in one request
+    MAX_GRID_BYTES = 2 ** 28  # larger grids, e.g. of sparse series over long ranges, are concatenated per series
+
+    def __init__(self, ts_items: list, api_client, as_dataframe=False, stream=None, plan_splits=False, cache=None):
         super().__init__(api_client=api_client)
         self.ts_items = ts_items
+        self.as_dataframe = as_dataframe
+        self.stream = stream.buffer if stream is not None else None  # jobs do not keep the stream alive
+        self.plan_splits = plan_splits
+        self.cache = cache
+        self.grid = None
+        if stream is not None:
+            self.stream.job = self
+            self.add_callback(self.stream._finish)
 
     def initial_split(self):
-        return [DatapointsJob(ts_item, self.api_client) for ts_item in self.ts_items]
+        jobs = [
+            DatapointsJob(
+                ts_item,
+                self.api_client,
+                stream=self.stream,
+                series_index=i,
+                plan_splits=self.plan_splits,
+                cache=self.cache,
+            )
+            for i, ts_item in enumerate(self.ts_items)
+        ]
+        if self.stream is not None:
+            checkpoint = self.stream.checkpoint
+            resumed = []
+            for job in jobs:
+                key = None
+                if checkpoint is not None:
+                    key = DatapointsCache.key(job.query)
+                    job.query["start"] = max(job.query["start"], checkpoint.get(key) or job.query["start"])
+                    if job.query["start"] >= job.query["end"]:
+                        continue  # consumed in an earlier export
+                self.stream._register(job.series_index, job.query["start"], key)
+                resumed.append(job)
+            jobs = resumed or [self]
+        return jobs
+
+    def _initial_split(self):
+        """Submits the first page of all time series which can share a request as DatapointsBatchJobs.
+
+        Aggregate jobs know their number of datapoints, and are packed with exactly the limit they need. Raw data
+        jobs get an equal share of the request limit, and continue as separate jobs when they fill it."""
+        jobs = super()._initial_split()
+        if jobs == [self]:
+            return jobs  # nothing left to retrieve
+        jobs = [subjob for job in jobs for subjob in job._initial_split()]  # cached parts
+        if self.as_dataframe:
+            self.grid = self._make_grid()
+            if self.grid is not None:
+                self._hold(self.grid.block.nbytes)
+        batchable = [j for j in jobs if isinstance(j, DatapointsJob) and j.batchable()]
+        batches = []
+        raw = [j for j in batchable if not j.aggregate_job]
+        for i in range(0, len(raw), self.BATCH_SIZE):
+            chunk = raw[i : i + self.BATCH_SIZE]
+            batches.append([(j, j.limit // len(chunk)) for j in chunk])
+        batch, total = [], 0
+        for job in [j for j in batchable if j.aggregate_job]:
+            need = job.expected_count()
+            if batch and (len(batch) == self.BATCH_SIZE or total + need > job.limit):
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append((job, need))
+            total += need
+        batches.append(batch)
+
+        batches = [b for b in batches if len(b) > 1]  # a batch of one is just the job itself
+        batched = {id(j) for b in batches for j, _ in b}
+        return [j for j in jobs if id(j) not in batched] + [DatapointsBatchJob(b, self.api_client) for b in batches]
+
+    def _make_grid(self):
+        """DatapointsGrid for the DataFrame, if all series are aggregates over the same aligned range and granularity,
+        and the grid fits in `MAX_GRID_BYTES`."""
+        series = self.children or []
+        if not series or not all(job.aggregate_job for job in series):
+            return None
+        if len({(job.query["start"], job.query["end"], job.query["granularity"]) for job in series}) > 1:
+            return None
+        try:
+            granularity = series[0].granularity
+        except ValueError:  # e.g. months, which have no fixed length
+            return None
+        num_rows = -(-(series[0].query["end"] - series[0].query["start"]) // granularity)
+        if 8 * num_rows * sum(len(job.fields) for job in series) > self.MAX_GRID_BYTES:
+            return None  # sized by the range rather than the data, which may be far less
+        return DatapointsGrid(series[0].query["start"], series[0].query["end"], granularity, [j.fields for j in series])
+
+    def _merge_child(self, result, child_index):
+        if self.grid is not None and isinstance(result, DatapointsBuffer) and self.grid.write(result, child_index):
+            self._hold(-result.resident_nbytes)
+            result = None  # written into the grid, where the DataFrame will be built on
+        super()._merge_child(result, child_index)
+
+    def run(self):
+        self.children = []
+        return self.merge()
 
     def merge(self):
+        if self.stream is not None:
+            return None  # all data went to the stream
+        if self.grid is not None:
+            off_grid = [i for i, child_res in enumerate(self.children) if child_res is not None]
+            if not off_grid:
+                return self.grid.to_pandas()
+            on_grid = [i for i, child_res in enumerate(self.children) if child_res is None]
+            dfs = [self.grid.to_pandas(on_grid)] + [self.children[i].to_pandas() for i in off_grid]
+            return pd.concat(dfs, axis="columns")
+        if self.as_dataframe:  # build directly from the retrieved arrays, skipping Datapoints objects
+            dfs = [child_res.to_pandas() for child_res in self.children]
+            return pd.concat(dfs, axis="columns") if dfs else pd.DataFrame()
         result = DatapointsList([], cognite_client=self.api_client)
         for child_res in self.children:
-            result.append(child_res)  # expected fields in case of aggregates
+            result.append(child_res.to_datapoints())  # expected fields in case of aggregates
         return result
 
 
 class DatapointsJob(Job):
-    def __init__(self, query, api_client):
+    """Retrieves the datapoints of one time series, paginating and splitting the time range as needed.
+
+    When workers are idle, jobs split the rest of their range into parts of equal length, as many as fit the expected
+    number of datapoints in requests. The expected number comes from the density of the pages retrieved so far, so a
+    job starting at t=0 splits once its first page shows where and how densely its data is. Before any page, raw data
+    jobs at t=0 do not split, and others assume up to one datapoint per granularity interval (millisecond for raw data).
+    With `plan_splits`, raw data jobs first retrieve count aggregates over the range and split into parts of about
+    `_DPS_LIMIT` datapoints each instead.
+
+    With a `cache`, the range is first split into the parts covered by the DatapointsCache and the gaps in between,
+    and the job retrieving each gap stores its result in the cache. With a DatapointsCoalescer, parts of the range which
+    other jobs are retrieving at the same time are taken from their results.
+
+    The parts are appended to the datapoints retrieved before the split as soon as the parts before them are done,
+    freeing their buffers early, and ranges split into many parts are merged in a tree of groups of `merge_fanout`."""
+
+    retry_policy = RetryPolicy()  # pages retrieved before a failure are kept, and retrying continues after them
+    incremental_merge = True
+    merge_fanout = 64
+
+    def __init__(self, query, api_client, stream=None, series_index=None, plan_splits=False, cache=None):
         super().__init__(api_client=api_client)
         self.query = query
+        self.stream = stream
+        self.series_index = series_index
+        if stream is not None and query.get("includeOutsidePoints"):
+            raise ValueError("include_outside_points is not supported when streaming datapoints")
         self.query["start"] = timestamp_to_ms(self.query["start"])
         self.query["end"] = timestamp_to_ms(self.query["end"])
         if self.query.get("aggregates"):
@@ -35,33 +329,155 @@ class DatapointsJob(Job):
         if self.aggregate_job:
             self.query["start"] = self._align_with_granularity_unit(self.query["start"], self.query["granularity"])
             self.query["end"] = self._align_with_granularity_unit(self.query["end"], self.query["granularity"])
-        self.retrieved_data = Datapoints()
+        self.retrieved_data = DatapointsBuffer(self.fields)
+        self.plan_splits = plan_splits and not self.aggregate_job and not self.query.get("limit")
+        self.planned_ranges = None
+        self.planned = False  # planned parts hold about one page, further splits would only make smaller requests
+        self.observed = (0, 0)  # datapoints in full pages so far, and the milliseconds they span
+        if stream is not None or self.query.get("limit") or self.query.get("includeOutsidePoints"):
+            cache = None  # results are not complete ranges
+        self.cache = cache
+        self.cache_checked = False
+        self.cache_start = self.query["start"]
+        self.coalesce_checked = False
 
     def __repr__(self):
         return f"<DataPointsJob query={self.query.__repr__()}>"
 
     def splittable(self):
-        return not self.query.get("limit") and self.query["start"] > 0  # don't split jobs at t=0
+        if self.plan_splits or self.planned or self.query.get("limit"):
+            return False
+        return self.density is not None or self.query["start"] > 0  # at t=0, the data may start anywhere
+
+    @property
+    def density(self):
+        """Datapoints per millisecond observed in the pages retrieved so far, None before the first full page."""
+        count, span = self.observed
+        return count / span if span else None
+
+    def expected_points(self):
+        """Number of datapoints expected in the rest of the range, at the observed density or one per interval."""
+        span = self.query["end"] - self.query["start"]
+        density = self.density
+        return span * density if density is not None else span / self.granularity
+
+    def batchable(self):
+        if self.aggregate_job and self.expected_count() > self.limit // 2:
+            return False  # large enough for its own requests
+        return not self.plan_splits and not self.query.get("limit") and not self.children
+
+    def expected_count(self):
+        """Number of datapoints in an aggregate job, which are at most one per granularity interval."""
+        return math.ceil((self.query["end"] - self.query["start"]) / self.granularity)
+
+    def initial_split(self):
+        if self.planned_ranges and len(self.planned_ranges) > 1:
+            subjobs = []
+            for start, end in self.planned_ranges:
+                subjob = DatapointsJob(
+                    {**self.query, "start": start, "end": end}, self.api_client, self.stream, self.series_index
+                )
+                subjob.planned = subjob.coalesce_checked = True
+                subjobs.append(subjob)
+            return subjobs
+        if self.cache is not None and not self.cache_checked:
+            self.cache_checked = True
+            return self._split_cached()
+        if self.coalescer is not None and self.coalescable():
+            self.coalesce_checked = True
+            return self.coalescer.claim(self, self._make_part, self._make_shared)
+        return [self]
+
+    @property
+    def coalescer(self):
+        """DatapointsCoalescer of the client, if it has one."""
+        return getattr(getattr(self.api_client, "_cognite_client", None), "datapoints_coalescer", None)
+
+    def coalescable(self):
+        if self.coalesce_checked or self.stream is not None or self.planned:
+            return False
+        return not self.query.get("limit") and not self.query.get("includeOutsidePoints")
+
+    def _make_part(self, start, end):
+        """Job retrieving a gap between the parts shared with other jobs, merged into this one, which stores the whole
+        range in the cache."""
+        part = DatapointsJob({**self.query, "start": start, "end": end}, self.api_client, plan_splits=self.plan_splits)
+        part.cache_checked = part.coalesce_checked = True
+        return part
+
+    def _make_shared(self, leader, start, end):
+        return SharedDatapointsJob(leader, {**self.query, "start": start, "end": end}, self.api_client)
+
+    def _handle_split(self, subjobs):
+        subjobs = super()._handle_split(subjobs)
+        shared = [j for j in subjobs if isinstance(j, SharedDatapointsJob)]
+        if not shared:
+            return subjobs
+        queued = [
+            j for j in subjobs if not isinstance(j, SharedDatapointsJob)
+        ]  # before attaching, which can merge results
+        for job in shared:
+            job._attach()
+        return queued
+
+    def _split_cached(self):
+        key = self.cache.key(self.query)
+        parts = self.cache.lookup(key, self.query["start"], self.query["end"], self.fields)
+        if len(parts) == 1 and parts[0][2] is None:
+            return self.initial_split()  # nothing cached, retrieve (or share) and store the whole range
+        subjobs = []
+        for start, end, cached in parts:
+            if cached is None:
+                subjob = DatapointsJob(
+                    {**self.query, "start": start, "end": end},
+                    self.api_client,
+                    plan_splits=self.plan_splits,
+                    cache=self.cache,
+                )
+                subjob.cache_checked = subjob.coalesce_checked = True
+                subjobs.append(subjob)
+            else:
+                subjobs.append(CachedDatapointsJob(cached))
+        self.cache = None  # storing is up to the subjobs retrieving the gaps
+        return subjobs
+
+    def _set_result(self, result):
+        if self.coalesce_checked and self.coalescer is not None:
+            self.coalescer.finish(self, result if isinstance(result, DatapointsBuffer) else None)
+        if self.cache is not None and isinstance(result, DatapointsBuffer):
+            cutoff = self.cache.cutoff()
+            if cutoff < self.query["end"]:  # only store whole granularity intervals
+                end = self.cache_start + (cutoff - self.cache_start) // self.granularity * self.granularity
+            else:
+                end = self.query["end"]
+            key = self.cache.key({**self.query, "start": self.cache_start})  # the start moves on with each page
+            try:
+                if end > self.cache_start:
+                    self.cache.store(key, self.cache_start, end, result)
+            except OSError as e:  # the result is still good without the cache
+                warnings.warn("Could not store datapoints in the cache: {}".format(e))
+        super()._set_result(result)
 
     @property
     def granularity(self):
         return granularity_to_ms(self.query.get("granularity")) if self.aggregate_job else 1
 
+    @property
+    def fields(self):
+        return self.query.get("aggregates", ["value"])
+
     @property
     def limit(self):
         return self.api_client._DPS_LIMIT_AGG if self.aggregate_job else self.api_client._DPS_LIMIT
 
     def split(self, nparts):
-        if nparts == 1:
+        span = self.query["end"] - self.query["start"]
+        nparts = min(nparts, math.ceil(self.expected_points() / self.limit))  # at least a full request per part
+        if nparts <= 1 or span <= 0:
             return [self]
         else:
             spacing = self.granularity
-            npt = (self.query["end"] - self.query["start"]) / spacing
-            nparts = min(nparts, math.ceil(npt / self.limit))  # no more parts than DPS_LIMIT per part
-            if npt < 0:
-                self.splittable = False
-                return [self]
-            chunk_size = math.ceil(npt / nparts) * spacing
+            chunk_size = math.ceil(span / spacing / nparts) * spacing
             new_queries = []
             for i in range(nparts):
                 qc = copy.copy(self.query)
@@ -69,38 +485,133 @@ class DatapointsJob(Job):
                 qc["end"] = self.query["start"] + (i + 1) * chunk_size
                 new_queries.append(qc)
             new_queries[-1]["end"] = self.query["end"]
-            return [DatapointsJob(q, self.api_client) for q in new_queries]
+            new_queries = [q for q in new_queries if q["start"] < q["end"]]  # rounding up can leave empty parts
+            subjobs = [DatapointsJob(q, self.api_client, self.stream, self.series_index) for q in new_queries]
+            for subjob in subjobs:
+                subjob.observed = self.observed  # so the parts can split further at the same density
+                subjob.coalesce_checked = True  # within the range this job shares
+            return subjobs
 
-    def merge(self):
-        r = self.retrieved_data  # could have some retrievals followed by a split
-        outside_points = self.query.get("includeOutsidePoints")
-        for child_res in self.children:
-            if outside_points:
-                if len(child_res) >= 2 and len(r) >= 2 and child_res.timestamp[:2] == r.timestamp[-2:]:
-                    child_res = child_res[2:]  # strip duplicated include outside points
-            r._extend(child_res)
+    def fold(self, merged, result):
+        r = self.retrieved_data if merged is None else merged  # could have some retrievals followed by a split
+        held = r.resident_nbytes + result.resident_nbytes
+        first = 0
+        if self.query.get("includeOutsidePoints") and len(r):  # strip duplicated include outside points
+            first = int(np.searchsorted(result.timestamp, r.timestamp[-1], side="right"))
+        r.extend(result, first)
+        self._hold(r.resident_nbytes - held)  # the result is freed
         return r
 
     def run(self):
-        payload = {"items": [self.query], "limit": self.limit}
-        result = self.api_client._post(self.api_client._RESOURCE_PATH + "/list", json=payload)
-        data = result.json()["items"][0]
-        retrieved_inside_range = len(data["datapoints"])
-        at_end = not data["datapoints"] or data["datapoints"][-1]["timestamp"] + self.granularity >= self.query["end"]
-        if self.query.get("includeOutsidePoints") and data["datapoints"]:
-            if data["datapoints"][0]["timestamp"] < self.query["start"]:
+        try:
+            response = self._post(self.api_client._RESOURCE_PATH + "/list", json=self.payload)
+        except CogniteAPIError as e:
+            return self._handle_plan_error(e)
+        result = self._process_buffers(_decode(self.api_client, response, self.response_fields))
+        if self.stream is not None:
+            self.stream.wait_for_room()
+        return result
+
+    async def run_async(self):
+        try:
+            response = await self._post_async(self.api_client._RESOURCE_PATH + "/list", json=self.payload)
+        except CogniteAPIError as e:
+            return self._handle_plan_error(e)
+        result = self._process_buffers(await _decode_async(self.api_client, response, self.response_fields))
+        if self.stream is not None and self.stream.full:
+            await asyncio.get_event_loop().run_in_executor(None, self.stream.wait_for_room)
+        return result
+
+    @property
+    def payload(self):
+        if self.plan_splits:
+            return {"items": [self._count_query()], "limit": self.api_client._DPS_LIMIT_AGG}
+        return {"items": [self.query], "limit": self.limit}
+
+    @property
+    def response_fields(self):
+        return [["count"] if self.plan_splits else self.fields]
+
+    def _process_buffers(self, buffers):
+        if self.plan_splits:
+            return self._plan(buffers[0])
+        return self._process_page(buffers[0])
+
+    def _count_query(self):
+        span = self.query["end"] - self.query["start"]
+        granularity = timedelta_to_granularity(max(span / self.api_client._DPS_LIMIT_AGG, 1000))
+        query = {k: v for k, v in self.query.items() if k in ["id", "externalId"]}
+        return {
+            **query,
+            "start": self.query["start"],
+            "end": self.query["end"],
+            "aggregates": ["count"],
+            "granularity": granularity,
+        }
+
+    def _plan(self, counts):
+        """Splits the range at count aggregate boundaries so each part is retrieved in a single request."""
+        self.plan_splits = False
+        granularity = granularity_to_ms(self._count_query()["granularity"])
+        boundaries = [self.query["start"]]
+        in_part = 0  # parts are kept below limit, since a full page needs another request to confirm the end
+        for ts, count in zip(counts.timestamp.tolist(), counts.column("count").tolist()):
+            if in_part + count >= self.limit and in_part > 0 and ts > boundaries[-1]:
+                boundaries.append(ts)
+                in_part = 0
+            if count >= self.limit:  # a single dense bucket, split it evenly
+                nparts = count // self.limit + 1
+                start = max(ts, boundaries[-1])
+                for i in range(1, nparts):
+                    boundaries.append(start + i * (ts + granularity - start) // nparts)
+                boundaries.append(ts + granularity)
+            else:
+                in_part += count
+        boundaries = [b for b in boundaries if b < self.query["end"]] + [self.query["end"]]
+        self.planned_ranges = [(a, b) for a, b in zip(boundaries[:-1], boundaries[1:]) if b > a]
+        self.planned = len(self.planned_ranges) <= 1
+        return self  # resubmitted, and initial_split then splits into the planned ranges
+
+    def _handle_plan_error(self, e):
+        if not self.plan_splits or e.code != 400:
+            raise e
+        self.plan_splits = False  # e.g. string time series, which have no count aggregates
+        return self
+
+    def _process_page(self, page, limit=None):
+        """Stores a page retrieved with the given limit and returns self if the job should continue."""
+        self.stats.datapoints += len(page)
+        limit = limit or self.limit
+        ts = page.timestamp
+        first, last = 0, len(page)  # part of the page to keep
+        retrieved_inside_range = len(page)
+        at_end = not len(page) or ts[-1] + self.granularity >= self.query["end"]
+        if self.query.get("includeOutsidePoints") and len(page):
+            if ts[0] < self.query["start"]:
                 retrieved_inside_range -= 1
                 if self.retrieved_data:  # second page, ignore point before
-                    data["datapoints"] = data["datapoints"][1:]
-            if data["datapoints"] and data["datapoints"][-1]["timestamp"] >= self.query["end"]:
+                    first = 1
+            if last > first and ts[last - 1] >= self.query["end"]:
                 retrieved_inside_range -= 1
                 # we still need to paginate, so point after is duplicate here (and will mess up start)
-                at_end = data["datapoints"][-2]["timestamp"] + self.granularity >= self.query["end"]
-                if retrieved_inside_range == self.limit and not at_end:
-                    data["datapoints"] = data["datapoints"][:-1]
-        self.retrieved_data._extend(Datapoints._load(data, expected_fields=self.query.get("aggregates", ["value"])))
-        if retrieved_inside_range == self.limit and not at_end:
-            self.query["start"] = data["datapoints"][-1]["timestamp"] + self.granularity
+                at_end = ts[last - 2] + self.granularity >= self.query["end"]
+                if retrieved_inside_range == limit and not at_end:
+                    last -= 1
+        page_start = self.query["start"]
+        continue_job = retrieved_inside_range == limit and not at_end
+        if continue_job:
+            self.query["start"] = int(ts[last - 1]) + self.granularity
+            count, span = self.observed  # a full page spans from its first datapoint to the start of the next page
+            self.observed = (count + last - first, span + self.query["start"] - int(ts[first]))
+        if self.stream is not None:
+            self.stream._put(
+                self.series_index, page_start, self.query["start"] if continue_job else self.query["end"], page
+            )
+        else:
+            held = self.retrieved_data.resident_nbytes
+            self.retrieved_data.extend(page, first, last)
+            self._hold(self.retrieved_data.resident_nbytes - held)
+        if continue_job:
             return self  # continue job
         else:
             return self.retrieved_data  # done
@@ -113,6 +624,136 @@ class DatapointsJob(Job):
         return ts - (ts % gms) + gms
 
 
+class CachedDatapointsJob(Job):
+    """Returns datapoints from a DatapointsCache, so they are merged in order with the retrieved parts of a range."""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self.buffer = buffer
+
+    def __repr__(self):
+        return f"<CachedDatapointsJob buffer={self.buffer}>"
+
+    def run(self):
+        return self.buffer
+
+    async def run_async(self):
+        return self.run()
+
+
+class SharedDatapointsJob(Job):
+    """Part of the range of a DatapointsJob which another job in flight, its leader, is already retrieving.
+
+    It is never queued: when the leader finishes, its result is a copy of the part of the leader's result. If the leader
+    fails, or its top-level job is cancelled, it is queued and retrieves the part with a DatapointsJob of its own."""
+
+    def __init__(self, leader, query, api_client):
+        super().__init__(api_client=api_client)
+        self.leader = leader
+        self.query = query
+        self._attached = False
+        self._leader_result = _PENDING
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<SharedDatapointsJob query={self.query} leader={self.leader}>"
+
+    def _attach(self):
+        """Called once the job is a sub-job, from when a result can be merged into its parent."""
+        with self._lock:
+            self._attached = True
+            result = self._leader_result
+        if result is not _PENDING:
+            self._leader_done(result)
+
+    def _leader_done(self, result):
+        with self._lock:
+            if not self._attached:  # the leader finished while this job was being created
+                self._leader_result = result
+                return
+        if result is None:
+            self.coalescer.fallbacks += 1
+            self.api_client._cognite_client.job_queue.submit(self)
+            return
+        part = DatapointsBuffer(result.fields)
+        part.extend(result.time_slice(self.query["start"], self.query["end"]))
+        self._hold(part.resident_nbytes)
+        self._set_result(part)
+
+    @property
+    def coalescer(self):
+        return self.api_client._cognite_client.datapoints_coalescer
+
+    def run(self):
+        job = DatapointsJob(copy.copy(self.query), self.api_client)
+        job.coalesce_checked = True
+        return self._handle_split([job])  # continue as the job, merged back into this one
+
+
+class DatapointsBatchJob(Job):
+    """Retrieves the first page of many time series in a single request.
+
+    Results are routed back to the DatapointsJob of each series, and series which filled their share of the
+    request's datapoint limit continue as separate jobs.
+
+    Args:
+        jobs_with_limits (List[Tuple[DatapointsJob, int]]): The jobs in the batch, with the limit for each.
+    """
+
+    retry_policy = RetryPolicy()
+
+    def __init__(self, jobs_with_limits, api_client):
+        super().__init__(api_client=api_client)
+        self.jobs = [job for job, _ in jobs_with_limits]
+        self.limits = [max(limit, 1) for _, limit in jobs_with_limits]
+        self.priority = min(j.priority for j in self.jobs)
+
+    def __repr__(self):
+        return f"<DatapointsBatchJob jobs={len(self.jobs)}>"
+
+    @property
+    def payload(self):
+        return {"items": [{**job.query, "limit": limit} for job, limit in zip(self.jobs, self.limits)]}
+
+    @property
+    def stream(self):
+        return self.jobs[0].stream
+
+    def run(self):
+        response = self._post(self.api_client._RESOURCE_PATH + "/list", json=self.payload)
+        result = self._process_buffers(_decode(self.api_client, response, [job.fields for job in self.jobs]))
+        if self.stream is not None:
+            self.stream.wait_for_room()
+        return result
+
+    async def run_async(self):
+        response = await self._post_async(self.api_client._RESOURCE_PATH + "/list", json=self.payload)
+        fields = [job.fields for job in self.jobs]
+        result = self._process_buffers(await _decode_async(self.api_client, response, fields))
+        if self.stream is not None and self.stream.full:
+            await asyncio.get_event_loop().run_in_executor(None, self.stream.wait_for_room)
+        return result
+
+    def _process_buffers(self, pages):
+        continued = []
+        for job, limit, page in zip(self.jobs, self.limits, pages):
+            self.stats.datapoints += len(page)
+            result = job._process_page(page, limit=limit)
+            if isinstance(result, Job):
+                continued.append(job)
+            else:
+                job._set_result(result)
+        return continued
+
+    def _set_result(self, result):
+        if isinstance(result, CogniteJobError):  # the request failed, so every unfinished series in it failed
+            for job in self.jobs:
+                if not job._result.done():
+                    job._set_result(CogniteJobError(result))
+        if not self._result.done():
+            self._result.set_result(result)
+
+
 class CountDatapointsJob(DatapointsJob):
     def __init__(self, time_series, start, end, api_client):
         self.time_series = time_series
@@ -129,18 +770,335 @@ class CountDatapointsJob(DatapointsJob):
             for j in super().split(nparts)
         ]
 
-    def run(self):
-        r = super().run()
+    def _process_buffers(self, buffers):
+        r = super()._process_buffers(buffers)
         if self.time_series.is_string:
             jcount = len(self.retrieved_data)
         else:
-            jcount = sum(self.retrieved_data.count or [])
-        self.retrieved_data = Datapoints()
+            jcount = int(self.retrieved_data.column("count").sum())
+        self.retrieved_data = DatapointsBuffer(self.fields)
         self.count += jcount
         if isinstance(r, Job):
             return r
         else:
             return self.count
 
+    def coalescable(self):
+        return False  # the result is a count, which can not be sliced
+
+    def fold(self, merged, result):
+        return (self.count if merged is None else merged) + result
+
+
+class CountDatapointsListJob(Job):
+    """Counts the datapoints of many time series in a time range.
+
+    Numeric series are counted from count aggregates over a pyramid of ranges: the whole days inside the range as
+    buckets of up to `MAX_MULTIPLE` days, and whole hours, minutes and seconds only at its edges, with raw datapoints
+    for the milliseconds before the first and after the last whole second. That is at most ten small items per series,
+    which are packed into requests of `BATCH_SIZE` items for many series at once. String series have no aggregates,
+    and are counted from their raw datapoints by a CountDatapointsJob each.
+
+    With a `cache`, only the parts of the range outside the historical count stored for each series are counted, and
+    the count of the historical part of the range is stored.
+
+    Args:
+        time_series (List[TimeSeries]): The series to count.
+        single (bool): The result is the count of the only series, rather than a list of counts.
+        cache (DatapointsCountCache): Historical counts to reuse and update.
+    """
+
+    BATCH_SIZE = 100  # maximum number of items in one request
+    PYRAMID = [("d", 86400000), ("h", 3600000), ("m", 60000), ("s", 1000)]
+    MAX_MULTIPLE = 120  # largest number of units in an aggregate bucket
+    RAW_LIMIT = 1000  # raw datapoints in less than a second, at most one per millisecond
+
+    def __init__(self, time_series, start, end, api_client, single=False, cache=None):
+        super().__init__(api_client=api_client)
+        self.time_series = time_series
+        self.start = timestamp_to_ms(start)
+        self.end = timestamp_to_ms(end)
+        self.single = single
+        self.cache = cache
+        self.cached = [0] * len(time_series)  # counts taken from the cache
+        self.historical = {}  # series index -> range whose count is stored in the cache
+        self.child_pieces = []  # (series index, whether in the historical range) of the counts each sub-job returns
+
+    def __repr__(self):
+        return f"<CountDatapointsListJob time_series={len(self.time_series)} start={self.start} end={self.end}>"
+
+    def initial_split(self):
+        cutoff = self.cache.cutoff() if self.cache is not None else None
+        subjobs, items, pieces = [], [], []
+        for i, ts in enumerate(self.time_series):
+            identifier = {"id": ts.id} if ts.id is not None else {"externalId": ts.external_id}
+            for start, end, historical in self._ranges(i, ts, cutoff):
+                if ts.is_string:
+                    subjobs.append(CountDatapointsJob(ts, start, end, api_client=self.api_client))
+                    self.child_pieces.append([(i, historical)])
+                    continue
+                for query in self.pyramid(start, end):
+                    items.append({**identifier, **query})
+                    pieces.append((i, historical))
+        for k in range(0, len(items), self.BATCH_SIZE):
+            subjobs.append(CountDatapointsBatchJob(items[k : k + self.BATCH_SIZE], self.api_client))
+            self.child_pieces.append(pieces[k : k + self.BATCH_SIZE])
+        return subjobs or [self]
+
+    def _ranges(self, series_index, time_series, cutoff):
+        """(start, end, historical) of the parts of the range to count, outside the range counted in the cache."""
+        if self.cache is None:
+            return [(self.start, self.end, False)] if self.start < self.end else []
+        historical_end = max(self.start, min(self.end, cutoff))
+        counted = self.cache.lookup(self.cache.key(time_series))
+        if counted is not None and self.start <= counted[0] < counted[1] <= historical_end:
+            self.cached[series_index] = counted[2]
+            ranges = [(self.start, counted[0], True), (counted[1], historical_end, True)]
+        else:
+            ranges = [(self.start, historical_end, True)]
+        if self.start < historical_end:
+            self.historical[series_index] = (self.start, historical_end)
+        ranges.append((historical_end, self.end, False))
+        return [r for r in ranges if r[0] < r[1]]
+
+    @classmethod
+    def pyramid(cls, start, end, level=0):
+        """Queries whose counts add up to the count in start:end, with the coarsest granularity in the interior."""
+        if start >= end:
+            return []
+        if level == len(cls.PYRAMID):
+            return [{"start": start, "end": end, "limit": cls.RAW_LIMIT}]
+        unit, unit_ms = cls.PYRAMID[level]
+        first, last = -(-start // unit_ms) * unit_ms, end // unit_ms * unit_ms  # whole units inside the range
+        if first >= last:
+            return cls.pyramid(start, end, level + 1)
+        units = (last - first) // unit_ms
+        multiple = min(units, cls.MAX_MULTIPLE)
+        buckets, remainder = divmod(units, multiple)
+        middle = first + buckets * multiple * unit_ms
+        # the last bucket spans its whole granularity, so the units left over are a bucket of their own
+        interior = [cls._count_query(first, middle, multiple, unit, buckets)]
+        if remainder:
+            interior.append(cls._count_query(middle, last, remainder, unit, 1))
+        return cls.pyramid(start, first, level + 1) + interior + cls.pyramid(last, end, level + 1)
+
+    @staticmethod
+    def _count_query(start, end, multiple, unit, buckets):
+        granularity = "{}{}".format(multiple, unit)
+        return {"start": start, "end": end, "aggregates": ["count"], "granularity": granularity, "limit": buckets}
+
+    def run(self):
+        self.children = []  # nothing left to count
+        return self.merge()
+
+    async def run_async(self):
+        return self.run()
+
+    def merge(self):
+        counts, historical = list(self.cached), list(self.cached)
+        for pieces, result in zip(self.child_pieces, self.children):
+            for (i, in_historical), count in zip(pieces, to_list(result)):
+                counts[i] += count
+                if in_historical:
+                    historical[i] += count
+        if self.cache is not None and self.historical:
+            self.cache.store(
+                {
+                    self.cache.key(self.time_series[i]): (start, end, historical[i])
+                    for i, (start, end) in self.historical.items()
+                }
+            )
+        return counts[0] if self.single else counts
+
+
+class CountDatapointsBatchJob(Job):
+    """Retrieves the count aggregates, or raw datapoints, of many items in one request. The result is the number of
+    datapoints in each item."""
+
+    retry_policy = RetryPolicy()
+
+    def __init__(self, items, api_client):
+        super().__init__(api_client=api_client)
+        self.items = items
+
+    def __repr__(self):
+        return f"<CountDatapointsBatchJob items={len(self.items)}>"
+
+    @property
+    def fields(self):
+        return [item.get("aggregates", ["value"]) for item in self.items]
+
+    def run(self):
+        response = self._post(self.api_client._RESOURCE_PATH + "/list", json={"items": self.items})
+        return self._count(_decode(self.api_client, response, self.fields))
+
+    async def run_async(self):
+        response = await self._post_async(self.api_client._RESOURCE_PATH + "/list", json={"items": self.items})
+        return self._count(await _decode_async(self.api_client, response, self.fields))
+
+    def _count(self, buffers):
+        counts = []
+        for item, buffer in zip(self.items, buffers):
+            self.stats.datapoints += len(buffer)
+            counts.append(int(buffer.column("count").sum()) if "aggregates" in item else len(buffer))
+        return counts
+
+
+class LatestDatapointsJob(Job):
+    """Retrieves the latest datapoint of many time series, each optionally before a given time.
+
+    The series are retrieved in batches of `_RETRIEVE_LATEST_LIMIT` per request, which run in parallel on the job
+    queue, and a series asked for several times is retrieved once. With a `cache`, series retrieved less than its ttl
+    ago, or being retrieved for another query, are taken from there.
+
+    Args:
+        items (List[Dict]): The id or externalId of each series, and optionally the "before" timestamp.
+        ignore_unknown_ids (bool): Leave out unknown series rather than failing.
+        cache (LatestDatapointsCache): Cache shared with other queries.
+    """
+
+    def __init__(self, items, api_client, ignore_unknown_ids=False, cache=None):
+        super().__init__(api_client=api_client)
+        self.items = items
+        self.keys = [LatestDatapointsCache.key(item) for item in items]
+        self.ignore_unknown_ids = ignore_unknown_ids
+        self.cache = cache
+
+    def __repr__(self):
+        return f"<LatestDatapointsJob items={len(self.items)}>"
+
+    def initial_split(self):
+        unique = dict(zip(self.keys, self.items))
+        if not unique:
+            return [self]
+        if self.cache is None:
+            futures, claimed = {}, list(unique)
+        else:
+            futures, claimed = self.cache.claim(unique)
+            if claimed:  # so queries waiting for them retrieve them if this job is cancelled before its requests
+                exception = JobCancelledError("{} was cancelled".format(self))
+
+                def abandon(_, claimed=claimed):
+                    for key in claimed:
+                        self.cache.abandon(key, futures[key], exception)
+
+                self.flow._result.add_done_callback(abandon)
+        subjobs = [
+            LatestDatapointsBatchJob(
+                [unique[key] for key in keys], keys, self.api_client, self.ignore_unknown_ids, self.cache, futures
+            )
+            for keys in split_into_chunks(claimed, self.api_client._RETRIEVE_LATEST_LIMIT)
+        ]
+        claimed = set(claimed)
+        for key, future in futures.items():
+            if key not in claimed:
+                subjobs.append(
+                    SharedLatestDatapointsJob(unique[key], key, future, self.api_client, self.ignore_unknown_ids)
+                )
+        return subjobs
+
+    def _handle_split(self, subjobs):
+        subjobs = super()._handle_split(subjobs)
+        shared = [j for j in subjobs if isinstance(j, SharedLatestDatapointsJob)]
+        if not shared:
+            return subjobs
+        queued = [
+            j for j in subjobs if not isinstance(j, SharedLatestDatapointsJob)
+        ]  # before attaching, which can merge results
+        for job in shared:
+            job._attach()
+        return queued
+
+    def run(self):
+        return DatapointsList([], cognite_client=self.api_client._cognite_client)  # no series
+
+    async def run_async(self):
+        return self.run()
+
+    def fold(self, merged, result):
+        if merged is None:
+            return result
+        merged.update(result)
+        return merged
+
     def merge(self):
-        return self.count + sum(self.children)
+        latest = super().merge()
+        return DatapointsList(
+            [latest[key] for key in self.keys if latest[key] is not None],
+            cognite_client=self.api_client._cognite_client,
+        )
+
+
+class LatestDatapointsBatchJob(Job):
+    """Retrieves the latest datapoints of a batch of series in one request. The result is a dict of the Datapoints of
+    each key, None for unknown series, which are also stored in the cache."""
+
+    retry_policy = RetryPolicy()
+
+    def __init__(self, items, keys, api_client, ignore_unknown_ids=False, cache=None, futures=None):
+        super().__init__(api_client=api_client)
+        self.items = items
+        self.keys = keys
+        self.ignore_unknown_ids = ignore_unknown_ids
+        self.cache = cache
+        self.futures = futures
+
+    def __repr__(self):
+        return f"<LatestDatapointsBatchJob items={len(self.items)}>"
+
+    @property
+    def payload(self):
+        return {"items": self.items, "ignoreUnknownIds": self.ignore_unknown_ids}
+
+    def run(self):
+        return self._process_response(self._post(self.api_client._RESOURCE_PATH + "/latest", json=self.payload))
+
+    async def run_async(self):
+        response = await self._post_async(self.api_client._RESOURCE_PATH + "/latest", json=self.payload)
+        return self._process_response(response)
+
+    def _process_response(self, response):
+        loaded = iter(response.json()["items"])
+        result, item = {}, next(loaded, None)
+        for key, query in zip(self.keys, self.items):  # unknown series are left out of the response, in order
+            identifier = "id" if query.get("id") is not None else "externalId"
+            if item is not None and item.get(identifier) == query[identifier]:
+                self.stats.datapoints += len(item["datapoints"])
+                result[key] = Datapoints._load(item, cognite_client=self.api_client._cognite_client)
+                item = next(loaded, None)
+            else:
+                result[key] = None
+        return result
+
+    def _set_result(self, result):
+        if self.cache is not None:
+            for key in self.keys:
+                if isinstance(result, CogniteJobError):
+                    self.cache.abandon(key, self.futures[key], result)
+                else:
+                    self.cache.store(key, self.futures[key], result[key])
+        super()._set_result(result)
+
+
+class SharedLatestDatapointsJob(LatestDatapointsBatchJob):
+    """Latest datapoint of a series from a LatestDatapointsCache, retrieved recently or by a request in flight.
+
+    It is never queued: its result is that of the cache, unless the request it waits for fails or is cancelled. Then
+    it is queued and retrieves the datapoint with a request of its own."""
+
+    def __init__(self, item, key, future, api_client, ignore_unknown_ids=False):
+        super().__init__([item], [key], api_client, ignore_unknown_ids)
+        self.future = future
+
+    def __repr__(self):
+        return f"<SharedLatestDatapointsJob item={self.items[0]}>"
+
+    def _attach(self):
+        """Called once the job is a sub-job, from when a result can be merged into its parent."""
+        self.future.add_done_callback(self._shared_done)
+
+    def _shared_done(self, future):
+        if future.exception() is not None:
+            self.api_client._cognite_client.job_queue.submit(self)
+            return
+        self._set_result({self.keys[0]: future.result()})
@@ -0,0 +1,106 @@
+import numpy as np
+
+from cognite.async_client.exceptions import DatapointsInsertError
+from cognite.async_client.jobs import Job
+from cognite.async_client.retry import RetryPolicy
+
+
+class InsertDatapointsJob(Job):
+    """Inserts datapoints into many time series.
+
+    Each series is cut into chunks of at most `_DPS_LIMIT` datapoints, and the chunks are packed into requests of at
+    most `_DPS_LIMIT` datapoints and `_POST_DPS_OBJECTS_LIMIT` series, so many small series share a request. Requests
+    run in parallel, and failures are collected as DatapointsInsertError with the datapoints each request contained.
+
+    Args:
+        items (List[Tuple[Dict, numpy.ndarray, Union[numpy.ndarray,List]]]): Identifier ({"id": ..} or
+            {"externalId": ..}), timestamps in milliseconds and values of each time series.
+    """
+
+    def __init__(self, items, api_client):
+        super().__init__(api_client=api_client)
+        self.items = items
+
+    def __repr__(self):
+        return f"<InsertDatapointsJob series={len(self.items)}>"
+
+    def initial_split(self):
+        dps_limit, items_limit = self.api_client._DPS_LIMIT, self.api_client._POST_DPS_OBJECTS_LIMIT
+        batches = []
+        open_batches = []  # [datapoints, chunks] of batches with room left, filled first fit
+        for identifier, timestamps, values in self.items:
+            for i in range(0, len(timestamps), dps_limit):
+                chunk = (identifier, timestamps[i : i + dps_limit], values[i : i + dps_limit])
+                for batch in open_batches:
+                    if batch[0] + len(chunk[1]) <= dps_limit:
+                        break
+                else:
+                    batch = [0, []]
+                    batches.append(batch[1])
+                    open_batches.append(batch)
+                batch[0] += len(chunk[1])
+                batch[1].append(chunk)
+                if batch[0] >= dps_limit or len(batch[1]) >= items_limit:
+                    open_batches.remove(batch)
+        if not batches:
+            return [self]  # nothing to insert
+        return [InsertDatapointsBatchJob(batch, self.api_client) for batch in batches]
+
+    def run(self):
+        return None
+
+    async def run_async(self):
+        return None
+
+    def merge(self):
+        return None
+
+
+class InsertDatapointsBatchJob(Job):
+    """Inserts chunks of datapoints of one or more time series in a single request."""
+
+    retry_policy = RetryPolicy()  # inserting the same datapoints again overwrites them with the same values
+
+    def __init__(self, chunks, api_client):
+        super().__init__(api_client=api_client)
+        self.chunks = chunks
+
+    def __repr__(self):
+        return f"<InsertDatapointsBatchJob series={len(self.chunks)}>"
+
+    @property
+    def payload(self):  # converted to dicts only right before posting
+        return {
+            "items": [
+                {
+                    **identifier,
+                    "datapoints": [{"timestamp": t, "value": v} for t, v in zip(_tolist(timestamps), _tolist(values))],
+                }
+                for identifier, timestamps, values in self.chunks
+            ]
+        }
+
+    def _retry_delay(self, exception, attempt):
+        return super()._retry_delay(getattr(exception, "exception", exception), attempt)
+
+    def failed(self):
+        return [
+            {**identifier, "start": int(np.min(timestamps)), "end": int(np.max(timestamps)), "count": len(timestamps)}
+            for identifier, timestamps, _ in self.chunks
+        ]
+
+    def run(self):
+        try:
+            self._post(self.api_client._RESOURCE_PATH, json=self.payload)
+        except Exception as e:
+            raise DatapointsInsertError(e, self.failed())
+
+    async def run_async(self):
+        try:
+            await self._post_async(self.api_client._RESOURCE_PATH, json=self.payload)
+        except Exception as e:
+            raise DatapointsInsertError(e, self.failed())
+
+
+def _tolist(values):
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
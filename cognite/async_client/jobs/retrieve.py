@@ -0,0 +1,120 @@
+from cognite.async_client.jobs import Job
+from cognite.async_client.retry import RetryPolicy
+from cognite.client.utils._auxiliary import split_into_chunks
+
+
+class ListJob(Job):
+    """Lists resources matching a filter, following the cursor of one partition.
+
+    With `partitions`, the job splits into one job per partition of the API's partitioned listing, and each
+    paginates through its own cursor on a worker of the queue.
+
+    Args:
+        filter (Dict): Filter in the camel case form of the API.
+        limit (int): Maximum number of resources, None for all. Not supported with several partitions.
+        partitions (int): Number of partitions to list in parallel.
+        partition (str): The partition ("i/n") this job lists, set on the jobs a partitioned job splits into.
+        load (bool): Load the items into the resource list class, rather than returning the dicts of the responses.
+    """
+
+    retry_policy = RetryPolicy()
+
+    def __init__(self, filter, api_client, limit=None, partitions=None, partition=None, other_params=None, load=True):
+        super().__init__(api_client=api_client)
+        self.filter = filter or {}
+        self.limit = limit
+        self.partitions = partitions
+        self.partition = partition
+        self.other_params = other_params or {}
+        self.load = load
+        if limit is not None and partitions and partitions > 1:
+            raise ValueError("When using partitions, limit should be None")
+        self.items = []
+        self.cursor = None
+
+    def __repr__(self):
+        return f"<ListJob path={self.api_client._RESOURCE_PATH} partition={self.partition} items={len(self.items)}>"
+
+    def initial_split(self):
+        if self.partitions and self.partitions > 1 and self.partition is None:
+            return [
+                ListJob(
+                    self.filter,
+                    self.api_client,
+                    partition="{}/{}".format(i + 1, self.partitions),
+                    other_params=self.other_params,
+                    load=self.load,
+                )
+                for i in range(self.partitions)
+            ]
+        return [self]
+
+    @property
+    def payload(self):
+        limit = self.api_client._LIST_LIMIT
+        if self.limit is not None:
+            limit = min(limit, self.limit - len(self.items))
+        body = {"filter": self.filter, "limit": limit, "cursor": self.cursor, **self.other_params}
+        if self.partition is not None:
+            body["partition"] = self.partition
+        return body
+
+    def run(self):
+        return self._process_response(self._post(self.api_client._RESOURCE_PATH + "/list", json=self.payload))
+
+    async def run_async(self):
+        response = await self._post_async(self.api_client._RESOURCE_PATH + "/list", json=self.payload)
+        return self._process_response(response)
+
+    def _process_response(self, response):
+        body = response.json()
+        self.items.extend(body["items"])
+        self.cursor = body.get("nextCursor")
+        if self.cursor is not None and (self.limit is None or len(self.items) < self.limit):
+            return self  # continue with the next page
+        if not self.load:
+            return self.items
+        return self.api_client._LIST_CLASS._load(self.items, cognite_client=self.api_client._cognite_client)
+
+
+class RetrieveMultipleJob(Job):
+    """Retrieves resources by id or external id, in parallel requests of at most `_RETRIEVE_LIMIT` identifiers.
+
+    Args:
+        identifiers (List[Dict]): Identifiers as {"id": ..} or {"externalId": ..}.
+        ignore_unknown_ids (bool): Leave out identifiers which are not found instead of failing.
+    """
+
+    retry_policy = RetryPolicy()
+
+    def __init__(self, identifiers, api_client, ignore_unknown_ids=False):
+        super().__init__(api_client=api_client)
+        self.identifiers = identifiers
+        self.ignore_unknown_ids = ignore_unknown_ids
+
+    def __repr__(self):
+        return f"<RetrieveMultipleJob path={self.api_client._RESOURCE_PATH} identifiers={len(self.identifiers)}>"
+
+    def initial_split(self):
+        if len(self.identifiers) <= self.api_client._RETRIEVE_LIMIT:
+            return [self]
+        return [
+            RetrieveMultipleJob(chunk, self.api_client, self.ignore_unknown_ids)
+            for chunk in split_into_chunks(self.identifiers, self.api_client._RETRIEVE_LIMIT)
+        ]
+
+    @property
+    def payload(self):
+        return {"items": self.identifiers, "ignoreUnknownIds": self.ignore_unknown_ids}
+
+    def run(self):
+        return self._process_response(self._post(self.api_client._RESOURCE_PATH + "/byids", json=self.payload))
+
+    async def run_async(self):
+        response = await self._post_async(self.api_client._RESOURCE_PATH + "/byids", json=self.payload)
+        return self._process_response(response)
+
+    def _process_response(self, response):
+        return self.api_client._LIST_CLASS._load(
+            response.json()["items"], cognite_client=self.api_client._cognite_client
+        )
@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+import weakref
+
+import numpy as np
+
+from cognite.async_client.data_classes.datapoints import DatapointsBuffer
+
+
+class MemoryBudget:
+    """Limit on the datapoints held by the job queue before the results of top-level jobs are merged.
+
+    Datapoints jobs count the bytes of the pages they keep, including results of finished sub-jobs waiting for the
+    merge, towards their top-level job, until that job is done. While more than `max_bytes` are held, the queue stops
+    splitting jobs over idle workers, and only runs jobs of top-level jobs which already hold data, so these finish
+    and free it before others start. Other jobs are set aside until data is freed, and then queued again. A single
+    top-level job can still go over the budget, unless `spill` is set: then results of finished sub-jobs are moved to
+    memory-mapped files while over budget, and read back from disk by the merge. Results of string time series are
+    never spilled.
+
+    Args:
+        max_bytes (int): Bytes of held datapoints above which the queue applies backpressure.
+        spill (bool): Move results of finished sub-jobs to memory-mapped files while over budget.
+        spill_dir (str): Directory for the spilled files, by default the system's temporary directory.
+    """
+
+    def __init__(self, max_bytes, spill=False, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_enabled = spill
+        self.spill_dir = spill_dir
+        self.spilled_bytes = 0
+        self.deferred = 0  # number of times a worker set a job aside, waiting for data to be freed
+        self._waiting = []  # (job, put) of the jobs set aside
+        self._held = {}  # top-level job -> bytes held
+        self._total = 0
+        self._lock = threading.Lock()
+        self._spill_path = None
+
+    def __repr__(self):
+        return f"<MemoryBudget held={self.held} max_bytes={self.max_bytes}>"
+
+    @property
+    def held(self):
+        return self._total
+
+    @property
+    def exceeded(self):
+        return self._total > self.max_bytes
+
+    @property
+    def stats(self):
+        return {
+            "held": self.held,
+            "max_bytes": self.max_bytes,
+            "flows": len(self._held),
+            "spilled_bytes": self.spilled_bytes,
+            "deferred": self.deferred,
+            "waiting": len(self._waiting),
+        }
+
+    def add(self, flow, nbytes):
+        """Counts `nbytes` more (or, if negative, fewer) bytes held by the top-level job `flow`."""
+        if not nbytes:
+            return
+        with self._lock:
+            held = self._held.get(flow, 0)
+            self._held[flow] = held + nbytes
+            self._total += nbytes
+            # freed data, or a flow starting to hold data, can let waiting jobs run
+            admitted = self._take_admitted() if nbytes < 0 or held <= 0 else []
+        for job, put in admitted:
+            put(job)
+
+    def release(self, flow):
+        """Frees everything held by a top-level job, once its result is merged or it failed."""
+        with self._lock:
+            self._total -= self._held.pop(flow, 0)
+            admitted = self._take_admitted()
+        for job, put in admitted:
+            put(job)
+
+    def admits(self, job):
+        """Whether a job may run now: while over budget, only jobs of top-level jobs holding data run."""
+        return not self.exceeded or self._held.get(job.flow, 0) > 0
+
+    @property
+    def waiting(self):
+        """Number of jobs set aside until data is freed."""
+        return len(self._waiting)
+
+    def defer(self, job, put):
+        """Sets the job aside if it may not run now, calling `put(job)` to queue it again once data is freed. Returns
+        whether it was set aside. Such jobs are not put back into the queue right away, where a job of a more urgent
+        priority class would be the next one again, and keep the workers from the jobs which free the data."""
+        with self._lock:
+            if self.admits(job):
+                return False
+            self.deferred += 1
+            self._waiting.append((job, put))
+            return True
+
+    def _take_admitted(self):
+        """Removes the waiting jobs which may run now from those set aside, and returns them. The others keep waiting,
+        rather than being queued only to be set aside again."""
+        admitted, waiting = [], []
+        for job, put in self._waiting:
+            (admitted if self.admits(job) else waiting).append((job, put))
+        self._waiting = waiting
+        return admitted
+
+    def spill(self, flow, result):
+        """Returns `result`, or while over budget and with `spill`, a DatapointsBuffer result moved to disk."""
+        if not (self.spill_enabled and self.exceeded and isinstance(result, DatapointsBuffer)):
+            return result
+        if result.is_string or not result.resident_nbytes:
+            return result
+        spilled = self._write(result)
+        self.add(flow, spilled.resident_nbytes - result.resident_nbytes)
+        with self._lock:
+            self.spilled_bytes += result.timestamp.nbytes + sum(result.column(f).nbytes for f in result.fields)
+        return spilled
+
+    def _directory(self):
+        with self._lock:
+            if self._spill_path is None:
+                self._spill_path = tempfile.mkdtemp(prefix="cognite-async-spill-", dir=self.spill_dir)
+                weakref.finalize(self, shutil.rmtree, self._spill_path, ignore_errors=True)
+            return self._spill_path
+
+    def _write(self, buffer):
+        """Copy of the buffer on copy-on-write memory maps, whose files are removed right away where the system
+        allows it, and otherwise with the spill directory."""
+        path = os.path.join(self._directory(), uuid.uuid4().hex)
+        spilled = DatapointsBuffer(buffer.fields)
+        spilled._set_metadata(buffer)
+        spilled._timestamp = self._map(path + ".timestamp.npy", buffer.timestamp)
+        spilled._columns = {f: self._map("{}.{}.npy".format(path, f), buffer.column(f)) for f in buffer.fields}
+        spilled._size = len(buffer)
+        return spilled
+
+    @staticmethod
+    def _map(file, array):
+        np.save(file, array)
+        mapped = np.load(file, mmap_mode="c")
+        try:
+            os.remove(file)  # the mapping keeps the data until it is closed
+        except OSError:
+            pass
+        return mapped
@@ -0,0 +1,177 @@
+import sys
+import threading
+import time
+
+
+class JobStats:
+    """Counters of one job, updated as it runs. Continuations of a job (pages of datapoints) add to the same stats.
+
+    Attributes:
+        requests (int): Number of requests made.
+        bytes_received (int): Size of the (decompressed) response bodies.
+        datapoints (int): Number of datapoints retrieved.
+        time_queued (float): Seconds spent in the queue, summed over continuations.
+        time_running (float): Seconds spent running, summed over continuations.
+        runs (int): Number of times the job ran, i.e. one more than the number of continuations.
+        splits (int): Number of times the job was split into sub-jobs.
+        errors (int): Number of runs which failed.
+        retries (int): Number of failed attempts which were retried.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_received = 0
+        self.datapoints = 0
+        self.time_queued = 0.0
+        self.time_running = 0.0
+        self.runs = 0
+        self.splits = 0
+        self.errors = 0
+        self.retries = 0
+        self.queued_at = None
+
+    def __repr__(self):
+        return "<JobStats {}>".format(self.dump())
+
+    @property
+    def continuations(self):
+        return max(self.runs - 1, 0)
+
+    @property
+    def datapoints_per_second(self):
+        return self.datapoints / self.time_running if self.time_running else 0.0
+
+    def record_response(self, response):
+        self.bytes_received += len(response.content or b"")
+
+    def dump(self):
+        return {
+            "requests": self.requests,
+            "bytes_received": self.bytes_received,
+            "datapoints": self.datapoints,
+            "datapoints_per_second": self.datapoints_per_second,
+            "time_queued": self.time_queued,
+            "time_running": self.time_running,
+            "continuations": self.continuations,
+            "splits": self.splits,
+            "errors": self.errors,
+            "retries": self.retries,
+        }
+
+
+class QueueStats:
+    """Totals over all job runs of a queue, and the hooks called after each run.
+
+    Hooks are called from the worker as `hook(job, run)`, where `run` is a dict with the job's type and the queued and
+    running time, requests, bytes_received, datapoints and retries of this run, and whether it continued or failed.
+    Hooks should return quickly, since the worker waits for them. Exceptions in hooks are printed and otherwise ignored.
+    """
+
+    COUNTERS = [
+        "runs",
+        "continuations",
+        "splits",
+        "errors",
+        "retries",
+        "cancelled",
+        "requests",
+        "bytes_received",
+        "datapoints",
+    ]
+
+    def __init__(self, num_workers):
+        self.num_workers = num_workers
+        self.started_at = time.monotonic()
+        self.hooks = []
+        self.time_queued = 0.0
+        self.time_running = 0.0
+        self.busy_time = 0.0  # wall time with at least one job running
+        self._running = 0
+        self._busy_since = None
+        self._lock = threading.Lock()
+        for counter in self.COUNTERS:
+            setattr(self, counter, 0)
+
+    def job_queued(self, job):
+        job.stats.queued_at = time.monotonic()
+
+    def job_started(self, job):
+        now = time.monotonic()
+        time_queued = now - job.stats.queued_at if job.stats.queued_at is not None else 0.0
+        job.stats.time_queued += time_queued
+        with self._lock:
+            if self._running == 0:
+                self._busy_since = now
+            self._running += 1
+            self.time_queued += time_queued
+        return now, (
+            job.stats.requests,
+            job.stats.bytes_received,
+            job.stats.datapoints,
+            job.stats.errors,
+            job.stats.retries,
+        )
+
+    def job_finished(self, job, started, continued):
+        """Adds what the job did since `job_started` returned `started` to the totals, and calls the hooks."""
+        now = time.monotonic()
+        start_time, (requests, bytes_received, datapoints, errors, retries) = started
+        stats = job.stats
+        stats.runs += 1
+        stats.time_running += now - start_time
+        run = {
+            "job": type(job).__name__,
+            "time_queued": start_time - stats.queued_at if stats.queued_at is not None else 0.0,
+            "time_running": now - start_time,
+            "requests": stats.requests - requests,
+            "bytes_received": stats.bytes_received - bytes_received,
+            "datapoints": stats.datapoints - datapoints,
+            "continued": bool(continued),
+            "error": stats.errors > errors,
+            "retries": stats.retries - retries,
+        }
+        with self._lock:
+            self._running -= 1
+            if self._running == 0:
+                self.busy_time += now - self._busy_since
+            self.runs += 1
+            self.continuations += int(bool(continued))
+            self.errors += int(run["error"])
+            self.retries += run["retries"]
+            self.requests += run["requests"]
+            self.bytes_received += run["bytes_received"]
+            self.datapoints += run["datapoints"]
+            self.time_running += run["time_running"]
+        for hook in self.hooks:
+            try:
+                hook(job, run)
+            except Exception as e:
+                print("Exception in job queue hook {}: {}".format(hook, e), file=sys.stderr)
+
+    def job_cancelled(self, job):
+        """Counts a job dropped by a worker since it was cancelled, or part of a cancelled job."""
+        with self._lock:
+            self.cancelled += 1
+
+    def job_split(self, job):
+        job.stats.splits += 1
+        with self._lock:
+            self.splits += 1
+
+    def dump(self):
+        now = time.monotonic()
+        with self._lock:
+            busy_time = self.busy_time + (now - self._busy_since if self._running else 0.0)
+            stats = {counter: getattr(self, counter) for counter in self.COUNTERS}
+            stats.update(
+                {
+                    "running": self._running,
+                    "time_queued": self.time_queued,
+                    "time_running": self.time_running,
+                    "busy_time": busy_time,
+                    "uptime": now - self.started_at,
+                    "utilization": self.time_running / ((now - self.started_at) * self.num_workers),
+                    "datapoints_per_second": self.datapoints / busy_time if busy_time else 0.0,
+                }
+            )
+        return stats
@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import requests
+
+from cognite.client.exceptions import CogniteAPIError
+
+
+class RetryPolicy:
+    """When to run a failed job again, and how long to wait before doing so.
+
+    Failed jobs are put back into the queue to run again once their backoff has passed, and resume where they failed,
+    e.g. at the page of datapoints whose request failed. By default, throttling, server errors, connection errors and
+    timeouts are retried, except for API errors marked as `retried` since the request layer retried them already, and
+    other errors fail the job right away.
+
+    Args:
+        max_attempts (int): Number of attempts for retryable errors, including the first.
+        backoff (float): Seconds to wait before the first retry, doubled for each further retry.
+        max_backoff (float): Maximum number of seconds to wait.
+        jitter (float): Fraction of the wait which is random, so jobs failing together do not retry together.
+        max_attempts_by_error (Dict[Union[type,int],int]): Number of attempts for exception classes or API status
+            codes, overriding the defaults. Status codes are checked first, then classes in the given order.
+    """
+
+    RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+    RETRYABLE_EXCEPTIONS = (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        ConnectionError,
+        asyncio.TimeoutError,
+    )
+
+    def __init__(self, max_attempts=3, backoff=0.5, max_backoff=30.0, jitter=0.5, max_attempts_by_error=None):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_attempts_by_error = max_attempts_by_error or {}
+
+    def __repr__(self):
+        return f"<RetryPolicy max_attempts={self.max_attempts} backoff={self.backoff}>"
+
+    def attempts(self, exception):
+        """Number of attempts allowed for jobs failing with `exception`."""
+        code = getattr(exception, "code", None)
+        if code in self.max_attempts_by_error:
+            return self.max_attempts_by_error[code]
+        for error, attempts in self.max_attempts_by_error.items():
+            if isinstance(error, type) and isinstance(exception, error):
+                return attempts
+        if isinstance(exception, CogniteAPIError):
+            retryable = code in self.RETRYABLE_STATUS_CODES and not getattr(exception, "retried", False)
+            return self.max_attempts if retryable else 1
+        if isinstance(exception, self.RETRYABLE_EXCEPTIONS) or _is_aiohttp_error(exception):
+            return self.max_attempts
+        return 1
+
+    def delay(self, exception, attempt):
+        """Seconds to wait before attempt number `attempt + 1`, or None if the job should fail."""
+        if attempt >= self.attempts(exception):
+            return None
+        wait = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        return wait * (1 - self.jitter * random.random())
+
+
+def _is_aiohttp_error(exception):
+    try:
+        import aiohttp
+    except ImportError:
+        return False
+    return isinstance(exception, aiohttp.ClientError)
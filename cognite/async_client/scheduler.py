@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+try:
+    from contextvars import ContextVar
+except ImportError:  # python < 3.7, defaults are per thread rather than per context
+
+    class ContextVar:
+        def __init__(self, name, default=None):
+            self.name = name
+            self.default = default
+            self._local = threading.local()
+
+        def get(self):
+            return getattr(self._local, "value", self.default)
+
+        def set(self, value):
+            token = self.get()
+            self._local.value = value
+            return token  # the value to reset to
+
+        def reset(self, token):
+            self._local.value = token
+
+
+PRIORITY_CLASSES = {"interactive": 0, "normal": 1, "batch": 2}
+
+# priority class and weight for top-level jobs submitted without them, see CogniteClient.priority_class
+submit_defaults = ContextVar("submit_defaults", default=("normal", 1))
+# seconds top-level jobs submitted without a timeout get to finish, see CogniteClient.timeout
+submit_timeout = ContextVar("submit_timeout", default=None)
+
+
+class _Flow:
+    def __init__(self, key, weight):
+        self.key = key
+        self.weight = weight
+        self.deficit = 0
+        self.jobs = []  # heap of (priority, sequence number, job)
+
+
+class FairSchedule:
+    """Order in which queued jobs run, fair between top-level jobs.
+
+    All sub-jobs, continuations and splits of a job submitted by the user belong to the flow of that top-level job.
+    Flows in a more urgent priority class always go first. Within a class, flows take turns by deficit round robin,
+    where each turn a flow may run `weight` jobs, so a small job submitted behind a big one waits for at most one round
+    instead of for all of the big job's sub-jobs. Within a flow, jobs run in order of their `priority`.
+    """
+
+    def __init__(self):
+        self._flows = {}  # top-level job -> _Flow
+        self._active = {}  # priority class -> deque of flows with queued jobs
+        self._size = 0
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return self._size
+
+    def push(self, job):
+        key = job.flow if job.flow is not None else job
+        flow = self._flows.get(key)
+        if flow is None:
+            flow = self._flows[key] = _Flow(key, key.weight)
+            self._active.setdefault(PRIORITY_CLASSES[key.priority_class], collections.deque()).append(flow)
+        heapq.heappush(flow.jobs, (job.priority, next(self._sequence), job))
+        self._size += 1
+
+    def pop(self):
+        priority_class = min(self._active)
+        active = self._active[priority_class]
+        while active[0].deficit < 1:  # start a new turn for the next flow
+            active[0].deficit += active[0].weight
+            active.rotate(-1)
+        flow = active[0]
+        flow.deficit -= 1
+        _, _, job = heapq.heappop(flow.jobs)
+        if not flow.jobs:
+            active.popleft()
+            del self._flows[flow.key]
+            if not active:
+                del self._active[priority_class]
+        self._size -= 1
+        return job
+
+
+class FairQueue(queue.Queue):
+    """Thread-safe queue of jobs which gets them in FairSchedule order."""
+
+    def _init(self, maxsize):
+        self.queue = FairSchedule()
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, job):
+        self.queue.push(job)
+
+    def _get(self):
+        return self.queue.pop()
+
+
+class AsyncFairQueue(asyncio.Queue):
+    """asyncio queue of jobs which gets them in FairSchedule order."""
+
+    def _init(self, maxsize):
+        self._queue = FairSchedule()
+
+    def _put(self, job):
+        self._queue.push(job)
+
+    def _get(self):
+        return self._queue.pop()
+
+
+class _TimerThread:
+    """Heap of [time.monotonic() time, sequence number, job], handed to `_fire` when their time passes from one
+    background thread started on first use. Jobs which are done before then are dropped when they finish, so the heap
+    does not keep their results alive."""
+
+    def __init__(self):
+        self._timers = []  # heap of [time, sequence number, job], with job None when it is done
+        self._num_done = 0
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._timers) - self._num_done
+
+    def _push(self, when, job):
+        entry = [when, next(self._sequence), job]
+        with self._condition:
+            heapq.heappush(self._timers, entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        job._result.add_done_callback(lambda _: self._drop(entry))
+
+    def _drop(self, entry):
+        with self._condition:
+            if entry[2] is None:
+                return  # fired already
+            entry[2] = None
+            self._num_done += 1
+            if self._num_done > len(self._timers) // 2:  # compact, so the heap stays in proportion to the live timers
+                self._timers = [e for e in self._timers if e[2] is not None]
+                heapq.heapify(self._timers)
+                self._num_done = 0
+
+    def _fire(self, job):
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._timers or self._timers[0][0] > time.monotonic():
+                    self._condition.wait(self._timers[0][0] - time.monotonic() if self._timers else None)
+                entry = heapq.heappop(self._timers)
+                job, entry[2] = entry[2], None
+                if job is None:
+                    self._num_done -= 1
+                    continue
+            self._fire(job)
+
+
+class DeadlineWatcher(_TimerThread):
+    """Cancels jobs when their deadline passes.
+
+    Workers also drop jobs past their deadline when they get them from the queue, but a job which is queued behind
+    others or waiting for a long request would only time out once a worker gets to it.
+    """
+
+    def add(self, job):
+        self._push(job.deadline, job)
+
+    def _fire(self, job):
+        job._cancel_if_expired()
+
+
+class RetryTimer(_TimerThread):
+    """Puts failed jobs back into the queue once the backoff before their next attempt has passed.
+
+    Jobs wait for their retry here rather than sleeping in a worker, so they hold neither a worker nor a slot of the
+    limiter in the meantime.
+
+    Args:
+        put (Callable): Puts a job into the queue, called from the timer thread.
+    """
+
+    def __init__(self, put):
+        super().__init__()
+        self._put = put
+
+    def add(self, job):
+        self._push(job.not_before, job)
+
+    def _fire(self, job):
+        self._put(job)
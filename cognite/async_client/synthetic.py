@@ -0,0 +1,170 @@
+import ast
+import operator
+
+import numpy as np
+import pandas as pd
+
+from cognite.async_client.data_classes.datapoints import DatapointsBuffer
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: operator.pow,
+    ast.Mod: operator.mod,
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "round": np.round,
+    "min": np.fmin,  # elementwise, ignoring a missing value if the other is there
+    "max": np.fmax,
+}
+
+
+class Expression:
+    """Arithmetic expression over named time series, evaluated on NumPy arrays.
+
+    Expressions use Python syntax with numbers, variable names, the operators + - * / ** % and the functions in
+    `FUNCTIONS` (e.g. "(a + b) / 2", "max(a, b) * 3.6", "sqrt(x ** 2 + y ** 2)"). They are parsed and checked once, and
+    evaluating them applies the operations to whole arrays of values.
+
+    Args:
+        expression (str): The expression.
+    """
+
+    def __init__(self, expression):
+        self.expression = expression
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError as e:
+            raise ValueError("Invalid expression {!r}: {}".format(expression, e.msg))
+        self.names = []  # variables in order of first use
+        self._evaluate = self._compile(tree.body)
+
+    def __repr__(self):
+        return f"<Expression {self.expression!r}>"
+
+    def evaluate(self, variables):
+        """Values of the expression for arrays of equal length of each variable."""
+        return self._evaluate(variables)
+
+    def _compile(self, node):
+        if type(node).__name__ in ("Constant", "Num"):  # numbers are ast.Num before python 3.8
+            value = node.value if hasattr(node, "value") else node.n
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = float(value)
+                return lambda variables: value
+        if isinstance(node, ast.Name):
+            if node.id not in self.names:
+                self.names.append(node.id)
+            return lambda variables: variables[node.id]
+        if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+            op, left, right = OPERATORS[type(node.op)], self._compile(node.left), self._compile(node.right)
+            return lambda variables: op(left(variables), right(variables))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in OPERATORS:
+            op, operand = OPERATORS[type(node.op)], self._compile(node.operand)
+            return lambda variables: op(operand(variables))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            if node.keywords:
+                raise ValueError("Functions in expressions take no keyword arguments: {!r}".format(self.expression))
+            function, args = FUNCTIONS[node.func.id], [self._compile(arg) for arg in node.args]
+            return lambda variables: function(*[arg(variables) for arg in args])
+        raise ValueError("Unsupported {} in expression {!r}".format(type(node).__name__, self.expression))
+
+
+class SyntheticDatapointsStream:
+    """Iterator over chunks of a series computed from other time series, evaluated as their datapoints are retrieved.
+
+    The inputs are aggregates on the same granularity grid, retrieved as a DatapointsStream. Whenever all inputs are
+    complete up to a later time, the expression is evaluated on the grid rows before it and those rows are yielded, so
+    only the rows some input is still behind on are held in memory. Rows where the expression has no value, e.g. since
+    an input has no datapoints in that interval, are left out.
+
+    Args:
+        expression (Expression): The expression, whose variables are the inputs.
+        inputs (DatapointsStream): Stream of the inputs, in the order of `expression.names`.
+        start (int): Timestamp of the first grid row, the aligned start of the inputs.
+        end (int): Timestamp after the last grid row.
+        granularity (int): Milliseconds between grid rows.
+    """
+
+    def __init__(self, expression, inputs, start, end, granularity):
+        self.expression = expression
+        self.inputs = inputs
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+
+    def __repr__(self):
+        return f"<SyntheticDatapointsStream expression={self.expression.expression!r}>"
+
+    @property
+    def job(self):
+        return self.inputs.job
+
+    def close(self):
+        self.inputs.close()
+
+    def __iter__(self):
+        names = self.expression.names
+        pending = [[] for _ in names]  # chunks of each input with rows which are not evaluated yet
+        complete = [self.start] * len(names)  # time up to which each input is retrieved
+        evaluated = self.start
+        for series_index, end, chunk in self.inputs.progress():
+            if len(chunk):
+                pending[series_index].append(chunk)
+            complete[series_index] = end
+            until = self.start + (min(complete) - self.start) // self.granularity * self.granularity
+            if until > evaluated:
+                result = self._evaluate(pending, evaluated, until)
+                evaluated = until
+                if len(result):
+                    yield result
+        if evaluated < self.end:
+            result = self._evaluate(pending, evaluated, self.end)
+            if len(result):
+                yield result
+
+    def _evaluate(self, pending, start, end):
+        """Evaluates the grid rows start:end, dropping the pending chunks (or parts) before end."""
+        rows = -(-(end - start) // self.granularity)
+        variables = {}
+        for name, chunks in zip(self.expression.names, pending):
+            column = np.full(rows, np.nan)
+            for chunk in chunks:
+                part = chunk.time_slice(start, end)
+                column[(part.timestamp - start) // self.granularity] = part.column(part.fields[0])
+            chunks[:] = [
+                chunk.time_slice(end, self.end) for chunk in chunks if len(chunk) and chunk.timestamp[-1] >= end
+            ]
+            variables[name] = column
+        with np.errstate(all="ignore"):  # e.g. division by zero gives inf or nan like in the rest of NumPy
+            values = np.broadcast_to(np.asarray(self.expression.evaluate(variables), dtype=np.float64), (rows,))
+        keep = np.flatnonzero(~np.isnan(values))
+        buffer = DatapointsBuffer(["value"])
+        buffer.external_id = self.expression.expression
+        buffer.is_string = False
+        buffer._timestamp = start + keep * self.granularity
+        buffer._columns = {"value": values[keep]}
+        buffer._size = len(keep)
+        return buffer
+
+    def to_pandas(self):
+        """Consumes the stream into a DataFrame with one column named after the expression."""
+        chunks = [chunk.to_pandas() for chunk in self]
+        if not chunks:
+            return pd.DataFrame({self.expression.expression: []}, index=pd.DatetimeIndex([], dtype="datetime64[ms]"))
+        return pd.concat(chunks)
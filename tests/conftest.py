@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+from benchmarks.mock_server import MockConfig, MockServer
+from cognite.async_client import CogniteClient
+
+
+@pytest.fixture(scope="module")
+def mock_server(request):
+    """Local mock CDF server, configured by the MockConfig arguments in `MOCK_CONFIG` of the test module if it has
+    them. Each module gets its own, so resources created by one module's tests are not seen by another's."""
+    config = MockConfig(**getattr(request.module, "MOCK_CONFIG", {}))
+    with MockServer(config, separate_process=False) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def mock_client(mock_server):
+    return CogniteClient(base_url=mock_server.base_url, project="mock", api_key="mock")
+
+
+@pytest.fixture
+def queue_stats():
+    """Stats of the job queue of a client once it is done. Runs are recorded just after their results are stored, so
+    stats taken as soon as a result is in can miss the last run."""
+
+    def stats(client):
+        while not client.job_queue.done:
+            time.sleep(0.01)
+        return client.job_queue.stats()
+
+    return stats
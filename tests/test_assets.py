@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from cognite.async_client import AssetTree
+from cognite.client.data_classes import Asset
+
+
+@pytest.fixture(scope="module")
+def root(mock_client):
+    root = mock_client.assets.create_async([Asset(external_id="root", name="root")]).result[0]
+    level = [root.id]
+    for depth in range(3):
+        children = [
+            Asset(name=str(depth), parent_id=p, external_id="{}-{}-{}".format(depth, p, k))
+            for p in level
+            for k in range(4)
+        ]
+        level = [a.id for a in mock_client.assets.create_async(children).result]
+    return root
+
+
+class TestAssetTree:
+    def test_from_levels(self):
+        tree = AssetTree.from_levels(
+            [([1], [-1], {"name": ["r"]}), ([3, 2], [1, 1], {"name": ["c3", "c2"]}), ([5, 4, 6], [3, 2, 2], {})]
+        )
+        assert [1, 3, 2, 5, 4, 6] == tree.ids.tolist()
+        assert [4, 6] == tree.children(2).tolist()
+        assert [3, 2, 5, 4, 6] == tree.descendants(1).tolist()
+        assert [3, 2] == tree.descendants(1, max_depth=1).tolist()
+        assert [3, 1] == tree.ancestors(5).tolist()
+        assert tree.parent_id(1) is None and 2 == tree.parent_id(6)
+        assert 7 not in tree and 4 in tree
+        with pytest.raises(KeyError):
+            tree.children(7)
+
+    def test_to_pandas(self):
+        tree = AssetTree.from_levels([([1], [-1], {"name": ["r"]}), ([2], [1], {"name": ["c"]})])
+        df = tree.to_pandas()
+        assert [1, 2] == df.index.tolist()
+        assert df.parent_id.isna().tolist() == [True, False]
+        assert ["r", "c"] == df.name.tolist()
+
+
+class TestRetrieveSubtree:
+    def test_subtree(self, mock_client, root):
+        tree = mock_client.assets.retrieve_subtree_async(id=root.id).result
+        assert 1 + 4 + 16 + 64 == len(tree) == tree.subtree_size(root.id)
+        assert 3 == tree.max_depth
+        leaf = tree.descendants(root.id)[-1]
+        assert [root.id] == tree.ancestors(leaf)[-1:].tolist()
+        df = tree.to_pandas()
+        assert (df.depth.values[1:] == df.name.values[1:].astype(int) + 1).all()
+
+    def test_depth(self, mock_client, root):
+        tree = mock_client.assets.retrieve_subtree_async(external_id="root", depth=1).result
+        assert 5 == len(tree)
@@ -0,0 +1,36 @@
+import pytest
+
+from benchmarks.mock_server import MockConfig, MockServer
+from benchmarks.run import SCENARIOS, make_client, parse_args, run_scenario
+
+
+@pytest.fixture(scope="module")
+def server():
+    with MockServer(MockConfig(spacing=60000, dps_limit=1000, dps_limit_agg=100), separate_process=False) as server:
+        yield server
+
+
+@pytest.fixture(scope="module")
+def args():
+    return parse_args(
+        ["--series", "3", "--days", "2", "--items", "50", "--dps-limit", "1000", "--dps-limit-agg", "100"]
+    )
+
+
+class TestMockServer:
+    def test_retrieve_async(self, server, args):
+        client = make_client(server.base_url, args)
+        j = client.datapoints.retrieve_async(id=[1, 2], start=0, end=2 * 86400000, include_outside_points=True)
+        assert client.datapoints.retrieve(id=[1, 2], start=0, end=2 * 86400000, include_outside_points=True) == j.result
+        assert 2 * 1440 + 1 == len(j.result[0])
+
+    def test_aggregates(self, server, args):
+        client = make_client(server.base_url, args)
+        dps = client.datapoints.retrieve_async(id=1, start=0, end=86400000, aggregates="count", granularity="1h").result
+        assert [60] * 24 == dps[0].count
+
+    @pytest.mark.parametrize("name", list(SCENARIOS))
+    def test_scenarios(self, server, args, name):
+        result = run_scenario(name, make_client(server.base_url, args), args, measure_memory=False)
+        assert 0 < result["requests"]
+        assert result["p50_ms"] <= result["p99_ms"]
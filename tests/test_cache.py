@@ -0,0 +1,70 @@
+from cognite.async_client import DatapointsCache, DatapointsCountCache
+from cognite.async_client.data_classes import DatapointsBuffer
+from cognite.client.data_classes import TimeSeries
+
+
+def buffer(timestamps):
+    datapoints = [{"timestamp": t, "value": t / 1000} for t in timestamps]
+    return DatapointsBuffer.load({"id": 1, "externalId": "abc", "isString": False, "datapoints": datapoints})
+
+
+KEY = DatapointsCache.key({"id": 1})
+
+
+class TestDatapointsCache:
+    def test_lookup_gaps(self, tmp_path):
+        cache = DatapointsCache(str(tmp_path))
+        cache.store(KEY, 100, 200, buffer(range(0, 300, 10)))
+        parts = cache.lookup(KEY, 50, 250, ["value"])
+        assert [(50, 100), (100, 200), (200, 250)] == [(start, end) for start, end, _ in parts]
+        assert parts[0][2] is None and parts[2][2] is None
+        assert list(range(100, 200, 10)) == parts[1][2].timestamp.tolist()
+        assert "abc" == parts[1][2].external_id
+
+    def test_merge_and_reopen(self, tmp_path):
+        cache = DatapointsCache(str(tmp_path))
+        cache.store(KEY, 0, 100, buffer(range(0, 100, 10)))
+        cache.store(KEY, 50, 150, buffer(range(50, 150, 10)))
+        cache = DatapointsCache(str(tmp_path))
+        [(start, end, cached)] = cache.lookup(KEY, 0, 150, ["value"])
+        assert (0, 150) == (start, end)
+        assert list(range(0, 150, 10)) == cached.timestamp.tolist()
+        assert [t / 1000 for t in range(0, 150, 10)] == cached.column("value").tolist()
+
+    def test_lru_eviction(self, tmp_path):
+        cache = DatapointsCache(str(tmp_path), max_bytes=5000)
+        cache.MERGE_BYTES = 0
+        for i in range(3):
+            cache.store(KEY, i * 1000, i * 1000 + 100, buffer(range(i * 1000, i * 1000 + 100)))
+        cache.lookup(KEY, 0, 100, ["value"])  # first segment is now more recently used than the second
+        cache.store(KEY, 3000, 3100, buffer(range(3000, 3100)))
+        covered = [(start, end) for start, end, cached in cache.lookup(KEY, 0, 4000, ["value"]) if cached]
+        assert [(0, 100), (2000, 2100), (3000, 3100)] == covered
+        assert cache.nbytes <= 5000
+
+    def test_aggregates_keyed_by_phase(self, tmp_path, mock_client):
+        query = dict(id=1, end=24 * 3600000, aggregates=["average"], granularity="2h")
+        expected = mock_client.datapoints.retrieve_async(start=3600000, **query).result[0]
+        mock_client.datapoints_cache = DatapointsCache(str(tmp_path))
+        try:
+            mock_client.datapoints.retrieve_async(start=0, **query).result
+            cached = mock_client.datapoints.retrieve_async(start=3600000, **query).result[0]
+        finally:
+            mock_client.datapoints_cache = None
+        assert expected.timestamp == cached.timestamp and expected.average == cached.average
+        assert 3600000 == cached.timestamp[0]
+
+
+class TestDatapointsCountCache:
+    def test_keeps_longest_range(self, tmp_path):
+        path = str(tmp_path / "counts.json")
+        cache = DatapointsCountCache(path)
+        key = cache.key(TimeSeries(id=1))
+        cache.store({key: (0, 1000, 10)})
+        cache.store({key: (500, 1000, 5)})
+        assert (0, 1000, 10) == cache.lookup(key)
+        cache.store({key: (0, 2000, 20)})
+        assert (0, 2000, 20) == DatapointsCountCache(path).lookup(key)
+        assert 0 == DatapointsCountCache(path).cutoff() % 3600000
+        cache.clear()
+        assert cache.lookup(key) is None and DatapointsCountCache(path).lookup(key) is None
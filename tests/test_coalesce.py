@@ -0,0 +1,31 @@
+import pytest
+
+from cognite.async_client import CogniteClient, DatapointsCoalescer
+
+MOCK_CONFIG = {"latency": 0.1, "spacing": 60000, "dps_limit": 1000}
+
+
+class TestDatapointsCoalescer:
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_coalescing(self, mock_server, queue_stats, engine):
+        coalescer = DatapointsCoalescer()
+        client = CogniteClient(
+            base_url=mock_server.base_url, project="mock", api_key="mock", engine=engine, datapoints_coalescer=coalescer
+        )
+        client.datapoints._DPS_LIMIT = 1000
+        ranges = [(0, 2 * 86400000), (86400000, 3 * 86400000), (0, 2 * 86400000), (43200000, 86400000)]
+        jobs = [client.datapoints.retrieve_async(id=1, start=start, end=end) for start, end in ranges]
+        results = [job.result for job in jobs]
+        requests = queue_stats(client)["requests"]
+        assert 3 == coalescer.shared and 0 == coalescer.stats["in_flight"]
+        client.datapoints_coalescer = None
+        for (start, end), result in zip(ranges, results):
+            assert client.datapoints.retrieve_async(id=1, start=start, end=end).result == result
+        assert requests < queue_stats(client)["requests"] - requests
+
+        client.datapoints_coalescer = coalescer
+        leader, follower = [client.datapoints.retrieve_async(id=1, start=0, end=86400000) for _ in range(2)]
+        leader.cancel()
+        expected = results[0][0]  # retrieved separately once the leader was cancelled
+        assert expected.timestamp[:1440] == follower.result[0].timestamp
+        assert 1 == coalescer.fallbacks
@@ -1,15 +1,34 @@
+import asyncio
+import gc
+import json
 import os
 import sys
+import time
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 import pytest
 
-from cognite.async_client import CogniteClient
+from cognite.async_client import CogniteClient, DatapointsCountCache, DatapointsDecoder, decode
+from cognite.async_client.data_classes import DatapointsBuffer, DatapointsGrid
+from cognite.async_client.decode import _attach, _decode_shared, shared_memory
+from cognite.async_client.exceptions import CogniteJobError, JobCancelledError
+from cognite.async_client.jobs import CountDatapointsListJob, DatapointsBatchJob, DatapointsJob, DatapointsListJob
+from cognite.async_client.jobs.datapoints import StreamBuffer
+from cognite.client.data_classes import Datapoints, TimeSeries
 
 client = CogniteClient(server="greenfield", project="sander")
 
+MOCK_CONFIG = {"spacing": 60000, "dps_limit": 1000, "dps_limit_agg": 100}
+
+
+@pytest.fixture(scope="module")
+def mock_client(mock_client):
+    mock_client.datapoints._DPS_LIMIT = 1000
+    mock_client.datapoints._DPS_LIMIT_AGG = 100
+    return mock_client
+
 
 class TestDatapointsJob:
     def test_retrieve_async_aggregates(self):
@@ -47,5 +66,288 @@ class TestDatapointsJob:
         )
         pd.testing.assert_frame_equal(dpl_old, j.result)
 
+    def test_retrieve_async_plan_splits(self):
+        dpl_old = client.datapoints.retrieve(
+            external_id="ts_1min", start=0, end=datetime(2018, 3, 1), include_outside_points=True
+        )
+        j = client.datapoints.retrieve_async(
+            external_id="ts_1min", start=0, end=datetime(2018, 3, 1), include_outside_points=True, plan_splits=True
+        )
+        assert dpl_old == j.result[0]
+
+    def test_retrieve_stream(self):
+        dpl_old = client.datapoints.retrieve(external_id="ts_1min", start=0, end=datetime(2018, 3, 1))
+        chunks = list(
+            client.datapoints.retrieve_stream(
+                external_id="ts_1min", start=0, end=datetime(2018, 3, 1), max_buffered_chunks=2
+            )
+        )
+        assert dpl_old.timestamp == np.concatenate([chunk.timestamp for chunk in chunks]).tolist()
+
+    def test_retrieve_async_many_series(self):
+        external_ids = [ts.external_id for ts in client.time_series.list(limit=150) if ts.external_id]
+        dpl_old = client.datapoints.retrieve(external_id=external_ids, start=0, end=datetime(2018, 3, 1))
+        j = client.datapoints.retrieve_async(external_id=external_ids, start=0, end=datetime(2018, 3, 1))
+        assert dpl_old == j.result
+
     def count(self):
         assert isinstance(client.datapoints.count(client.time_series.list()[0]).result, int)
+
+
+def dps_object(timestamps, aggregates=None):
+    if aggregates:
+        datapoints = [
+            {"timestamp": t, **{a: t / 1000 for a in aggregates if a != "count"}, "count": 1} for t in timestamps
+        ]
+    else:
+        datapoints = [{"timestamp": t, "value": t / 1000} for t in timestamps]
+    return {"id": 1, "externalId": "abc", "isString": False, "isStep": False, "datapoints": datapoints}
+
+
+class TestDatapointsBuffer:
+    def test_pages_to_datapoints(self):
+        buffer = DatapointsBuffer(["average", "count"])
+        for page in [range(0, 5000, 1000), range(5000, 8000, 1000)]:
+            buffer.extend(DatapointsBuffer.load(dps_object(page, ["average", "count"]), ["average", "count"]))
+        expected = Datapoints._load(dps_object(range(0, 8000, 1000), ["average", "count"]), ["average", "count"])
+        assert expected == buffer.to_datapoints()
+        assert np.int64 == buffer.column("count").dtype
+
+    def test_extend_part(self):
+        buffer = DatapointsBuffer()
+        buffer.extend(DatapointsBuffer.load(dps_object(range(10))), 2, 5)
+        assert [2, 3, 4] == buffer.timestamp.tolist()
+        assert "abc" == buffer.external_id
+
+    def test_to_pandas(self):
+        buffer = DatapointsBuffer.load(dps_object(range(0, 3000, 1000)))
+        pd.testing.assert_frame_equal(buffer.to_datapoints().to_pandas(), buffer.to_pandas())
+
+
+class TestStreamBuffer:
+    def test_held_back_chunks_count_as_buffered(self):
+        buffer = StreamBuffer(max_buffered_chunks=3)
+        buffer._register(0, 0)
+        buffer._register(1, 0)
+        buffer._put(0, 10, 20, "ahead")
+        buffer._put(0, 20, 30, "ahead")
+        assert not buffer.full  # nothing is ready, so the range the consumer waits for must still arrive
+        buffer._put(1, 0, 10, "ready")
+        assert buffer.full and 1 == len(buffer._ready)
+        buffer.close()
+        assert not buffer.full and 0 == buffer._num_pending
+
+
+class TestRetrieveStream:
+    def test_stream_checkpoint(self, mock_client, tmp_path):
+        checkpoint = str(tmp_path / "checkpoint.json")
+        query = dict(id=[1, 2], start=0, end=86400000, max_buffered_chunks=2, checkpoint=checkpoint)
+        consumed = []
+        for chunk in mock_client.datapoints.retrieve_stream(**query):
+            consumed.append(chunk)
+            if len(consumed) == 3:
+                break  # the third chunk is not counted as consumed, and is yielded again
+        rest = list(mock_client.datapoints.retrieve_stream(**query))
+        timestamps = {1: [], 2: []}
+        for chunk in consumed[:2] + rest:
+            timestamps[chunk.id].extend(chunk.timestamp.tolist())
+        assert list(range(0, 86400000, 60000)) == timestamps[1] == timestamps[2]
+        assert [] == list(mock_client.datapoints.retrieve_stream(**query))
+
+    def test_stream_break_cancels(self, mock_client):
+        stream = mock_client.datapoints.retrieve_stream(id=[1, 2, 3], start=0, end=2 * 86400000, max_buffered_chunks=1)
+        next(iter(stream))
+        stream.close()
+        with pytest.raises(CogniteJobError) as exinfo:
+            stream.job.result
+        assert isinstance(exinfo.value[0], JobCancelledError)
+
+    def test_dropped_stream_cancels(self, mock_client):
+        stream = mock_client.datapoints.retrieve_stream(id=[1, 2, 3], start=0, end=2 * 86400000, max_buffered_chunks=1)
+        job = stream.job
+        del stream
+        gc.collect()
+        with pytest.raises(CogniteJobError) as exinfo:
+            job.result
+        assert isinstance(exinfo.value[0], JobCancelledError)
+
+
+class TestDatapointsDecoder:
+    def test_shared_memory_round_trip(self):
+        string_series = {**dps_object(range(3)), "isString": True}
+        for dp in string_series["datapoints"]:
+            dp["value"] = str(dp["value"])
+        items = [dps_object(range(0, 5000, 1000), ["average", "count"]), string_series, dps_object([])]
+        fields = [["average", "count"], ["value"], ["value"]]
+        content = json.dumps({"items": items}).encode()
+        decoded = _attach(_decode_shared(content, fields))
+        for item, item_fields, buffer in zip(items, fields, decoded):
+            assert DatapointsBuffer.load(item, item_fields).to_datapoints() == buffer.to_datapoints()
+        assert np.int64 == decoded[0].column("count").dtype
+        assert ["0.0", "0.001", "0.002"] == decoded[1].column("value").tolist()
+        base = decoded[0].column("average")
+        while not isinstance(base, decode._SharedBlock):  # a view on the block rather than a copy
+            base = base.base
+
+    @pytest.mark.skipif(sys.version_info < (3, 8), reason="no shared memory before python 3.8")
+    def test_cancelled_decode_frees_shared_memory(self, monkeypatch):
+        names = []
+        attach = decode._attach
+        monkeypatch.setattr(decode, "_attach", lambda decoded: names.append(decoded[0]) or attach(decoded))
+        decoder = DatapointsDecoder(processes=1, min_bytes=0)
+        content = json.dumps({"items": [dps_object(range(0, 5000, 1000))]}).encode()
+
+        async def cancel_decode():
+            task = asyncio.ensure_future(decoder.decode_async(content, [["value"]]))
+            await asyncio.sleep(0)
+            task.cancel()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(cancel_decode())
+        loop.close()
+        decoder.shutdown()  # waits for the decoding, whose block is then attached and freed without being awaited
+        assert 1 == len(names)
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=names[0])
+
+    def test_retrieve_with_decoder(self, mock_client):
+        query = dict(id=[1, 2, 3], start=0, end=2 * 86400000)
+        expected = mock_client.datapoints.retrieve_async(**query).result
+        mock_client.datapoints_decoder = DatapointsDecoder(processes=2, min_bytes=0)
+        try:
+            assert expected == mock_client.datapoints.retrieve_async(**query).result
+            agg = dict(query, aggregates=["average", "count"], granularity="1h")
+            assert mock_client.datapoints.retrieve(**agg) == mock_client.datapoints.retrieve_async(**agg).result
+        finally:
+            mock_client.datapoints_decoder.shutdown()
+            mock_client.datapoints_decoder = None
+
+
+class TestDatapointsBatching:
+    class ApiClient:
+        _DPS_LIMIT = 100000
+        _DPS_LIMIT_AGG = 10000
+
+    def test_sparse_series_share_requests(self):
+        items = [{"id": i, "start": 0, "end": 1000} for i in range(250)]
+        jobs = DatapointsListJob(items, self.ApiClient())._initial_split()
+        assert [100, 100, 50] == [len(j.jobs) for j in jobs]
+        assert [1000, 2000] == sorted({limit for j in jobs for limit in j.limits})
+
+    def test_aggregates_packed_by_expected_count(self):
+        query = {"start": 0, "aggregates": "average", "granularity": "1h"}
+        items = [{**query, "id": i, "end": 3000 * 3600000} for i in range(5)]
+        items.append({**query, "id": 5, "end": 9000 * 3600000})
+        jobs = DatapointsListJob(items, self.ApiClient())._initial_split()
+        assert isinstance(jobs[0], DatapointsJob)  # more than half a request of datapoints
+        assert [[3000] * 3, [3000] * 2] == [j.limits for j in jobs[1:] if isinstance(j, DatapointsBatchJob)]
+
+
+class TestDatapointsSplit:
+    ApiClient = TestDatapointsBatching.ApiClient
+
+    def test_split_by_observed_density(self):
+        job = DatapointsJob({"id": 1, "start": 0, "end": 1000000}, self.ApiClient())
+        assert not job.splittable()  # the data could start anywhere
+        job._process_page(DatapointsBuffer.load(dps_object(range(500000, 600000, 10))), limit=10000)
+        assert 599991 == job.query["start"]
+        assert 0.1 == pytest.approx(job.density, rel=1e-3)
+        assert job.splittable()
+        parts = job.split(10)  # 40000 expected datapoints, in requests of 100000
+        assert [job] == parts
+        job.query["end"] = 10000000
+        parts = job.split(10)
+        assert 10 == len(parts)
+        assert (599991, 10000000) == (parts[0].query["start"], parts[-1].query["end"])
+        assert all(job.density == part.density for part in parts)
+
+    def test_split_without_observations(self):
+        job = DatapointsJob({"id": 1, "start": 1, "end": 300001}, self.ApiClient())
+        assert 3 == len(job.split(10))  # one datapoint per millisecond
+        job = DatapointsJob(
+            {"id": 1, "start": 0, "end": 10 * 3600000, "aggregates": "average", "granularity": "1h"}, self.ApiClient()
+        )
+        job.api_client._DPS_LIMIT_AGG = 2
+        parts = job.split(6)
+        assert [0, 2, 4, 6, 8] == [part.query["start"] // 3600000 for part in parts]
+
+
+class TestCountPyramid:
+    def test_coarse_interior_fine_edges(self):
+        queries = CountDatapointsListJob.pyramid(1500, 3 * 86400000 + 3600000 + 61001)
+        assert [None, "58s", "59m", "23h", "2d", "1h", "1m", "1s", None] == [q.get("granularity") for q in queries]
+        assert all(a["end"] == b["start"] for a, b in zip(queries, queries[1:]))
+        assert (1500, 3 * 86400000 + 3600000 + 61001) == (queries[0]["start"], queries[-1]["end"])
+        assert [{"start": 0, "end": 999, "limit": 1000}] == CountDatapointsListJob.pyramid(0, 999)
+
+    def test_long_ranges_in_capped_buckets(self):
+        queries = CountDatapointsListJob.pyramid(0, 1000 * 86400000)
+        assert [("120d", 8), ("40d", 1)] == [(q["granularity"], q["limit"]) for q in queries]
+        assert [(0, 960 * 86400000), (960 * 86400000, 1000 * 86400000)] == [(q["start"], q["end"]) for q in queries]
+
+    def test_batches_and_string_series(self):
+        time_series = [TimeSeries(id=i, is_string=i == 0) for i in range(30)]
+        job = CountDatapointsListJob(time_series, 1500, 86400000 + 1, TestDatapointsBatching.ApiClient())
+        subjobs = job.initial_split()
+        assert [1, 100, 45] == [len(getattr(j, "items", [j])) for j in subjobs]  # 29 series of 5 queries
+        assert [[(0, False)]] == job.child_pieces[:1]
+
+    def test_count(self, mock_client):
+        time_series = [TimeSeries(id=i, is_string=False) for i in range(1, 4)] + [TimeSeries(id=4, is_string=True)]
+        counts = mock_client.datapoints.count(time_series, start=1500, end=2 * 86400000 + 3600000 + 61001).result
+        assert [2 * 1440 + 60 + 1] * 4 == counts  # points at whole minutes, from 60000 up to and including the end
+        assert 2 * 1440 + 61 == mock_client.datapoints.count(time_series[0], start=0, end=counts[0] * 60000).result
+
+    def test_count_cache(self, mock_client, queue_stats):
+        cache = DatapointsCountCache()
+        mock_client.datapoints_count_cache = cache
+        time_series = [TimeSeries(id=1, is_string=False), TimeSeries(id=2, is_string=True)]
+        end = int(time.time() * 1000)
+        start = end - 2 * 86400000
+        try:
+            counts = mock_client.datapoints.count(time_series, start=start, end=end).result
+            assert (start, cache.cutoff()) == cache.lookup(cache.key(time_series[1]))[:2]
+            requests = queue_stats(mock_client)["requests"]
+            assert counts == mock_client.datapoints.count(time_series, start=start, end=end).result
+            assert 2 == queue_stats(mock_client)["requests"] - requests  # only the tails since the cutoff
+            assert [c + 1440 for c in counts] == mock_client.datapoints.count(
+                time_series, start=start - 86400000, end=end
+            ).result
+            assert (start - 86400000, cache.cutoff()) == cache.lookup(cache.key(time_series[0]))[:2]
+        finally:
+            mock_client.datapoints_count_cache = None
+
+
+class TestDatapointsGrid:
+    def test_write_and_to_pandas(self):
+        grid = DatapointsGrid(0, 5000, 1000, [["average", "count"], ["average", "count"]])
+        buffers = [
+            DatapointsBuffer.load(dps_object(ts, ["average", "count"]), ["average", "count"])
+            for ts in [range(0, 3000, 1000), range(1000, 4000, 2000)]
+        ]
+        for i, buffer in enumerate(buffers):
+            assert grid.write(buffer, i)
+        expected = pd.concat([b.to_pandas() for b in buffers], axis="columns").astype(float)
+        pd.testing.assert_frame_equal(expected, grid.to_pandas(), check_freq=False)
+        assert 4 == len(grid.to_pandas())  # the row at 4000 has no data
+
+    def test_off_grid(self):
+        grid = DatapointsGrid(0, 5000, 1000, [["average"]])
+        assert not grid.write(DatapointsBuffer.load(dps_object([500], ["average"]), ["average"]), 0)
+        assert not grid.write(DatapointsBuffer.load(dps_object([6000], ["average"]), ["average"]), 0)
+
+    def test_dataframe_grid(self, mock_client):
+        query = dict(id=[1, 2, 3], start=0, end=86400000 + 1800000, aggregates=["average", "count"], granularity="1h")
+        df = mock_client.datapoints.retrieve_dataframe_async(**query).result
+        buffers = mock_client.datapoints.retrieve_async(**query).result
+        expected = pd.concat([b.to_pandas() for b in buffers], axis="columns")
+        pd.testing.assert_frame_equal(expected.astype(float), df, check_freq=False)
+
+    def test_dataframe_grid_too_large(self, mock_client, monkeypatch):
+        monkeypatch.setattr(DatapointsListJob, "MAX_GRID_BYTES", 8 * 24 * 6 - 1)
+        query = dict(id=[1, 2, 3], start=0, end=86400000, aggregates=["average", "count"], granularity="1h")
+        j = mock_client.datapoints.retrieve_dataframe_async(**query)
+        buffers = mock_client.datapoints.retrieve_async(**query).result
+        expected = pd.concat([b.to_pandas() for b in buffers], axis="columns")
+        pd.testing.assert_frame_equal(expected, j.result, check_freq=False)
+        assert j.grid is None
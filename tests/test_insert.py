@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cognite.async_client import CogniteJobError, DatapointsInsertError
+from cognite.async_client.jobs import InsertDatapointsJob
+from cognite.client.data_classes import Datapoints, TimeSeries
+
+MOCK_CONFIG = {"dps_limit": 1000}
+
+
+@pytest.fixture(scope="module")
+def client(mock_client):
+    client = mock_client
+    client.datapoints._DPS_LIMIT = 1000
+    client.datapoints._POST_DPS_OBJECTS_LIMIT = 10
+    return client
+
+
+class TestInsertAsync:
+    def test_insert(self, mock_server, client):
+        client.datapoints.insert_async([(i * 1000, i) for i in range(2500)], id=1).result
+        assert 2500 == mock_server.cdf.inserted[1]
+
+    def test_insert_datapoints_object(self, mock_server, client):
+        dps = Datapoints(id=2, timestamp=[1000, 2000], value=[1.0, 2.0])
+        client.datapoints.insert_multiple_async([{"id": 2, "datapoints": dps}]).result
+        assert 2 == mock_server.cdf.inserted[2]
+
+    def test_packs_small_series(self, mock_server, client):
+        items = [({"id": i}, np.array([1000, 2000]), [1, 2]) for i in range(100, 125)] + [
+            ({"id": 125}, np.arange(2500), np.zeros(2500))
+        ]
+        batches = InsertDatapointsJob(items, client.datapoints).initial_split()
+        assert [10, 10, 6, 1, 1] == [len(batch.chunks) for batch in batches]
+        client.submit_job(InsertDatapointsJob(items, client.datapoints)).result
+        assert all(2 == mock_server.cdf.inserted[i] for i in range(100, 125))
+        assert 2500 == mock_server.cdf.inserted[125]
+
+    def test_insert_dataframe(self, mock_server, client):
+        df = pd.DataFrame(
+            {200: np.arange(1500.0), 201: np.arange(1500.0)}, index=pd.date_range(0, periods=1500, freq="1s")
+        )
+        client.datapoints.insert_dataframe_async(df).result
+        assert 1500 == mock_server.cdf.inserted[200] == mock_server.cdf.inserted[201]
+
+    def test_failed_ranges(self, client):
+        client.time_series.create_async([TimeSeries(external_id="exists")]).result
+        job = client.datapoints.insert_multiple_async(
+            [
+                {"externalId": "exists", "datapoints": [(1000, 1)]},
+                {"externalId": "missing", "datapoints": [(t, 1) for t in range(1000, 3000)]},
+            ]
+        )
+        with pytest.raises(CogniteJobError) as e:
+            job.result
+        assert all(isinstance(ex, DatapointsInsertError) for ex in e.value)
+        failed = [f for ex in e.value for f in ex.failed]
+        assert {"missing"} == {f["externalId"] for f in failed}
+        assert 2000 == sum(f["count"] for f in failed if f["externalId"] == "missing")
+        assert "missing[" in str(e.value)
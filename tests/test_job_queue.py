@@ -1,14 +1,22 @@
+import asyncio
 import os
 import sys
+import threading
+import time
 
 import numpy as np
 import pytest
 
-from cognite.async_client import CogniteClient
-from cognite.async_client.concurrency import Job
-from cognite.async_client.exceptions import CogniteJobError
+from cognite.async_client import CogniteClient, RetryPolicy
+from cognite.async_client.concurrency import AdaptiveLimiter, Job
+from cognite.async_client.exceptions import CogniteJobError, JobCancelledError, JobTimeoutError
+from cognite.async_client.jobs import MergeJob
+from cognite.async_client.scheduler import FairSchedule
+from cognite.client.exceptions import CogniteAPIError
 
 client = CogniteClient(server="greenfield", project="sander")
+async_client = CogniteClient(server="greenfield", project="sander", engine="asyncio")
+adaptive_client = CogniteClient(server="greenfield", project="sander", adaptive_concurrency=True, max_workers_async=2)
 
 
 class ReturnIntJob(Job):
@@ -22,18 +30,58 @@ class ReturnIntJob(Job):
         return self.n
 
 
+class FlakyJob(Job):
+    retry_policy = RetryPolicy(backoff=0)
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def run(self):
+        if self.failures:
+            raise self.failures.pop(0)
+        return "done"
+
+
+class SleepJob(Job):
+    def __init__(self, seconds):
+        super().__init__()
+        self.seconds = seconds
+
+    def run(self):
+        time.sleep(self.seconds)
+        return [self.seconds]
+
+
 class SplittableJob(Job):
-    def __init__(self, ns):
+    def __init__(self, ns, job_class=ReturnIntJob):
         super().__init__()
         self.ns = ns
+        self.job_class = job_class
 
     def initial_split(self):
-        return [ReturnIntJob(n) for n in self.ns]
+        return [self.job_class(n) for n in self.ns]
 
     def merge(self):
         return self.children
 
 
+class ReturnListJob(ReturnIntJob):
+    def run(self):
+        return [super().run()]
+
+
+class FoldingJob(SplittableJob):
+    incremental_merge = True
+    merge_fanout = 4
+
+    def __init__(self, ns):
+        super().__init__(ns, ReturnListJob)
+
+    def fold(self, merged, result):
+        return (merged or []) + result
+
+
 class TestJobQueue:
     def test_single(self):
         r = client.submit_job(ReturnIntJob())
@@ -77,3 +125,285 @@ class TestJobQueue:
         assert 2 == len(exinfo.value)
         assert client.job_queue.done
         assert client.job_queue.healthy
+
+
+class TestAsyncJobQueue:
+    def test_many_splits(self):
+        jobs = [SplittableJob([n, 42]) for n in range(100)]
+        rl = async_client.submit_jobs(jobs)
+        for i, r in enumerate(rl):
+            assert [i, 42] == r.result
+        assert async_client.job_queue.healthy
+
+    def test_multi_failing(self):
+        r = async_client.submit_job(SplittableJob([1, 2, 123456789, 123456789]))
+        with pytest.raises(CogniteJobError) as exinfo:
+            r.result
+        assert 2 == len(exinfo.value)
+        assert async_client.job_queue.healthy
+
+    def test_await(self):
+        async def gather():
+            return await asyncio.gather(*async_client.submit_jobs([ReturnIntJob(n) for n in range(10)]))
+
+        assert list(range(10)) == asyncio.run(gather())
+
+    def test_await_failing(self):
+        async def wait_for_failing():
+            return await client.submit_job(ReturnIntJob(123456789))
+
+        with pytest.raises(CogniteJobError):
+            asyncio.run(wait_for_failing())
+
+    def test_sync_jobs_use_all_workers(self):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=40, engine="asyncio")
+        t0 = time.monotonic()
+        jobs = queue_client.submit_jobs([SleepJob(0.3) for _ in range(40)])
+        assert [[0.3]] * 40 == [job.result for job in jobs]
+        assert time.monotonic() - t0 < 0.5  # not capped by the size of asyncio's default executor
+
+    def test_callbacks_off_the_loop(self):
+        threads = []
+        job = ReturnIntJob()
+        job.add_callback(lambda result: threads.append(threading.current_thread()))
+        assert 1 == async_client.submit_job(job).result
+        assert async_client.job_queue._thread is not threads[0]
+
+
+class TestAdaptiveLimiter:
+    def test_increase_while_latency_stable(self):
+        limiter = AdaptiveLimiter(max_limit=10, initial_limit=2)
+        for _ in range(5):
+            limiter.record(0.1)
+        assert 4 == round(limiter.limit)
+        for _ in range(10):
+            limiter.record(1.0)  # latency rising, hold
+        assert 4 == round(limiter.limit)
+
+    def test_decrease_once_per_window(self):
+        limiter = AdaptiveLimiter(max_limit=10, initial_limit=8)
+        for _ in range(8):
+            limiter.record(0.1, throttled=True)
+        assert 4 == limiter.stats["limit"]
+        assert 8 == limiter.stats["throttled"]
+
+    def test_acquire(self):
+        limiter = AdaptiveLimiter(max_limit=10, initial_limit=1)
+        assert limiter.try_acquire()
+        assert not limiter.try_acquire()
+        limiter.release()
+        assert limiter.try_acquire()
+
+    def test_queue_with_limiter(self):
+        jobs = [SplittableJob([n, 42]) for n in range(100)]
+        rl = adaptive_client.submit_jobs(jobs)
+        for i, r in enumerate(rl):
+            assert [i, 42] == r.result
+        assert 2 == adaptive_client.job_queue.limiter.stats["limit"]
+        assert adaptive_client.job_queue.healthy
+
+
+class TestQueueStats:
+    def test_stats_and_hooks(self):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=4)
+        runs = []
+        queue_client.job_queue.add_hook(lambda job, run: runs.append(run))
+        rl = queue_client.submit_jobs([SplittableJob([n, 123456789]) for n in range(10)])
+        for r in rl:
+            with pytest.raises(CogniteJobError):
+                r.result
+        stats = queue_client.job_queue.stats()
+        assert 20 == stats["runs"] == len(runs)
+        assert 10 == stats["splits"] == stats["errors"]
+        assert 4 == stats["workers"]
+        assert 0 < stats["utilization"] <= 1
+        assert {"ReturnIntJob"} == {run["job"] for run in runs}
+        assert 10 == sum(run["error"] for run in runs)
+
+
+def flow_jobs(n, priority_class="normal", weight=1):
+    top = ReturnIntJob()
+    top.flow, top.priority_class, top.weight = top, priority_class, weight
+    jobs = [ReturnIntJob(i) for i in range(n)]
+    for job in jobs:
+        job.flow, job.priority = top, 1
+    return top, jobs
+
+
+class TestFairSchedule:
+    def test_small_flow_not_behind_big_one(self):
+        schedule = FairSchedule()
+        big, big_jobs = flow_jobs(100)
+        small, small_jobs = flow_jobs(2)
+        for job in big_jobs + small_jobs:
+            schedule.push(job)
+        order = [schedule.pop().flow for _ in range(4)]
+        assert 2 == order.count(small)
+        assert 102 - 4 == len(schedule)
+
+    def test_priority_classes(self):
+        schedule = FairSchedule()
+        batch, batch_jobs = flow_jobs(5, "batch")
+        interactive, interactive_jobs = flow_jobs(2, "interactive")
+        for job in batch_jobs + interactive_jobs:
+            schedule.push(job)
+        assert [interactive] * 2 + [batch] * 5 == [schedule.pop().flow for _ in range(7)]
+
+    def test_weights(self):
+        schedule = FairSchedule()
+        heavy, heavy_jobs = flow_jobs(30, weight=3)
+        light, light_jobs = flow_jobs(30)
+        for job in heavy_jobs + light_jobs:
+            schedule.push(job)
+        order = [schedule.pop().flow for _ in range(20)]
+        assert 15 == order.count(heavy)
+
+    def test_client_priority_class(self):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=2)
+        flows = []
+        queue_client.job_queue.add_hook(lambda job, run: flows.append(job.flow))
+        with queue_client.priority_class("interactive", weight=2):
+            job = queue_client.submit_job(SplittableJob([1, 2]))
+        assert [1, 2] == job.result
+        assert ("interactive", 2) == (job.priority_class, job.weight)
+        assert [job, job] == flows
+        with pytest.raises(ValueError):
+            queue_client.submit_job(ReturnIntJob(), priority_class="urgent")
+
+
+class TestRetries:
+    def test_policy(self):
+        policy = RetryPolicy(max_attempts=3, backoff=1, jitter=0, max_attempts_by_error={KeyError: 2, 503: 1})
+        assert [1, 2, None] == [policy.delay(ConnectionError(), attempt) for attempt in range(1, 4)]
+        assert 3 == policy.attempts(CogniteAPIError("throttled", code=429))
+        assert 1 == policy.attempts(CogniteAPIError("bad request", code=400))
+        assert 1 == policy.attempts(CogniteAPIError("unavailable", code=503))
+        assert 2 == policy.attempts(KeyError())
+        assert 1 == policy.attempts(ValueError())
+        retried = CogniteAPIError("throttled", code=429)
+        retried.retried = True  # by the request layer
+        assert 1 == policy.attempts(retried)
+
+    @pytest.mark.parametrize("queue_client", [client, async_client])
+    def test_retry_until_success(self, queue_client):
+        job = queue_client.submit_job(FlakyJob([ConnectionError(), CogniteAPIError("busy", code=503)]))
+        assert "done" == job.result
+        assert 2 == job.stats.retries
+
+    @pytest.mark.parametrize("queue_client", [client, async_client])
+    def test_not_retryable(self, queue_client):
+        job = queue_client.submit_job(FlakyJob([ValueError("invalid"), ConnectionError()]))
+        with pytest.raises(CogniteJobError):
+            job.result
+        assert 0 == job.stats.retries
+        job = queue_client.submit_job(FlakyJob([ConnectionError()] * 3))
+        with pytest.raises(CogniteJobError):
+            job.result
+        assert 2 == job.stats.retries
+
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_backoff_frees_the_worker(self, engine):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=1, engine=engine)
+        flaky = FlakyJob([ConnectionError()])
+        flaky.retry_policy = RetryPolicy(backoff=0.5, jitter=0)
+        queue_client.submit_job(flaky)
+        time.sleep(0.1)
+        t0 = time.monotonic()
+        assert 1 == queue_client.submit_job(ReturnIntJob()).result
+        assert time.monotonic() - t0 < 0.3  # ran while the flaky job waits for its retry
+        assert "done" == flaky.result
+        assert 1 == flaky.stats.retries
+
+
+class TestCancellation:
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_cancel_drops_queued_subjobs(self, engine):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=2, engine=engine)
+        job = queue_client.submit_job(SplittableJob([0.05] * 20, SleepJob))
+        time.sleep(0.1)
+        assert job.cancel()
+        assert not job.cancel()
+        with pytest.raises(CogniteJobError) as exinfo:
+            job.result
+        assert isinstance(exinfo.value[0], JobCancelledError)
+        time.sleep(0.2)
+        stats = queue_client.job_queue.stats()
+        assert stats["runs"] < 20 and stats["cancelled"] > 0
+        assert queue_client.job_queue.done
+
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_timeout(self, engine):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=1, engine=engine)
+        busy = queue_client.submit_job(SleepJob(0.5))
+        with queue_client.timeout(0.05):
+            job = queue_client.submit_job(SleepJob(0.01))  # queued behind the busy worker
+        t0 = time.monotonic()
+        with pytest.raises(CogniteJobError) as exinfo:
+            job.result
+        assert time.monotonic() - t0 < 0.3
+        assert isinstance(exinfo.value[0], JobTimeoutError)
+        assert [0.5] == busy.result
+        assert [0.01] == queue_client.submit_job(SleepJob(0.01), timeout=1).result
+
+    def test_finished_jobs_leave_the_deadlines(self):
+        queue_client = CogniteClient(server="greenfield", project="sander", max_workers_async=2)
+        jobs = [queue_client.submit_job(ReturnIntJob(i), timeout=60) for i in range(10)]
+        assert list(range(10)) == [job.result for job in jobs]
+        assert 0 == len(queue_client.job_queue.deadlines)
+        assert [] == queue_client.job_queue.deadlines._timers  # compacted, so the jobs are not kept alive
+
+    def test_cancel_awaiting_task(self):
+        job = SplittableJob([0.2], SleepJob)
+
+        async def cancel_waiting():
+            task = asyncio.ensure_future(job._await_result())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        async_client.submit_job(job)
+        asyncio.run(cancel_waiting())
+        with pytest.raises(CogniteJobError):
+            job.result
+
+
+class TestMerge:
+    def test_folds_in_order_as_children_finish(self):
+        job = FoldingJob([0, 1, 2, 3])
+        job.flow = job
+        children = job._initial_split()
+        children[1]._set_result([1])
+        assert 0 == job._folded and [1] == job.children[1]
+        children[0]._set_result([0])
+        assert 2 == job._folded and [None, None] == job.children[:2]  # freed once folded
+        children[3]._set_result([3])
+        assert not job._result.done()
+        children[2]._set_result([2])
+        assert [0, 1, 2, 3] == job.result
+
+    def test_tree(self):
+        job = FoldingJob(list(range(50)))
+        job.flow = job
+        children = job._initial_split()
+        assert 50 == len(children)
+        assert 4 == len(job.children) and all(isinstance(node, MergeJob) for node in job.children)
+        assert all(len(node.children) <= 4 for node in job.children[0].children)
+        for child in reversed(children):
+            child._set_result([child.n])
+        assert list(range(50)) == job.result
+
+    @pytest.mark.parametrize("queue_client", [client, async_client])
+    def test_wide_split(self, queue_client):
+        job = queue_client.submit_job(FoldingJob(list(range(1000))))
+        assert list(range(1000)) == job.result
+        with pytest.raises(CogniteJobError) as exinfo:
+            queue_client.submit_job(FoldingJob([1, 123456789] * 10)).result
+        assert 10 == len(exinfo.value)
+
+    def test_fold_error(self):
+        job = FoldingJob([1, 2])
+        job.fold = lambda merged, result: foo
+        client.submit_job(job)
+        with pytest.raises(CogniteJobError):
+            job.result
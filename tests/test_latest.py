@@ -0,0 +1,39 @@
+import pytest
+
+from cognite.async_client import CogniteClient, LatestDatapointsCache
+from cognite.async_client.exceptions import CogniteJobError
+
+MOCK_CONFIG = {"latency": 0.1, "spacing": 60000}
+
+
+class TestRetrieveLatest:
+    def test_retrieve_latest(self, mock_client):
+        mock_client.datapoints._RETRIEVE_LATEST_LIMIT = 10
+        ids = list(range(1, 26)) + [-1, 3]
+        befores = [60000 * i + 1 for i in ids[:-2]] + [None, 5000]
+        latest = mock_client.datapoints.retrieve_latest_async(id=ids, before=befores, ignore_unknown_ids=True).result
+        assert [60000 * i for i in ids[:-2]] + [0] == [dps.timestamp[0] for dps in latest]
+        assert ids[:-2] + [3] == [dps.id for dps in latest]
+        with pytest.raises(CogniteJobError):
+            mock_client.datapoints.retrieve_latest_async(id=[1, -1]).result
+
+
+class TestLatestDatapointsCache:
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_retrieve_latest_cache(self, mock_server, queue_stats, engine):
+        cache = LatestDatapointsCache(ttl=60)
+        client = CogniteClient(
+            base_url=mock_server.base_url, project="mock", api_key="mock", engine=engine, latest_datapoints_cache=cache
+        )
+        jobs = [client.datapoints.retrieve_latest_async(id=[1, 2, 3], external_id="a") for _ in range(3)]
+        results = [job.result for job in jobs]
+        assert results[0] == results[1] == results[2]
+        assert 1 == queue_stats(client)["requests"]
+        assert {"entries": 4, "hits": 0, "shared": 8} == cache.stats
+        assert results[0] == client.datapoints.retrieve_latest_async(id=[1, 2, 3], external_id="a").result
+        assert 1 == queue_stats(client)["requests"] and 4 == cache.hits
+
+        leader = client.datapoints.retrieve_latest_async(id=[4, 5])
+        follower = client.datapoints.retrieve_latest_async(id=5)
+        leader.cancel()
+        assert [5] == [dps.id for dps in follower.result]  # retrieved separately once the leader was cancelled
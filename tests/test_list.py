@@ -0,0 +1,34 @@
+import pytest
+
+from cognite.client.data_classes import Asset, AssetFilter
+
+
+@pytest.fixture(scope="module")
+def client(mock_client):
+    mock_client.assets._LIST_LIMIT = 7
+    mock_client.assets._RETRIEVE_LIMIT = 5
+    mock_client.assets.create_async(
+        [Asset(external_id="list-{}".format(i), name=str(i % 3), metadata={"i": str(i)}) for i in range(50)]
+    ).result
+    return mock_client
+
+
+class TestListAsync:
+    def test_partitioned(self, client):
+        assets = client.assets.list_async(partitions=4).result
+        assert sorted(range(50)) == sorted(int(a.metadata["i"]) for a in assets)
+
+    def test_filter_and_limit(self, client):
+        assert 17 == len(client.assets.list_async(AssetFilter(name="0")).result)
+        assert 17 == len(client.assets.list_async({"name": "0"}, partitions=3).result)
+        assets = client.assets.list_async(limit=10).result
+        assert 10 == len(assets)
+        with pytest.raises(ValueError):
+            client.assets.list_async(limit=10, partitions=2)
+
+    def test_retrieve_multiple(self, client):
+        external_ids = ["list-{}".format(i) for i in range(0, 50, 3)]
+        assets = client.assets.retrieve_multiple_async(external_ids=external_ids + ["unknown"], ignore_unknown_ids=True)
+        assert external_ids == [a.external_id for a in assets.result]
+        ids = [a.id for a in assets.result]
+        assert ids == [a.id for a in client.assets.retrieve_multiple_async(ids=ids).result]
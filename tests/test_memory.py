@@ -0,0 +1,117 @@
+import time
+
+import numpy as np
+import pytest
+
+from cognite.async_client import CogniteClient, MemoryBudget
+from cognite.async_client.concurrency import Job
+from cognite.async_client.data_classes import DatapointsBuffer
+
+MOCK_CONFIG = {"spacing": 60000, "dps_limit": 1000}
+
+
+@pytest.fixture(scope="module")
+def mock_client(mock_client):
+    mock_client.datapoints._DPS_LIMIT = 1000
+    return mock_client
+
+
+def buffer(timestamps):
+    datapoints = [{"timestamp": t, "value": t / 1000} for t in timestamps]
+    return DatapointsBuffer.load({"id": 1, "externalId": "abc", "isString": False, "datapoints": datapoints})
+
+
+class HoldingJob(Job):
+    """Holds 100 bytes for its top-level job, which are freed when that is done."""
+
+    def run(self):
+        self._hold(100)
+        time.sleep(0.01)
+        return [1]
+
+
+class BatchJob(Job):
+    def __init__(self, api_client, n):
+        super().__init__(api_client=api_client)
+        self.n = n
+
+    def initial_split(self):
+        return [HoldingJob(self.api_client) for _ in range(self.n)]
+
+
+class TestMemoryBudget:
+    def test_admits_jobs_of_flows_holding_data(self):
+        budget = MemoryBudget(1000)
+        holding, waiting = Job(), Job()
+        holding.flow, waiting.flow = holding, waiting
+        budget.add(holding, 800)
+        assert budget.admits(waiting)
+        budget.add(holding, 400)
+        assert budget.exceeded
+        assert budget.admits(holding) and not budget.admits(waiting)
+        budget.release(holding)
+        assert 0 == budget.held
+        assert budget.admits(waiting)
+
+    def test_waiting_jobs_queued_once_admitted(self):
+        budget = MemoryBudget(1000)
+        holding, waiting = Job(), Job()
+        holding.flow, waiting.flow = holding, waiting
+        budget.add(holding, 1200)
+        queued = []
+        assert budget.defer(waiting, queued.append)
+        budget.add(holding, -100)  # still over budget
+        assert [] == queued and 1 == budget.waiting
+        budget.add(holding, -200)
+        assert [waiting] == queued and 0 == budget.waiting and 1 == budget.deferred
+
+    def test_spill(self, tmp_path):
+        budget = MemoryBudget(100, spill=True, spill_dir=str(tmp_path))
+        flow = Job()
+        data = buffer(range(0, 100000, 1000))
+        assert data is budget.spill(flow, data)  # within budget
+        budget.add(flow, data.resident_nbytes)
+        spilled = budget.spill(flow, data)
+        assert isinstance(spilled.timestamp, np.memmap) and 0 == spilled.resident_nbytes
+        assert 0 == budget.held and data.nbytes == budget.spilled_bytes
+        assert data.to_datapoints() == spilled.to_datapoints()
+        spilled.column("value")[0] = -1  # copy on write, like an array in memory
+        assert 0 == data.column("value")[0]
+
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_jobs_set_aside_do_not_block_the_queue(self, mock_server, engine):
+        budget = MemoryBudget(10)
+        queue_client = CogniteClient(
+            base_url=mock_server.base_url,
+            project="mock",
+            api_key="mock",
+            max_workers_async=1,
+            memory_budget=budget,
+            engine=engine,
+        )
+        batch = queue_client.submit_job(BatchJob(queue_client.datapoints, 10), priority_class="batch")
+        time.sleep(0.02)  # the batch job holds data over the budget
+        interactive = queue_client.submit_job(HoldingJob(queue_client.datapoints), priority_class="interactive")
+        assert [1] * 10 == batch._result.result(timeout=5)
+        assert [1] == interactive._result.result(timeout=5)
+        assert 0 < budget.deferred and 0 == budget.waiting and 0 == budget.held
+
+    @pytest.mark.parametrize("engine", ["threads", "asyncio"])
+    def test_retrieve_within_budget(self, mock_server, mock_client, engine, tmp_path):
+        query = dict(id=[1, 2, 3], start=0, end=2 * 86400000)
+        expected = mock_client.datapoints.retrieve_async(**query).result
+        budget = MemoryBudget(10000, spill=True, spill_dir=str(tmp_path))
+        client = CogniteClient(
+            base_url=mock_server.base_url,
+            project="mock",
+            api_key="mock",
+            engine=engine,
+            max_workers_async=2,
+            memory_budget=budget,
+        )
+        client.datapoints._DPS_LIMIT = 1000
+        jobs = [client.datapoints.retrieve_async(**query) for _ in range(3)]
+        for job in jobs:
+            assert expected == job.result
+        assert 0 == budget.held
+        assert 0 < budget.spilled_bytes and 0 < budget.deferred
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cognite.async_client.synthetic import Expression
+
+MOCK_CONFIG = {"spacing": 60000, "dps_limit_agg": 100}
+
+
+@pytest.fixture(scope="module")
+def mock_client(mock_client):
+    mock_client.datapoints._DPS_LIMIT_AGG = 100
+    return mock_client
+
+
+class TestExpression:
+    def test_evaluate(self):
+        expression = Expression("(a + b) / 2 - max(a, 2 * c) ** 2 % 5")
+        a, b, c = np.array([1.0, 4.0]), np.array([3.0, np.nan]), np.array([0.0, 1.0])
+        assert ["a", "b", "c"] == expression.names
+        expected = (a + b) / 2 - np.fmax(a, 2 * c) ** 2 % 5
+        np.testing.assert_array_equal(expected, expression.evaluate({"a": a, "b": b, "c": c}))
+
+    def test_functions(self):
+        x = np.array([0.25, 4.0])
+        np.testing.assert_allclose(np.sqrt(x) + np.log(x), Expression("sqrt(x) + log(x)").evaluate({"x": x}))
+        assert -3.0 == Expression("-abs(-3)").evaluate({})
+
+    @pytest.mark.parametrize(
+        "expression",
+        ["a +", "__import__('os')", "a.real", "a[0]", "open(a)", "round(a, decimals=1)", "'a' + b", "a < b"],
+    )
+    def test_invalid(self, expression):
+        with pytest.raises(ValueError):
+            Expression(expression)
+
+
+class TestSyntheticStream:
+    def test_synthetic_stream(self, mock_client):
+        query = dict(start=1800000, end=2 * 86400000, granularity="10m")
+        stream = mock_client.datapoints.retrieve_synthetic_stream("(a - b) / c", {"a": 1, "b": 2, "c": "ts_3"}, **query)
+        chunks = list(stream)
+        assert 1 < len(chunks)  # evaluated as the inputs come in, in pages of dps_limit_agg
+        df = mock_client.datapoints.retrieve_dataframe_async(id=[1, 2, 3], aggregates="average", **query).result
+        expected = (df["ts_1|average"] - df["ts_2|average"]) / df["ts_3|average"]
+        synthetic = pd.concat([chunk.to_pandas() for chunk in chunks])["(a - b) / c"]
+        pd.testing.assert_series_equal(expected, synthetic, check_names=False, check_freq=False)
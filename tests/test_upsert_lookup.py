@@ -0,0 +1,60 @@
+from unittest import mock
+
+import pytest
+
+from cognite.client.data_classes import Asset
+
+
+@pytest.fixture
+def mock_post_spy(mock_client):
+    with mock.patch.object(mock_client.assets, "_post", wraps=mock_client.assets._post) as spy:
+        yield spy
+
+
+class TestUpsertLookup:
+    def test_lookup(self, mock_client, mock_post_spy):
+        assets = [Asset(name="old", external_id="lookup-{}".format(i)) for i in range(5)]
+        mock_client.assets.create_async(assets[:2]).result
+        mock_post_spy.reset_mock()
+        r = mock_client.assets.upsert([Asset(name="new", external_id=a.external_id) for a in assets], lookup=True)
+        assert 3 == len(r["created"])
+        assert 2 == len(r["updated"])
+        assert {"new"} == {a.name for a in r["updated"]}
+        paths = sorted(call[0][0] for call in mock_post_spy.call_args_list)
+        assert ["/assets", "/assets/byids", "/assets/update"] == paths
+
+    def test_skip_unchanged(self, mock_client, mock_post_spy):
+        assets = [Asset(name=str(i), external_id="unchanged-{}".format(i)) for i in range(4)]
+        mock_client.assets.create_async(assets).result
+        assets[0].name = "changed"
+        mock_post_spy.reset_mock()
+        r = mock_client.assets.upsert(assets, skip_unchanged=True)
+        assert ["changed"] == [a.name for a in r["updated"]]
+        assert 3 == len(r["unchanged"])
+        assert 2 == mock_post_spy.call_count
+
+    def test_skip_unchanged_write_only_fields(self, mock_client):
+        assets = [Asset(name="root", external_id="write-only-root")]
+        assets.append(Asset(name="child", external_id="write-only-child", parent_external_id="write-only-root"))
+        mock_client.assets.create_async(assets).result
+        r = mock_client.assets.upsert(assets, skip_unchanged=True)
+        assert 2 == len(r["unchanged"])
+
+    def test_known_external_ids(self, mock_client, mock_post_spy):
+        known = {}
+        assets = [Asset(name=str(i), external_id="known-{}".format(i)) for i in range(4)]
+        r = mock_client.assets.upsert(assets, known_external_ids=known)
+        assert 4 == len(r["created"])
+        assert {a.external_id for a in assets} == set(known)
+        mock_post_spy.reset_mock()
+        r = mock_client.assets.upsert(assets, skip_unchanged=True, known_external_ids=known)
+        assert 4 == len(r["unchanged"])
+        assert 0 == mock_post_spy.call_count
+        assets[1].name = "changed"
+        r = mock_client.assets.upsert(assets, skip_unchanged=True, known_external_ids=known)
+        assert ["changed"] == [a.name for a in r["updated"]]
+        assert ["/assets/update"] == [call[0][0] for call in mock_post_spy.call_args_list]
+
+    def test_known_but_deleted(self, mock_client):
+        r = mock_client.assets.upsert([Asset(name="x", external_id="deleted-0")], known_external_ids={"deleted-0": ""})
+        assert 1 == len(r["created"])